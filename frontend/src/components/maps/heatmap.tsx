@@ -58,19 +58,21 @@ export default function Heatmap({ className = '', height = 400, showControls = t
     queryKey: ['heatmap', bounds],
     queryFn: async () => {
       try {
-        // Fetch from the actual API endpoint
-        const response = await fetch('http://localhost:8000/api/v1/analytics/heatmap', {
-          headers: {
-            'Authorization': `Bearer ${localStorage.getItem('token')}`,
-            'Content-Type': 'application/json'
-          }
-        })
+        // Fetch from the actual API endpoint (demand zones and project markers are separate layers)
+        const [demandResponse, supplyResponse] = await Promise.all(['demand', 'supply'].map(layer =>
+          fetch(`http://localhost:8000/api/v1/analytics/heatmap?data_type=${layer}`, {
+            headers: {
+              'Authorization': `Bearer ${localStorage.getItem('token')}`,
+              'Content-Type': 'application/json'
+            }
+          })
+        ))
         
-        if (!response.ok) {
+        if (!demandResponse.ok || !supplyResponse.ok) {
           throw new Error('Failed to fetch heatmap data')
         }
         
-        const data = await response.json()
+        const data = { ...(await demandResponse.json()), ...(await supplyResponse.json()) }
         
         // Transform the data into GeoJSON format for Mapbox
         const features: any[] = []
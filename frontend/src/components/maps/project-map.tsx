@@ -92,10 +92,12 @@ export function ProjectMap({
       console.log('🔥 Query enabled conditions:', { showHeatmap, mapBounds: !!mapBounds })
       
       try {
-        const data = await analyticsAPI.getHeatmapData({
-          data_type: heatmapType,
-          bounds: bounds
-        })
+        // Project markers come with the supply layer only, so other layers fetch it alongside
+        const [layerData, supplyData] = await Promise.all([
+          analyticsAPI.getHeatmapData({ data_type: heatmapType, bounds: bounds }),
+          heatmapType === 'supply' ? null : analyticsAPI.getHeatmapData({ data_type: 'supply', bounds: bounds })
+        ])
+        const data = supplyData ? { ...layerData, projects: supplyData.projects } : layerData
         console.log('🔥 Heatmap data received successfully:', {
           projects: data?.projects?.length || 0,
           demand_zones: data?.demand_zones?.length || 0,
@@ -422,6 +424,7 @@ export function ProjectMap({
     console.log('Adding heatmap layer with data:', {
       projects: heatmapData.projects?.length || 0,
       demand_zones: heatmapData.demand_zones?.length || 0,
+      gap_zones: heatmapData.gap_zones?.length || 0,
       statistics: heatmapData.statistics
     })
 
@@ -433,7 +436,11 @@ export function ProjectMap({
       z.lat && z.lng && !isNaN(z.lat) && !isNaN(z.lng)
     )
 
-    if (!hasValidProjects && !hasValidDemandZones) {
+    const hasValidGapZones = heatmapData.gap_zones?.some((z: any) => 
+      z.lat && z.lng && !isNaN(z.lat) && !isNaN(z.lng)
+    )
+
+    if (!hasValidProjects && !hasValidDemandZones && !hasValidGapZones) {
       console.warn('No valid coordinate data for heatmap')
       return
     }
@@ -513,6 +520,35 @@ export function ProjectMap({
         })
       }
 
+      // Add gap zones (intensity is the shortage of affordable units)
+      if (heatmapData.gap_zones) {
+        heatmapData.gap_zones.forEach((zone: any) => {
+          const lat = parseFloat(zone.lat)
+          const lng = parseFloat(zone.lng)
+          
+          if (!isNaN(lat) && !isNaN(lng) && lat >= -90 && lat <= 90 && lng >= -180 && lng <= 180) {
+            features.push({
+              type: 'Feature',
+              properties: {
+                type: 'gap',
+                value: zone.intensity,
+                intensity: zone.intensity,
+                description: `Gap zone: ${zone.supply || 0} affordable units for ${zone.demand || 0} applicants`,
+                supply: zone.supply,
+                demand: zone.demand,
+                gap: zone.gap
+              },
+              geometry: {
+                type: 'Point',
+                coordinates: [lng, lat]
+              }
+            })
+          } else {
+            console.warn(`Invalid coordinates for gap zone: lat=${lat}, lng=${lng}`)
+          }
+        })
+      }
+
       const geojsonData = {
         type: 'FeatureCollection',
         features
@@ -856,7 +892,7 @@ export function ProjectMap({
                       'No heatmap data available'
                     )}
                   </div>
-                  {heatmapData && (heatmapData.projects?.length > 0 || heatmapData.demand_zones?.length > 0) && (
+                  {heatmapData && (heatmapData.projects?.length > 0 || heatmapData.demand_zones?.length > 0 || heatmapData.gap_zones?.length > 0) && (
                     <>
                       <div className="flex items-center space-x-2 text-xs">
                         <div className="w-3 h-3 bg-teal-500 rounded-full"></div>
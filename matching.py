@@ -0,0 +1,452 @@
+#!/usr/bin/env python3
+"""Match scoring for HomeVerse: calculate_match_score and the batch engine.
+
+Kept free of the web app's imports so bulk matching pool processes can
+import it without loading the Supabase client, rate limiter or JWT setup.
+"""
+import heapq
+import math
+import pickle
+from typing import Optional, Dict, List, Any
+
+# NumPy for the vectorized matching engine (optional)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# Matching Algorithm Functions
+def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Calculate distance between two points using Haversine formula"""
+    R = 3961  # Earth radius in miles
+    
+    lat1_rad = math.radians(lat1)
+    lat2_rad = math.radians(lat2)
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    
+    a = (math.sin(dlat/2) * math.sin(dlat/2) + 
+         math.cos(lat1_rad) * math.cos(lat2_rad) * 
+         math.sin(dlng/2) * math.sin(dlng/2))
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    
+    return R * c
+
+def calculate_match_score(applicant: Dict, project: Dict) -> Dict:
+    """Calculate match score between applicant and project"""
+    score = 0
+    breakdown = {}
+    
+    # Income qualification (40% weight)
+    applicant_income = applicant.get('income', 0)
+    project_max_income = project.get('ami_percentage', 100) * 50000 / 100  # Rough AMI calculation
+    
+    if applicant_income <= project_max_income:
+        income_score = 40
+        breakdown['income'] = {'score': 40, 'qualified': True}
+    else:
+        # Partial score if close
+        ratio = project_max_income / applicant_income if applicant_income > 0 else 0
+        income_score = min(40, 40 * ratio)
+        breakdown['income'] = {'score': income_score, 'qualified': False}
+    
+    score += income_score
+    
+    # Location proximity (30% weight)
+    applicant_lat = applicant.get('latitude', 0)
+    applicant_lng = applicant.get('longitude', 0)
+    project_lat = project.get('latitude', 0)
+    project_lng = project.get('longitude', 0)
+    
+    if all([applicant_lat, applicant_lng, project_lat, project_lng]):
+        distance = calculate_distance(applicant_lat, applicant_lng, project_lat, project_lng)
+        
+        if distance <= 5:  # Within 5 miles
+            location_score = 30
+        elif distance <= 10:  # Within 10 miles
+            location_score = 20
+        elif distance <= 20:  # Within 20 miles
+            location_score = 10
+        else:
+            location_score = 0
+            
+        breakdown['location'] = {'score': location_score, 'distance': distance}
+    else:
+        location_score = 15  # Neutral score if no location data
+        breakdown['location'] = {'score': location_score, 'distance': None}
+    
+    score += location_score
+    
+    # Household size fit (20% weight)
+    household_size = applicant.get('household_size', 1)
+    total_units = project.get('total_units', 0)
+    
+    if total_units > 0:
+        # Prefer projects with multiple units for larger households
+        if household_size <= 2:
+            household_score = 20  # Any project works
+        elif household_size <= 4:
+            household_score = 20 if total_units >= 50 else 15  # Prefer larger developments
+        else:
+            household_score = 20 if total_units >= 100 else 10  # Need large developments
+    else:
+        household_score = 10
+    
+    breakdown['household'] = {'score': household_score, 'size': household_size}
+    score += household_score
+    
+    # Availability (10% weight)
+    available_units = project.get('affordable_units', 0)
+    project_status = project.get('status', 'planning')
+    
+    if project_status == 'active' and available_units > 0:
+        availability_score = 10
+    elif project_status == 'active':
+        availability_score = 5
+    else:
+        availability_score = 0
+    
+    breakdown['availability'] = {'score': availability_score, 'status': project_status, 'units': available_units}
+    score += availability_score
+    
+    return {
+        'total_score': round(score, 1),
+        'match_percentage': round(score, 1),  # Score is already out of 100
+        'breakdown': breakdown,
+        'recommendation': 'excellent' if score >= 80 else 'good' if score >= 60 else 'fair' if score >= 40 else 'poor'
+    }
+
+# Batch Matching Engine
+class MatchBatch:
+    """Scores for one applicant/project against a list of rows, in row order"""
+    
+    def __init__(self, rows: List[Dict], scores: List[Any], recommendations: List[str]):
+        self.rows = rows
+        self.scores = scores
+        self.recommendations = recommendations
+    
+    def _key(self, i: int) -> tuple:
+        """Ranking key: score descending, then row id, then row order"""
+        return (-self.scores[i], str(self.rows[i].get('id', '')), i)
+    
+    def _is_after(self, i: int, after: tuple) -> bool:
+        """True if row i ranks after the cursor (score, id) of a previous page"""
+        score, row_id = after
+        return self.scores[i] < score or (self.scores[i] == score and str(self.rows[i].get('id', '')) > row_id)
+    
+    def count(self, min_score: Optional[float] = None) -> int:
+        if min_score is None:
+            return len(self.scores)
+        if NUMPY_AVAILABLE:
+            return int(np.count_nonzero(np.asarray(self.scores, dtype=float) >= min_score))
+        return sum(1 for score in self.scores if score >= min_score)
+    
+    def ranked(self, limit: Optional[int] = None, min_score: Optional[float] = None,
+               after: Optional[tuple] = None) -> List[int]:
+        """Row indices by score descending, ties by row id.
+        
+        Rows below min_score or not after the `after` cursor (score, id)
+        are dropped first. With a limit, the top K is then selected in
+        linear time (argpartition, or a heap without NumPy) and only those
+        K rows are sorted.
+        """
+        if not NUMPY_AVAILABLE:
+            candidates = [
+                i for i in range(len(self.scores))
+                if (min_score is None or self.scores[i] >= min_score)
+                and (after is None or self._is_after(i, after))
+            ]
+            if limit is not None:
+                return heapq.nsmallest(limit, candidates, key=self._key)
+            return sorted(candidates, key=self._key)
+        
+        scores = np.asarray(self.scores, dtype=float)
+        keep = np.ones(len(scores), dtype=bool)
+        if min_score is not None:
+            keep &= scores >= min_score
+        if after is not None:
+            keep &= scores <= after[0]
+            ties = np.flatnonzero(keep & (scores == after[0])).tolist()
+            keep[[i for i in ties if not self._is_after(i, after)]] = False
+        candidates = np.flatnonzero(keep)
+        if limit is not None and 0 < limit < len(candidates):
+            # K-th largest score; everything at or above it (boundary ties included) goes to the sort
+            cut = np.partition(scores[candidates], len(candidates) - limit)[len(candidates) - limit]
+            candidates = candidates[scores[candidates] >= cut]
+        ordered = sorted(candidates.tolist(), key=self._key)
+        return ordered[:limit] if limit is not None else ordered
+
+class BatchMatchEngine:
+    """calculate_match_score for one applicant against many projects (or one
+    project against many applicants), as array operations.
+    
+    Scores and recommendations are identical to calculate_match_score:
+      * the arithmetic runs in float64 in the same order as the scalar code;
+      * distances within 1e-9 miles of a 5/10/20 mile band edge are
+        recomputed with calculate_distance, so the bands match even when
+        numpy's trig functions differ from libm in the last bit;
+      * scores close to a .x5 tie are rounded with Python's round();
+      * rows with values the scalar code would treat specially (None,
+        strings, NaN/inf, huge ints) are scored with calculate_match_score
+        itself, including any error it raises.
+    Callers build response breakdowns for the rows they return with
+    calculate_match_score.
+    """
+    DISTANCE_BANDS = (5, 10, 20)
+    
+    @staticmethod
+    def _column(rows: List[Dict], field: str, default: Any, none_as_zero: bool = False):
+        """Extract a float64 column plus a mask of rows that are safe to vectorize"""
+        raw = [row.get(field, default) for row in rows]
+        if {type(value) for value in raw} <= {int, float}:
+            # Fast path: plain numbers (ints must round-trip through float64 exactly)
+            values = np.array(raw, dtype=float)
+            return values, np.isfinite(values) & (np.abs(values) < 2 ** 53)
+        
+        values = np.zeros(len(rows))
+        clean = np.ones(len(rows), dtype=bool)
+        for i, value in enumerate(raw):
+            if value is None and none_as_zero:
+                continue
+            if isinstance(value, (int, float)) and (isinstance(value, float) or abs(value) < 2 ** 53):
+                values[i] = value
+            else:
+                clean[i] = False
+        return values, clean & np.isfinite(values)
+    
+    def _columns(self, rows: List[Dict], side: str) -> Dict[str, Any]:
+        if side == 'applicant':
+            specs = [('income', 0, False), ('latitude', 0, True), ('longitude', 0, True), ('household_size', 1, False)]
+        else:
+            specs = [('ami_percentage', 100, False), ('latitude', 0, True), ('longitude', 0, True),
+                     ('total_units', 0, False), ('affordable_units', 0, False)]
+        columns = {}
+        clean = np.ones(len(rows), dtype=bool)
+        for field, default, none_as_zero in specs:
+            columns[field], field_clean = self._column(rows, field, default, none_as_zero)
+            clean &= field_clean
+        if side == 'project':
+            columns['active'] = np.array([row.get('status', 'planning') == 'active' for row in rows], dtype=bool)
+        columns['clean'] = clean
+        return columns
+    
+    def _distances(self, lat1, lng1, lat2, lng2, used):
+        """calculate_distance over arrays, with band edges re-checked in scalar math"""
+        R = 3961
+        with np.errstate(invalid='ignore'):
+            lat1_rad = np.radians(lat1)
+            lat2_rad = np.radians(lat2)
+            dlat = np.radians(lat2 - lat1)
+            dlng = np.radians(lng2 - lng1)
+            
+            a = (np.sin(dlat/2) * np.sin(dlat/2) +
+                 np.cos(lat1_rad) * np.cos(lat2_rad) *
+                 np.sin(dlng/2) * np.sin(dlng/2))
+            c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+            distance = R * c
+        
+        # Rounding can push `a` just past 1 for antipodal points; the scalar code raises there
+        recheck = ~np.isfinite(distance)
+        for band in self.DISTANCE_BANDS:
+            recheck |= np.abs(distance - band) < 1e-9
+        for i in np.flatnonzero(recheck & used):
+            distance[i] = calculate_distance(float(lat1[i]), float(lng1[i]), float(lat2[i]), float(lng2[i]))
+        return distance
+    
+    def _score(self, applicant: Dict[str, Any], project: Dict[str, Any]):
+        """Raw scores for broadcast applicant/project column dicts"""
+        income = applicant['income']
+        project_max_income = project['ami_percentage'] * 50000 / 100
+        qualified = income <= project_max_income
+        ratio = np.divide(project_max_income, income, out=np.zeros(np.broadcast(project_max_income, income).shape),
+                          where=income > 0)
+        income_score = np.where(qualified, 40, np.minimum(40, 40 * ratio))
+        
+        has_location = ((applicant['latitude'] != 0) & (applicant['longitude'] != 0) &
+                        (project['latitude'] != 0) & (project['longitude'] != 0))
+        shape = has_location.shape
+        distance = self._distances(*(np.broadcast_to(column, shape) for column in (
+            applicant['latitude'], applicant['longitude'], project['latitude'], project['longitude'])), has_location)
+        location_score = np.where(has_location, np.select(
+            [distance <= 5, distance <= 10, distance <= 20], [30, 20, 10], default=0), 15)
+        
+        household_size = applicant['household_size']
+        total_units = project['total_units']
+        household_score = np.where(total_units > 0, np.select(
+            [household_size <= 2, household_size <= 4],
+            [20, np.where(total_units >= 50, 20, 15)],
+            default=np.where(total_units >= 100, 20, 10)), 10)
+        
+        active = project['active']
+        availability_score = np.where(active & (project['affordable_units'] > 0), 10, np.where(active, 5, 0))
+        
+        score = income_score + location_score
+        score = score + household_score
+        score = score + availability_score
+        return np.broadcast_to(score, shape)
+    
+    @staticmethod
+    def _round(raw):
+        """round(score, 1) with Python's rounding for values next to a tie"""
+        rounded = np.round(raw, 1)
+        scaled = raw * 10
+        near_tie = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+        for i in np.flatnonzero(near_tie):
+            rounded[i] = round(float(raw[i]), 1)
+        return rounded
+    
+    @staticmethod
+    def _recommendations(raw) -> List[str]:
+        return np.select([raw >= 80, raw >= 60, raw >= 40], ['excellent', 'good', 'fair'], default='poor').tolist()
+    
+    def _scalar_batch(self, pairs: List[tuple], rows: List[Dict]) -> MatchBatch:
+        results = [calculate_match_score(applicant, project) for applicant, project in pairs]
+        return MatchBatch(rows, [r['match_percentage'] for r in results], [r['recommendation'] for r in results])
+    
+    def prepare(self, rows: List[Dict], side: str) -> Optional[Dict[str, Any]]:
+        """Column arrays for rows scored many times ('project' or 'applicant' side).
+        
+        Pass the result back as `columns=` to skip re-reading the row dicts on
+        every call. The rows must not change while the columns are in use.
+        """
+        return self._columns(rows, side) if NUMPY_AVAILABLE and rows else None
+    
+    def _batch(self, one: Dict, one_side: str, rows: List[Dict], many: Optional[Dict[str, Any]] = None) -> MatchBatch:
+        many_side = 'project' if one_side == 'applicant' else 'applicant'
+        pair = (lambda row: (one, row)) if one_side == 'applicant' else (lambda row: (row, one))
+        if not NUMPY_AVAILABLE or not rows:
+            return self._scalar_batch([pair(row) for row in rows], rows)
+        
+        single = self._columns([one], one_side)
+        if many is None:
+            many = self._columns(rows, many_side)
+        if not single['clean'][0]:
+            return self._scalar_batch([pair(row) for row in rows], rows)
+        
+        columns = {one_side: {k: v[0] for k, v in single.items()}, many_side: many}
+        raw = self._score(columns['applicant'], columns['project']).astype(float)
+        scores = self._round(raw).tolist()
+        recommendations = self._recommendations(raw)
+        
+        # Rows the vectorized path can't reproduce exactly go through the scalar scorer
+        for i in np.flatnonzero(~many['clean']):
+            result = calculate_match_score(*pair(rows[i]))
+            scores[i] = result['match_percentage']
+            recommendations[i] = result['recommendation']
+        return MatchBatch(rows, scores, recommendations)
+    
+    def score_projects(self, applicant: Dict, projects: List[Dict],
+                       columns: Optional[Dict[str, Any]] = None) -> MatchBatch:
+        """Score one applicant against every project (columns from prepare(projects, 'project'))"""
+        return self._batch(applicant, 'applicant', projects, columns)
+    
+    def score_applicants(self, project: Dict, applicants: List[Dict],
+                         columns: Optional[Dict[str, Any]] = None) -> MatchBatch:
+        """Score every applicant against one project (columns from prepare(applicants, 'applicant'))"""
+        return self._batch(project, 'project', applicants, columns)
+    
+    @staticmethod
+    def _plain_number(value: Any) -> bool:
+        return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+    
+    @staticmethod
+    def _radius_bbox(lat: float, lng: float, miles: float) -> Dict[str, float]:
+        """Bounding box containing every point within `miles` (haversine, R=3961) of lat/lng"""
+        arc = miles / 3961
+        dlat = math.degrees(arc) + 1e-6
+        min_cos = math.cos(math.radians(min(90.0, abs(lat) + dlat)))
+        # hav(d) >= cos(lat1) cos(lat2) hav(dlng) bounds the longitude spread
+        spread = math.sin(arc / 2) / min_cos if min_cos > 1e-12 else 2.0
+        dlng = math.degrees(2 * math.asin(spread)) + 1e-6 if spread < 1 else 360.0
+        if lng - dlng < -180 or lng + dlng > 180:
+            lng1, lng2 = -180.0, 180.0
+        else:
+            lng1, lng2 = lng - dlng, lng + dlng
+        return {'lat1': lat - dlat, 'lat2': lat + dlat, 'lng1': lng1, 'lng2': lng2}
+    
+    def applicant_prefilter(self, project: Dict, min_score: float) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Database predicates keeping every applicant who can score min_score against project.
+        
+        Income is the only factor without a per-project cap. Location is
+        worth at most 30 within 20 miles, 15 without coordinates and 0
+        beyond. Household and availability are capped by the project. What
+        min_score needs beyond those caps must come from income, and
+        40 * max_income / income >= need gives an income ceiling for each
+        location class.
+        
+        Returns OR-ed branches 'near' (with a bbox), 'unlocated' and 'any',
+        each with a max_income (None = uncapped). Branches that cannot reach
+        min_score are left out. Returns None when nothing can be excluded or
+        the project has values the scalar scorer treats specially.
+        """
+        ami = project.get('ami_percentage', 100)
+        total_units = project.get('total_units', 0)
+        units = project.get('affordable_units', 0)
+        if not all(self._plain_number(value) for value in (ami, total_units, units)) or ami < 0:
+            return None
+        max_income = ami * 50000 / 100
+        household = 20 if total_units > 0 else 10
+        availability = (10 if units > 0 else 5) if project.get('status', 'planning') == 'active' else 0
+        
+        lat, lng = project.get('latitude', 0), project.get('longitude', 0)
+        if not (lat and lng):
+            location_classes = {'any': 15}
+        elif self._plain_number(lat) and self._plain_number(lng):
+            location_classes = {'near': 30, 'unlocated': 15, 'any': 0}
+        else:
+            return None
+        
+        branches = {}
+        for name, location in location_classes.items():
+            # Scores are rounded to one decimal, so 0.05 below min_score still qualifies
+            need = min_score - 0.05 - location - household - availability
+            if need > 40:
+                continue
+            branches[name] = {'max_income': max_income * 40 / need * (1 + 1e-9) if need > 0 else None}
+        if branches.get('any', {}).get('max_income', 0) is None:
+            return None
+        if 'near' in branches:
+            branches['near']['bbox'] = self._radius_bbox(lat, lng, self.DISTANCE_BANDS[-1])
+        return branches
+
+# Initialize matching engine
+matching_engine = BatchMatchEngine()
+
+# Bulk Matching Worker
+# Projects of the job this pool process last scored, unpickled once per job
+_bulk_projects_key: Optional[str] = None
+_bulk_projects: List[Dict] = []
+_bulk_columns: Optional[Dict[str, Any]] = None
+
+def score_bulk_chunk(projects_key: str, projects_blob: bytes, applicants: List[Dict], limit: Optional[int],
+                     min_score: Optional[float], with_breakdown: bool) -> List[Dict]:
+    """Score a chunk of applicants against a job's projects (runs in a bulk matching pool process).
+    
+    `projects_blob` is the job's pickled project list; processes keep the
+    last job's projects and prepared columns, keyed by `projects_key`.
+    """
+    global _bulk_projects_key, _bulk_projects, _bulk_columns
+    if projects_key != _bulk_projects_key:
+        _bulk_projects = pickle.loads(projects_blob)
+        _bulk_columns = matching_engine.prepare(_bulk_projects, 'project')
+        _bulk_projects_key = projects_key
+    projects = _bulk_projects
+    results = []
+    for applicant in applicants:
+        try:
+            batch = matching_engine.score_projects(applicant, projects, columns=_bulk_columns)
+            matches = []
+            for i in batch.ranked(limit=limit, min_score=min_score):
+                match = {
+                    'project_id': projects[i]['id'],
+                    'match_score': batch.scores[i],
+                    'recommendation': batch.recommendations[i]
+                }
+                if with_breakdown:
+                    match['breakdown'] = calculate_match_score(applicant, projects[i])['breakdown']
+                matches.append(match)
+            results.append({'applicant_id': applicant['id'], 'company_id': applicant.get('company_id'), 'matches': matches})
+        except Exception as e:
+            results.append({'applicant_id': applicant['id'], 'error': str(e)})
+    return results
@@ -1,12 +1,24 @@
 #!/usr/bin/env python3
 """HomeVerse Backend with Supabase Integration"""
+import abc
 import os
+import asyncio
+import hashlib
+import json
 import logging
 import math
+import multiprocessing
+import pickle
+import time
+import threading
 import uuid
-from datetime import datetime
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timezone
+from decimal import Decimal
 from typing import Optional, Dict, List, Any
-from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Request, Header
+from fastapi import FastAPI, HTTPException, Depends, UploadFile, File, Form, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi.responses import StreamingResponse
@@ -14,10 +26,23 @@ import csv
 import io
 from pydantic import BaseModel, EmailStr
 import uvicorn
-from supabase import create_client, Client
+import httpx
+from supabase import Client
+from supabase.lib.auth_client import SupabaseAuthClient
+from supabase.lib.storage_client import SupabaseStorageClient
+from postgrest import AsyncPostgrestClient, SyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from postgrest.exceptions import APIError
+from postgrest.types import ReturnMethod
+from postgrest.utils import SyncClient
+from storage3.constants import DEFAULT_TIMEOUT as DEFAULT_STORAGE_TIMEOUT
 import jwt
 from functools import wraps
 
+# Match scoring (kept in its own module so bulk matching workers import only that)
+import matching
+from matching import BatchMatchEngine, calculate_match_score, matching_engine
+
 # Rate limiting imports
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
@@ -50,11 +75,132 @@ except ImportError:
     logger.warning("📧 Resend not installed. Email functionality disabled.")
     RESEND_AVAILABLE = False
 
+# HTTP/2 support for the Supabase HTTP clients (optional)
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# NumPy for the spatial project index (optional; the matching module checks on its own)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# asyncpg for the direct Postgres repository (optional)
+try:
+    import asyncpg
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    ASYNCPG_AVAILABLE = False
+
+# H3 hexagonal binning for heatmap demand zones when Postgres lacks the h3 extension (optional)
+try:
+    from h3.api import basic_int as h3
+    H3_AVAILABLE = True
+except ImportError:
+    H3_AVAILABLE = False
+
 # Supabase Configuration
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")
 SUPABASE_ANON_KEY = os.getenv("SUPABASE_ANON_KEY")
 
+# JWT verification configuration (local verification of Supabase access tokens)
+SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET")
+SUPABASE_JWT_AUDIENCE = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL", f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json")
+SUPABASE_JWKS_REFRESH_SECONDS = int(os.getenv("SUPABASE_JWKS_REFRESH_SECONDS", "600"))
+
+# Principal cache configuration (profile + company lookup per user)
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "10000"))
+
+# HTTP transport configuration (connection pools for the PostgREST, storage and auth clients)
+SUPABASE_HTTP_MAX_CONNECTIONS = int(os.getenv("SUPABASE_HTTP_MAX_CONNECTIONS", "100"))
+SUPABASE_HTTP_MAX_KEEPALIVE = int(os.getenv("SUPABASE_HTTP_MAX_KEEPALIVE", "20"))
+SUPABASE_HTTP_KEEPALIVE_EXPIRY = float(os.getenv("SUPABASE_HTTP_KEEPALIVE_EXPIRY", "60"))
+SUPABASE_HTTP2 = os.getenv("SUPABASE_HTTP2", "false").lower() == "true"
+SUPABASE_HTTP_CONNECT_TIMEOUT = float(os.getenv("SUPABASE_HTTP_CONNECT_TIMEOUT", "5"))
+SUPABASE_HTTP_READ_TIMEOUT = float(os.getenv("SUPABASE_HTTP_READ_TIMEOUT", "30"))
+
+# Repository backend for hot read paths: "supabase" (PostgREST) or "asyncpg" (direct Postgres)
+DATABASE_BACKEND = os.getenv("DATABASE_BACKEND", "supabase").lower()
+SUPABASE_DB_URL = os.getenv("SUPABASE_DB_URL")
+# Rows per page for full-table PostgREST reads; keep at or below the API's max-rows (1000 on Supabase)
+SUPABASE_PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+ASYNCPG_POOL_MIN_SIZE = int(os.getenv("ASYNCPG_POOL_MIN_SIZE", "2"))
+ASYNCPG_POOL_MAX_SIZE = int(os.getenv("ASYNCPG_POOL_MAX_SIZE", "10"))
+ASYNCPG_STATEMENT_CACHE_SIZE = int(os.getenv("ASYNCPG_STATEMENT_CACHE_SIZE", "100"))
+ASYNCPG_COMMAND_TIMEOUT = float(os.getenv("ASYNCPG_COMMAND_TIMEOUT", "30"))
+
+# Activity log write-behind queue (bulk inserts into the activities table)
+ACTIVITY_LOG_BATCH_SIZE = int(os.getenv("ACTIVITY_LOG_BATCH_SIZE", "100"))
+ACTIVITY_LOG_FLUSH_INTERVAL = float(os.getenv("ACTIVITY_LOG_FLUSH_INTERVAL", "1.0"))
+ACTIVITY_LOG_MAX_QUEUE = int(os.getenv("ACTIVITY_LOG_MAX_QUEUE", "10000"))
+ACTIVITY_LOG_ENQUEUE_TIMEOUT = float(os.getenv("ACTIVITY_LOG_ENQUEUE_TIMEOUT", "0.05"))
+ACTIVITY_LOG_DRAIN_TIMEOUT = float(os.getenv("ACTIVITY_LOG_DRAIN_TIMEOUT", "10"))
+ACTIVITY_LOG_REPLAY_INTERVAL = float(os.getenv("ACTIVITY_LOG_REPLAY_INTERVAL", "30"))
+ACTIVITY_LOG_SPILL_PATH = os.getenv("ACTIVITY_LOG_SPILL_PATH", "activity_spill.jsonl")
+
+# Applicant -> project matching: cached active-project catalog with a grid spatial index
+MATCH_CATALOG_TTL_SECONDS = float(os.getenv("MATCH_CATALOG_TTL_SECONDS", "60"))
+MATCH_GRID_CELL_DEGREES = float(os.getenv("MATCH_GRID_CELL_DEGREES", "0.25"))
+# Applicants without coordinates: "scan" scores every project (exact); "default_location"
+# prunes around MATCH_DEFAULT_LOCATION instead (faster, candidates are approximate)
+MATCH_NO_LOCATION_FALLBACK = os.getenv("MATCH_NO_LOCATION_FALLBACK", "scan").lower()
+MATCH_DEFAULT_LOCATION = os.getenv("MATCH_DEFAULT_LOCATION", "37.7749,-122.4194")
+
+# Materialized match scores in the matches table (apply supabase_matches_materialization.sql first)
+MATCHES_MATERIALIZED = os.getenv("MATCHES_MATERIALIZED", "false").lower() == "true"
+MATCH_MATERIALIZE_MIN_SCORE = float(os.getenv("MATCH_MATERIALIZE_MIN_SCORE", "50"))
+MATCH_MATERIALIZE_BATCH_SIZE = int(os.getenv("MATCH_MATERIALIZE_BATCH_SIZE", "500"))
+MATCH_MATERIALIZE_DRAIN_TIMEOUT = float(os.getenv("MATCH_MATERIALIZE_DRAIN_TIMEOUT", "10"))
+
+# Bulk "rematch everything" jobs: applicant chunks scored across a process pool
+BULK_MATCH_WORKERS = int(os.getenv("BULK_MATCH_WORKERS", str(os.cpu_count() or 1)))
+BULK_MATCH_CHUNK_SIZE = int(os.getenv("BULK_MATCH_CHUNK_SIZE", "250"))
+BULK_MATCH_MAX_JOBS = int(os.getenv("BULK_MATCH_MAX_JOBS", "50"))
+
+# Applicant match pages cached per (applicant version, project catalog generation)
+MATCH_CACHE_MAX_ENTRIES = int(os.getenv("MATCH_CACHE_MAX_ENTRIES", "5000"))
+
+# New-project emails: matching applicants notified in Resend batches by a background worker
+NOTIFY_MIN_SCORE = float(os.getenv("NOTIFY_MIN_SCORE", "60"))
+NOTIFY_EMAIL_BATCH_SIZE = int(os.getenv("NOTIFY_EMAIL_BATCH_SIZE", "100"))  # Resend accepts at most 100
+NOTIFY_EMAIL_CONCURRENCY = int(os.getenv("NOTIFY_EMAIL_CONCURRENCY", "2"))
+NOTIFY_EMAIL_REQUESTS_PER_SECOND = float(os.getenv("NOTIFY_EMAIL_REQUESTS_PER_SECOND", "2"))
+NOTIFY_EMAIL_MAX_RETRIES = int(os.getenv("NOTIFY_EMAIL_MAX_RETRIES", "5"))
+NOTIFY_DRAIN_TIMEOUT = float(os.getenv("NOTIFY_DRAIN_TIMEOUT", "10"))
+
+# Heatmap demand zones aggregated in Postgres (apply supabase_heatmap_aggregation.sql first)
+HEATMAP_SQL_AGGREGATION = os.getenv("HEATMAP_SQL_AGGREGATION", "true").lower() == "true"
+HEATMAP_CLUSTER_DEGREES = 0.01  # ~1km
+
+# Heatmap demand zones binned into H3 hexagons (apply supabase_heatmap_hex.sql first); false keeps the degree grid
+HEATMAP_HEX_BINNING = os.getenv("HEATMAP_HEX_BINNING", "true").lower() == "true"
+HEATMAP_H3_BASE_RESOLUTION = int(os.getenv("HEATMAP_H3_BASE_RESOLUTION", "9"))  # ~0.1 km² hexagons
+HEATMAP_MAX_ZONES = int(os.getenv("HEATMAP_MAX_ZONES", "2000"))
+
+# Running demand/supply totals per (company, H3 cell) in heatmap_cells (apply supabase_heatmap_cells.sql first)
+HEATMAP_CELL_AGGREGATES = os.getenv("HEATMAP_CELL_AGGREGATES", "false").lower() == "true"
+HEATMAP_CELLS_RECONCILE_SECONDS = float(os.getenv("HEATMAP_CELLS_RECONCILE_SECONDS", "3600"))  # 0 disables
+HEATMAP_CELLS_BATCH_SIZE = int(os.getenv("HEATMAP_CELLS_BATCH_SIZE", "500"))  # queued writes merged per delta call
+HEATMAP_CELLS_DRAIN_TIMEOUT = float(os.getenv("HEATMAP_CELLS_DRAIN_TIMEOUT", "10"))
+
+# Heatmap layers (GET /api/v1/analytics/heatmap data_type=demand|supply|gap), each cached on its own
+HEATMAP_LAYER_CACHE_MAX_ENTRIES = int(os.getenv("HEATMAP_LAYER_CACHE_MAX_ENTRIES", "500"))
+HEATMAP_LAYER_TTL_SECONDS = float(os.getenv("HEATMAP_LAYER_TTL_SECONDS", "60"))
+
+# Heatmap tiles (GET /api/v1/analytics/heatmap/tiles/{z}/{x}/{y}): in-memory LRU plus optional disk cache
+HEATMAP_TILE_MAX_ZOOM = int(os.getenv("HEATMAP_TILE_MAX_ZOOM", "14"))
+HEATMAP_TILE_BINS = int(os.getenv("HEATMAP_TILE_BINS", "32"))  # demand cells along a tile edge
+HEATMAP_TILE_CACHE_MAX_ENTRIES = int(os.getenv("HEATMAP_TILE_CACHE_MAX_ENTRIES", "2000"))
+HEATMAP_TILE_TTL_SECONDS = float(os.getenv("HEATMAP_TILE_TTL_SECONDS", "300"))
+HEATMAP_TILE_CACHE_DIR = os.getenv("HEATMAP_TILE_CACHE_DIR", "")  # empty keeps tiles in memory only
+
 # Email Configuration
 RESEND_API_KEY = os.getenv("RESEND_API_KEY")
 
@@ -62,10 +208,923 @@ if not all([SUPABASE_URL, SUPABASE_SERVICE_KEY]):
     logger.error("Missing Supabase configuration. Please set SUPABASE_URL and SUPABASE_SERVICE_KEY in .env")
     raise ValueError("Supabase configuration incomplete")
 
+# HTTP Transport
+class SupabaseHTTPPools:
+    """Shared keep-alive connection pools for the Supabase HTTP clients.
+    
+    Each dependency (postgrest, storage, auth) gets one long-lived transport.
+    Clients are built on top of it. The supabase client rebuilds its storage
+    and postgrest clients after auth events, and those rebuilt clients keep
+    reusing the warm connections instead of opening new ones. New TCP
+    connections and TLS handshakes are counted through httpcore trace events.
+    The connects-per-request ratio shows how well keep-alive is working.
+    """
+    
+    def __init__(self):
+        self.http2 = SUPABASE_HTTP2 and HTTP2_AVAILABLE
+        if SUPABASE_HTTP2 and not HTTP2_AVAILABLE:
+            logger.warning("⚠️ SUPABASE_HTTP2 is set but the h2 package is not installed - using HTTP/1.1")
+        self.limits = httpx.Limits(
+            max_connections=SUPABASE_HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=SUPABASE_HTTP_KEEPALIVE_EXPIRY
+        )
+        self.timeout = httpx.Timeout(SUPABASE_HTTP_READ_TIMEOUT, connect=SUPABASE_HTTP_CONNECT_TIMEOUT)
+        self._transports: Dict[str, Any] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+    
+    def _transport(self, name: str, is_async: bool):
+        with self._lock:
+            if name not in self._transports:
+                transport_class = httpx.AsyncHTTPTransport if is_async else httpx.HTTPTransport
+                self._transports[name] = transport_class(limits=self.limits, http2=self.http2)
+                self._counters[name] = {"requests": 0, "connects": 0, "tls_handshakes": 0}
+            return self._transports[name]
+    
+    def _count(self, name: str, trace_event: Optional[str] = None) -> None:
+        counters = self._counters[name]
+        with self._lock:
+            if trace_event is None:
+                counters["requests"] += 1
+            elif trace_event.endswith("connect_tcp.complete"):
+                counters["connects"] += 1
+            elif trace_event.endswith("start_tls.complete"):
+                counters["tls_handshakes"] += 1
+    
+    def sync_client(self, name: str, **kwargs) -> SyncClient:
+        """A blocking client (storage, auth, sync postgrest) on the named pool"""
+        def trace(event_name: str, info: Dict[str, Any]) -> None:
+            self._count(name, event_name)
+        
+        def on_request(request: httpx.Request) -> None:
+            self._count(name)
+            request.extensions["trace"] = trace
+        
+        return SyncClient(
+            transport=self._transport(name, is_async=False),
+            timeout=self.timeout,
+            event_hooks={"request": [on_request]},
+            **kwargs
+        )
+    
+    def async_client(self, name: str, **kwargs) -> httpx.AsyncClient:
+        """An async client (postgrest) on the named pool"""
+        async def trace(event_name: str, info: Dict[str, Any]) -> None:
+            self._count(name, event_name)
+        
+        async def on_request(request: httpx.Request) -> None:
+            self._count(name)
+            request.extensions["trace"] = trace
+        
+        return httpx.AsyncClient(
+            transport=self._transport(name, is_async=True),
+            timeout=self.timeout,
+            event_hooks={"request": [on_request]},
+            **kwargs
+        )
+    
+    def stats(self) -> Dict[str, Any]:
+        pools = {}
+        for name, transport in list(self._transports.items()):
+            counters = dict(self._counters[name])
+            connections = list(getattr(getattr(transport, "_pool", None), "connections", []))
+            open_connections = [conn for conn in connections if not conn.is_closed()]
+            pools[name] = {
+                **counters,
+                "reuse_ratio": round(1 - counters["connects"] / counters["requests"], 4) if counters["requests"] else 0.0,
+                "open": len(open_connections),
+                "idle": sum(1 for conn in open_connections if conn.is_idle()),
+                "http2": sum(1 for conn in open_connections if "HTTP/2" in conn.info())
+            }
+        return {
+            "config": {
+                "max_connections": self.limits.max_connections,
+                "max_keepalive_connections": self.limits.max_keepalive_connections,
+                "keepalive_expiry": self.limits.keepalive_expiry,
+                "http2": self.http2,
+                "connect_timeout": self.timeout.connect,
+                "read_timeout": self.timeout.read
+            },
+            "pools": pools
+        }
+    
+    async def aclose(self) -> None:
+        """Close every pooled connection"""
+        for transport in list(self._transports.values()):
+            if isinstance(transport, httpx.AsyncHTTPTransport):
+                await transport.aclose()
+            else:
+                transport.close()
+
+# Initialize shared HTTP connection pools
+http_pools = SupabaseHTTPPools()
+
+class PooledStorageClient(SupabaseStorageClient):
+    """Storage client on the shared storage connection pool"""
+    
+    def _create_session(self, base_url: str, headers: Dict[str, str], timeout: int) -> SyncClient:
+        return http_pools.sync_client("storage", base_url=base_url, headers=headers)
+
+class PooledSyncPostgrestClient(SyncPostgrestClient):
+    """Blocking PostgREST client on the shared postgrest connection pool"""
+    
+    def create_session(self, base_url: str, headers: Dict[str, str], timeout) -> SyncClient:
+        return http_pools.sync_client("postgrest_sync", base_url=base_url, headers=headers)
+
+class PooledSupabaseClient(Client):
+    """Supabase client whose sub-clients share the configured connection pools.
+    
+    Timeouts come from SUPABASE_HTTP_CONNECT_TIMEOUT/SUPABASE_HTTP_READ_TIMEOUT
+    rather than the per-client SDK defaults.
+    """
+    
+    @staticmethod
+    def _init_storage_client(storage_url: str, headers: Dict[str, str], storage_client_timeout: int = DEFAULT_STORAGE_TIMEOUT):
+        return PooledStorageClient(storage_url, headers, storage_client_timeout)
+    
+    @staticmethod
+    def _init_supabase_auth_client(auth_url: str, client_options):
+        return SupabaseAuthClient(
+            url=auth_url,
+            auto_refresh_token=client_options.auto_refresh_token,
+            persist_session=client_options.persist_session,
+            storage=client_options.storage,
+            headers=client_options.headers,
+            http_client=http_pools.sync_client("auth")
+        )
+    
+    @staticmethod
+    def _init_postgrest_client(rest_url: str, headers: Dict[str, str], schema: str, timeout=None):
+        return PooledSyncPostgrestClient(rest_url, headers=headers, schema=schema)
+
 # Initialize Supabase client
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+supabase: Client = PooledSupabaseClient(SUPABASE_URL, SUPABASE_SERVICE_KEY)
 logger.info("✅ Supabase client initialized")
 
+# Performance metrics
+class LatencyStats:
+    """Running count/mean/max of a per-request duration in milliseconds"""
+    
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+    
+    def record(self, duration_ms: float) -> None:
+        with self._lock:
+            self.count += 1
+            self.total_ms += duration_ms
+            if duration_ms > self.max_ms:
+                self.max_ms = duration_ms
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 4) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 4),
+            "total_ms": round(self.total_ms, 2)
+        }
+
+# Async Data Access Layer
+class PooledAsyncPostgrestClient(AsyncPostgrestClient):
+    """Async PostgREST client on the shared postgrest connection pool"""
+    
+    def create_session(self, base_url: str, headers: Dict[str, str], timeout) -> httpx.AsyncClient:
+        return http_pools.async_client("postgrest", base_url=base_url, headers=headers)
+
+class AsyncSupabaseDB:
+    """Async PostgREST access for all table queries.
+    
+    Route handlers await queries instead of calling the synchronous client,
+    so a slow query no longer blocks the event loop. Every query goes through
+    one AsyncPostgrestClient and therefore one shared keep-alive connection pool.
+    The query-builder API matches the sync client: `await db.table(...)...execute()`.
+    """
+    
+    def __init__(self, url: str, service_key: str):
+        self._client = PooledAsyncPostgrestClient(
+            base_url=f"{url}/rest/v1",
+            headers={
+                **DEFAULT_POSTGREST_CLIENT_HEADERS,
+                "apikey": service_key,
+                "Authorization": f"Bearer {service_key}"
+            }
+        )
+    
+    def table(self, table_name: str):
+        """Start a query on a table"""
+        return self._client.from_(table_name)
+    
+    def rpc(self, function_name: str, params: Dict[str, Any]):
+        """Call a Postgres function exposed through PostgREST"""
+        return self._client.rpc(function_name, params)
+    
+    async def aclose(self) -> None:
+        """Close pooled connections"""
+        await self._client.aclose()
+
+# Initialize async database client
+db = AsyncSupabaseDB(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+
+# Blocking SDK Call Offloading
+class OffloadRejected(Exception):
+    """Raised when a dependency's offload queue is full"""
+
+class BlockingCallOffloader:
+    """Run blocking SDK calls on bounded, per-dependency thread pools.
+    
+    Auth admin, storage and email SDKs are synchronous. Each dependency gets
+    its own small pool so a slow storage upload can't starve email sends or
+    the event loop. Calls that wait longer than the pool's timeout raise
+    asyncio.TimeoutError, and calls beyond `max_queue` waiting are rejected.
+    """
+    
+    def __init__(self, pools: Dict[str, Dict[str, Any]]):
+        self._pools = {}
+        for name, config in pools.items():
+            self._pools[name] = {
+                "executor": ThreadPoolExecutor(max_workers=config["workers"], thread_name_prefix=f"offload-{name}"),
+                "workers": config["workers"],
+                "timeout": config["timeout"],
+                "max_queue": config["max_queue"],
+                "queued": 0,
+                "running": 0,
+                "max_queue_depth": 0,
+                "completed": 0,
+                "failed": 0,
+                "timeouts": 0,
+                "rejected": 0,
+                "wait_ms": LatencyStats(),
+                "run_ms": LatencyStats()
+            }
+        self._lock = threading.Lock()
+    
+    async def run(self, pool_name: str, fn, *args, **kwargs):
+        """Run `fn(*args, **kwargs)` on the named pool and await its result"""
+        pool = self._pools[pool_name]
+        with self._lock:
+            if pool["queued"] >= pool["max_queue"]:
+                pool["rejected"] += 1
+                raise OffloadRejected(f"{pool_name} offload queue full ({pool['queued']} waiting)")
+            pool["queued"] += 1
+            pool["max_queue_depth"] = max(pool["max_queue_depth"], pool["queued"])
+        submitted = time.perf_counter()
+        
+        def call():
+            started = time.perf_counter()
+            with self._lock:
+                pool["queued"] -= 1
+                pool["running"] += 1
+            pool["wait_ms"].record((started - submitted) * 1000)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                pool["run_ms"].record((time.perf_counter() - started) * 1000)
+                with self._lock:
+                    pool["running"] -= 1
+        
+        def dequeue_if_cancelled(job) -> None:
+            # A job cancelled before a thread picked it up (timeout, client
+            # disconnect) never runs call(), so release its queue slot here
+            if job.cancelled():
+                with self._lock:
+                    pool["queued"] -= 1
+        
+        job = pool["executor"].submit(call)
+        job.add_done_callback(dequeue_if_cancelled)
+        future = asyncio.wrap_future(job)
+        try:
+            result = await asyncio.wait_for(future, timeout=pool["timeout"])
+        except asyncio.TimeoutError:
+            # The thread can't be interrupted; it finishes in the background
+            pool["timeouts"] += 1
+            logger.warning(f"⏳ {pool_name} call {getattr(fn, '__qualname__', fn)} timed out after {pool['timeout']}s")
+            raise
+        except Exception:
+            pool["failed"] += 1
+            raise
+        pool["completed"] += 1
+        return result
+    
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and latency metrics per dependency"""
+        return {
+            name: {
+                "workers": pool["workers"],
+                "timeout_seconds": pool["timeout"],
+                "max_queue": pool["max_queue"],
+                "queue_depth": pool["queued"],
+                "running": pool["running"],
+                "max_queue_depth": pool["max_queue_depth"],
+                "completed": pool["completed"],
+                "failed": pool["failed"],
+                "timeouts": pool["timeouts"],
+                "rejected": pool["rejected"],
+                "wait_ms": pool["wait_ms"].snapshot(),
+                "run_ms": pool["run_ms"].snapshot()
+            }
+            for name, pool in self._pools.items()
+        }
+    
+    def shutdown(self) -> None:
+        for pool in self._pools.values():
+            pool["executor"].shutdown(wait=False)
+
+def _offload_pool_config(name: str, workers: int, timeout: float, max_queue: int) -> Dict[str, Any]:
+    """Read a pool's settings from OFFLOAD_<NAME>_{WORKERS,TIMEOUT,MAX_QUEUE}"""
+    prefix = f"OFFLOAD_{name.upper()}"
+    return {
+        "workers": int(os.getenv(f"{prefix}_WORKERS", str(workers))),
+        "timeout": float(os.getenv(f"{prefix}_TIMEOUT", str(timeout))),
+        "max_queue": int(os.getenv(f"{prefix}_MAX_QUEUE", str(max_queue)))
+    }
+
+# Initialize offloader: one bounded pool per blocking dependency
+offloader = BlockingCallOffloader({
+    "auth": _offload_pool_config("auth", workers=8, timeout=10, max_queue=200),
+    "storage": _offload_pool_config("storage", workers=4, timeout=30, max_queue=50),
+    "email": _offload_pool_config("email", workers=4, timeout=15, max_queue=500),
+    "disk": _offload_pool_config("disk", workers=2, timeout=5, max_queue=200),
+    "compute": _offload_pool_config("compute", workers=1, timeout=120, max_queue=10)
+})
+
+# Repository Layer
+class Repository(abc.ABC):
+    """Read access for the hot endpoints (applicant/project lists, matching, heatmap).
+    
+    Implementations return plain dicts shaped like PostgREST JSON rows, so
+    route handlers do not depend on the backend. Writes still go through `db`.
+    """
+    
+    backend = "base"
+    
+    # Applicant columns calculate_match_score reads, plus keys for the matches table
+    MATCH_COLUMNS = ('id', 'company_id', 'income', 'household_size', 'latitude', 'longitude', 'updated_at')
+    
+    def __init__(self):
+        self.latency: Dict[str, LatencyStats] = {}
+        self._heatmap_sql_warned = False
+        self._heatmap_hex_sql_warned = False
+    
+    def _record(self, operation: str, started: float) -> None:
+        if operation not in self.latency:
+            self.latency[operation] = LatencyStats()
+        self.latency[operation].record((time.perf_counter() - started) * 1000)
+    
+    async def start(self) -> None:
+        pass
+    
+    async def close(self) -> None:
+        pass
+    
+    @abc.abstractmethod
+    async def list_applicants(self, company_id: str, skip: int, limit: int, search: Optional[str] = None) -> List[Dict]:
+        ...
+    
+    @abc.abstractmethod
+    async def list_projects(self, skip: int, limit: int, search: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+        """Projects page with the owning company embedded under `companies`"""
+    
+    @abc.abstractmethod
+    async def get_applicant(self, applicant_id: str) -> Optional[Dict]:
+        ...
+    
+    @abc.abstractmethod
+    async def get_project(self, project_id: str) -> Optional[Dict]:
+        ...
+    
+    @abc.abstractmethod
+    async def list_projects_by_status(self, status: str) -> List[Dict]:
+        ...
+    
+    @abc.abstractmethod
+    async def list_all_applicants(self) -> List[Dict]:
+        ...
+    
+    @abc.abstractmethod
+    async def list_match_candidates(self, company_id: Optional[str], prefilter: Optional[Dict[str, Dict]]) -> List[Dict]:
+        """MATCH_COLUMNS of a tenant's applicants (all tenants when company_id is None).
+        
+        `prefilter` comes from BatchMatchEngine.applicant_prefilter: OR-ed
+        'near' / 'unlocated' / 'any' branches with an optional income cap.
+        None means no prefilter; an empty dict matches nothing.
+        """
+    
+    @abc.abstractmethod
+    async def get_applicants_by_ids(self, applicant_ids: List[str]) -> List[Dict]:
+        ...
+    
+    @abc.abstractmethod
+    async def list_projects_in_bounds(self, bbox: Optional[Dict[str, float]] = None,
+                                      company_id: Optional[str] = None) -> List[Dict]:
+        """Projects inside a lat/lng bounding box (all projects when bbox is None), optionally for one company"""
+    
+    @abc.abstractmethod
+    async def list_applicants_in_bounds(self, bbox: Optional[Dict[str, float]] = None) -> List[Dict]:
+        """Applicants inside a lat/lng bounding box (all applicants when bbox is None)"""
+    
+    @abc.abstractmethod
+    async def _heatmap_aggregates_sql(self, bbox: Optional[Dict[str, float]], resolution: float) -> Dict[str, Any]:
+        ...
+    
+    async def heatmap_aggregates(self, bbox: Optional[Dict[str, float]] = None,
+                                 resolution: float = HEATMAP_CLUSTER_DEGREES,
+                                 layer: str = "demand") -> Dict[str, Any]:
+        """Grid zones of a heatmap layer and supply totals inside a bounding box.
+        
+        Returns {'zones': [{lat, lng, <counts>}], 'total_applicants',
+        'total_projects', 'total_units', 'total_affordable_units'}. Zones carry
+        the layer's HeatmapBinning.LAYER_COUNTS: applicant_count, total_income
+        and total_household_size for "demand", project_count, total_units and
+        affordable_units for "supply", all six for "gap". Demand is computed by
+        the heatmap_aggregates() SQL function; other layers, and demand when
+        that is disabled or fails, aggregate the bounded rows here.
+        """
+        if HEATMAP_SQL_AGGREGATION and layer == "demand":
+            try:
+                return await self._heatmap_aggregates_sql(bbox, resolution)
+            except Exception as e:
+                if not self._heatmap_sql_warned:
+                    self._heatmap_sql_warned = True
+                    logger.warning(f"⚠️ heatmap_aggregates() failed ({e}) - aggregating in Python; "
+                                   "apply supabase_heatmap_aggregation.sql or set HEATMAP_SQL_AGGREGATION=false")
+        started = time.perf_counter()
+        projects, applicants = await asyncio.gather(
+            self.list_projects_in_bounds(bbox), self.list_applicants_in_bounds(bbox)
+        )
+        zones: Dict[tuple, Dict[str, Any]] = {}
+        for kind, rows in (('applicant', applicants), ('project', projects)):
+            if kind not in HeatmapBinning.LAYER_SOURCES[layer]:
+                continue
+            for row in rows:
+                lat, lng = row.get("latitude"), row.get("longitude")
+                if lat and lng:
+                    cell = (round(round(lat / resolution) * resolution, 6), round(round(lng / resolution) * resolution, 6))
+                    if cell not in zones:
+                        zones[cell] = {"lat": cell[0], "lng": cell[1], **dict.fromkeys(HeatmapBinning.LAYER_COUNTS[layer], 0)}
+                    zone = zones[cell]
+                    for name, value in HeatmapBinning.contribution(kind, row).items():
+                        zone[name] += value
+        self._record("heatmap_aggregates_python", started)
+        return {"zones": list(zones.values()), **self._heatmap_totals(projects, applicants)}
+    
+    @staticmethod
+    def _heatmap_totals(projects: List[Dict], applicants: List[Dict]) -> Dict[str, Any]:
+        return {
+            "total_applicants": len(applicants),
+            "total_projects": len(projects),
+            "total_units": sum(p.get("total_units") or 0 for p in projects),
+            "total_affordable_units": sum(p.get("affordable_units") or 0 for p in projects)
+        }
+    
+    @abc.abstractmethod
+    async def list_heatmap_cells(self, bbox: Optional[Dict[str, float]] = None,
+                                 company_id: Optional[str] = None) -> List[Dict]:
+        """heatmap_cells rows whose centre is inside a bounding box (every cell, including
+        the unlocated cell 0, when bbox is None), optionally for one company"""
+    
+    @abc.abstractmethod
+    async def _heatmap_hex_aggregates_sql(self, bbox: Optional[Dict[str, float]], resolution: int,
+                                          max_zones: int, layer: str) -> Dict[str, Any]:
+        ...
+    
+    async def heatmap_hex_aggregates(self, bbox: Optional[Dict[str, float]] = None,
+                                     resolution: int = HEATMAP_H3_BASE_RESOLUTION,
+                                     max_zones: int = HEATMAP_MAX_ZONES,
+                                     layer: str = "demand") -> Optional[Dict[str, Any]]:
+        """heatmap_aggregates with a layer's zones binned into H3 hexagons.
+        
+        Zones also carry `cell` (the H3 index as an integer) and the result
+        the `resolution` they were rolled up to, at most `resolution` and
+        coarse enough for at most `max_zones` zones. Computed by the
+        heatmap_hex_aggregates() SQL function (h3 extension), else from the
+        bounded rows with the h3 package. None when neither is available.
+        """
+        if HEATMAP_SQL_AGGREGATION:
+            try:
+                return await self._heatmap_hex_aggregates_sql(bbox, resolution, max_zones, layer)
+            except Exception as e:
+                if not self._heatmap_hex_sql_warned:
+                    self._heatmap_hex_sql_warned = True
+                    logger.warning(f"⚠️ heatmap_hex_aggregates() failed ({e}) - binning in Python; "
+                                   "apply supabase_heatmap_hex.sql or set HEATMAP_SQL_AGGREGATION=false")
+        if not H3_AVAILABLE:
+            return None
+        started = time.perf_counter()
+        projects, applicants = await asyncio.gather(
+            self.list_projects_in_bounds(bbox), self.list_applicants_in_bounds(bbox)
+        )
+        level, zones = heatmap_binning.bin(applicants, resolution, max_zones, projects, layer)
+        self._record("heatmap_hex_aggregates_python", started)
+        return {"zones": zones, "resolution": level, **self._heatmap_totals(projects, applicants)}
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "operations": {name: stats.snapshot() for name, stats in self.latency.items()}
+        }
+
+def postgrest_or(query, expression: str):
+    """Add an or=(...) filter; the pinned postgrest-py (0.13) has no or_()"""
+    if hasattr(query, 'or_'):
+        return query.or_(expression)
+    query.params = query.params.add('or', f"({expression})")
+    return query
+
+class SupabaseRepository(Repository):
+    """Repository over PostgREST using the async data access layer"""
+    
+    backend = "supabase"
+    
+    def __init__(self, database: AsyncSupabaseDB, page_size: int = SUPABASE_PAGE_SIZE):
+        super().__init__()
+        self.db = database
+        self.page_size = max(1, page_size)
+    
+    async def _select_all(self, build, key: tuple = ('id',)) -> List[Dict]:
+        """Every row of the query `build()` returns, read in pages keyed on `key` columns.
+        
+        PostgREST silently truncates unpaged responses at its max-rows
+        setting. Keyset pages (key > last key) stay exact while rows are
+        inserted or deleted between requests.
+        """
+        rows: List[Dict] = []
+        while True:
+            query = build().order(','.join(key)).limit(self.page_size)
+            if rows:
+                query = self._after(query, key, rows[-1])
+            page = (await query.execute()).data or []
+            rows += page
+            if len(page) < self.page_size:
+                return rows
+    
+    @staticmethod
+    def _after(query, key: tuple, row: Dict):
+        """Rows whose `key` columns sort after `row`'s"""
+        if len(key) == 1:
+            return query.gt(key[0], row[key[0]])
+        # (a, b) > (x, y)  <=>  a > x OR (a = x AND b > y)
+        branches = []
+        for i, column in enumerate(key):
+            conditions = [f"{earlier}.eq.{row[earlier]}" for earlier in key[:i]] + [f"{column}.gt.{row[column]}"]
+            branches.append(conditions[0] if len(conditions) == 1 else f"and({','.join(conditions)})")
+        return postgrest_or(query, ','.join(branches))
+    
+    @staticmethod
+    def _in_bounds(query, bbox: Optional[Dict[str, float]]):
+        if bbox:
+            query = query.gte('latitude', bbox['lat1']).lte('latitude', bbox['lat2'])
+            query = query.gte('longitude', bbox['lng1']).lte('longitude', bbox['lng2'])
+        return query
+    
+    async def list_applicants(self, company_id: str, skip: int, limit: int, search: Optional[str] = None) -> List[Dict]:
+        started = time.perf_counter()
+        query = self.db.table('applicants').select('*').eq('company_id', company_id)
+        if search:
+            query = postgrest_or(query, f"full_name.ilike.%{search}%,email.ilike.%{search}%")
+        result = await query.range(skip, skip + limit - 1).execute()
+        self._record("list_applicants", started)
+        return result.data or []
+    
+    async def list_projects(self, skip: int, limit: int, search: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+        started = time.perf_counter()
+        query = self.db.table('projects').select('*, companies(*)')
+        if search:
+            query = postgrest_or(query, f"name.ilike.%{search}%,description.ilike.%{search}%,location.ilike.%{search}%")
+        if status:
+            query = query.eq('status', status)
+        result = await query.range(skip, skip + limit - 1).execute()
+        self._record("list_projects", started)
+        return result.data or []
+    
+    async def get_applicant(self, applicant_id: str) -> Optional[Dict]:
+        started = time.perf_counter()
+        result = await self.db.table('applicants').select('*').eq('id', applicant_id).maybe_single().execute()
+        self._record("get_applicant", started)
+        return result.data if result else None
+    
+    async def get_project(self, project_id: str) -> Optional[Dict]:
+        started = time.perf_counter()
+        result = await self.db.table('projects').select('*').eq('id', project_id).maybe_single().execute()
+        self._record("get_project", started)
+        return result.data if result else None
+    
+    async def list_projects_by_status(self, status: str) -> List[Dict]:
+        started = time.perf_counter()
+        rows = await self._select_all(lambda: self.db.table('projects').select('*').eq('status', status))
+        self._record("list_projects_by_status", started)
+        return rows
+    
+    async def list_all_applicants(self) -> List[Dict]:
+        started = time.perf_counter()
+        rows = await self._select_all(lambda: self.db.table('applicants').select('*'))
+        self._record("list_all_applicants", started)
+        return rows
+    
+    @staticmethod
+    def _prefilter_expression(prefilter: Dict[str, Dict]) -> str:
+        """PostgREST or=(...) expression for applicant_prefilter branches"""
+        branches = []
+        for name, branch in prefilter.items():
+            conditions = []
+            if name == 'near':
+                bbox = branch['bbox']
+                conditions += [f"latitude.gte.{bbox['lat1']}", f"latitude.lte.{bbox['lat2']}",
+                               f"longitude.gte.{bbox['lng1']}", f"longitude.lte.{bbox['lng2']}"]
+            elif name == 'unlocated':
+                conditions.append("or(latitude.is.null,longitude.is.null,latitude.eq.0,longitude.eq.0)")
+            if branch['max_income'] is not None:
+                conditions.append(f"income.lte.{math.ceil(branch['max_income'])}")
+            if conditions:
+                branches.append(conditions[0] if len(conditions) == 1 else f"and({','.join(conditions)})")
+        return ",".join(branches)
+    
+    async def list_match_candidates(self, company_id: Optional[str], prefilter: Optional[Dict[str, Dict]]) -> List[Dict]:
+        if prefilter is not None and not prefilter:
+            return []
+        started = time.perf_counter()
+        
+        def build():
+            query = self.db.table('applicants').select(','.join(self.MATCH_COLUMNS))
+            if company_id is not None:
+                query = query.eq('company_id', company_id)
+            if prefilter:
+                query = postgrest_or(query, self._prefilter_expression(prefilter))
+            return query
+        
+        rows = await self._select_all(build)
+        self._record("list_match_candidates", started)
+        return rows
+    
+    async def get_applicants_by_ids(self, applicant_ids: List[str]) -> List[Dict]:
+        if not applicant_ids:
+            return []
+        started = time.perf_counter()
+        result = await self.db.table('applicants').select('*').in_('id', applicant_ids).execute()
+        self._record("get_applicants_by_ids", started)
+        return result.data or []
+    
+    async def list_projects_in_bounds(self, bbox: Optional[Dict[str, float]] = None,
+                                      company_id: Optional[str] = None) -> List[Dict]:
+        started = time.perf_counter()
+        
+        def build():
+            query = self._in_bounds(self.db.table('projects').select('*'), bbox)
+            if company_id is not None:
+                query = query.eq('company_id', company_id)
+            return query
+        
+        rows = await self._select_all(build)
+        self._record("list_projects_in_bounds", started)
+        return rows
+    
+    async def list_applicants_in_bounds(self, bbox: Optional[Dict[str, float]] = None) -> List[Dict]:
+        started = time.perf_counter()
+        rows = await self._select_all(lambda: self._in_bounds(self.db.table('applicants').select('*'), bbox))
+        self._record("list_applicants_in_bounds", started)
+        return rows
+    
+    async def _heatmap_aggregates_sql(self, bbox: Optional[Dict[str, float]], resolution: float) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result = await self.db.rpc('heatmap_aggregates', {**(bbox or {}), 'resolution': resolution}).execute()
+        self._record("heatmap_aggregates", started)
+        return result.data
+    
+    async def _heatmap_hex_aggregates_sql(self, bbox: Optional[Dict[str, float]], resolution: int,
+                                          max_zones: int, layer: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result = await self.db.rpc('heatmap_hex_aggregates', {
+            **(bbox or {}), 'resolution': resolution,
+            'base_resolution': HEATMAP_H3_BASE_RESOLUTION, 'max_zones': max_zones, 'layer': layer
+        }).execute()
+        self._record("heatmap_hex_aggregates", started)
+        return result.data
+    
+    async def list_heatmap_cells(self, bbox: Optional[Dict[str, float]] = None,
+                                 company_id: Optional[str] = None) -> List[Dict]:
+        started = time.perf_counter()
+        
+        def build():
+            query = self._in_bounds(self.db.table('heatmap_cells').select('*'), bbox)
+            if company_id is not None:
+                query = query.eq('company_id', company_id)
+            return query
+        
+        rows = await self._select_all(build, key=('company_id', 'cell'))
+        self._record("list_heatmap_cells", started)
+        return rows
+
+class AsyncpgRepository(Repository):
+    """Repository over a direct Postgres connection pool.
+    
+    Every query is a fixed SQL string; optional filters are folded in with
+    `$n IS NULL OR ...`. asyncpg prepares each statement once per connection
+    and reuses it from its statement cache. Set ASYNCPG_STATEMENT_CACHE_SIZE=0
+    when connecting through a transaction-mode pooler (pgbouncer/Supavisor on
+    port 6543), because those poolers cannot keep prepared statements.
+    """
+    
+    backend = "asyncpg"
+    
+    BOUNDS_FILTER = """($1::float8 IS NULL OR (
+            latitude >= $1::float8 AND latitude <= $2::float8
+            AND longitude >= $3::float8 AND longitude <= $4::float8))"""
+    
+    SQL = {
+        "list_applicants": """
+            SELECT * FROM applicants
+            WHERE company_id = $1::uuid
+              AND ($2::text IS NULL OR full_name ILIKE $2 OR email ILIKE $2)
+            OFFSET $3 LIMIT $4""",
+        "list_projects": """
+            SELECT p.*, to_jsonb(c) AS companies
+            FROM projects p LEFT JOIN companies c ON c.id = p.company_id
+            WHERE ($1::text IS NULL OR p.name ILIKE $1 OR p.description ILIKE $1 OR p.location ILIKE $1)
+              AND ($2::text IS NULL OR p.status = $2)
+            OFFSET $3 LIMIT $4""",
+        "get_applicant": "SELECT * FROM applicants WHERE id = $1::uuid",
+        "get_project": "SELECT * FROM projects WHERE id = $1::uuid",
+        "list_projects_by_status": "SELECT * FROM projects WHERE status = $1",
+        "list_all_applicants": "SELECT * FROM applicants",
+        "list_match_candidates": f"""
+            SELECT {', '.join(Repository.MATCH_COLUMNS)} FROM applicants
+            WHERE ($1::uuid IS NULL OR company_id = $1::uuid)
+              AND (NOT $2::bool
+                OR ($3::bool AND latitude >= $4::float8 AND latitude <= $5::float8
+                    AND longitude >= $6::float8 AND longitude <= $7::float8
+                    AND ($8::float8 IS NULL OR income <= $8::float8))
+                OR ($9::bool AND (latitude IS NULL OR longitude IS NULL OR latitude = 0 OR longitude = 0)
+                    AND ($10::float8 IS NULL OR income <= $10::float8))
+                OR ($11::bool AND ($12::float8 IS NULL OR income <= $12::float8)))""",
+        "get_applicants_by_ids": "SELECT * FROM applicants WHERE id = ANY($1::uuid[])",
+        "list_projects_in_bounds": f"""
+            SELECT * FROM projects
+            WHERE {BOUNDS_FILTER} AND ($5::uuid IS NULL OR company_id = $5::uuid)""",
+        "list_applicants_in_bounds": f"SELECT * FROM applicants WHERE {BOUNDS_FILTER}",
+        "heatmap_aggregates": """
+            SELECT heatmap_aggregates(lat1 => $1::float8, lat2 => $2::float8, lng1 => $3::float8,
+                                      lng2 => $4::float8, resolution => $5::numeric) AS aggregates""",
+        "heatmap_hex_aggregates": """
+            SELECT heatmap_hex_aggregates(lat1 => $1::float8, lat2 => $2::float8, lng1 => $3::float8,
+                                          lng2 => $4::float8, resolution => $5::int,
+                                          base_resolution => $6::int, max_zones => $7::int,
+                                          layer => $8::text) AS aggregates""",
+        "list_heatmap_cells": f"""
+            SELECT * FROM heatmap_cells
+            WHERE {BOUNDS_FILTER} AND ($5::uuid IS NULL OR company_id = $5::uuid)"""
+    }
+    
+    def __init__(self, dsn: str):
+        super().__init__()
+        self.dsn = dsn
+        self.pool = None
+    
+    @staticmethod
+    async def _init_connection(conn) -> None:
+        # Decode json/jsonb columns to Python objects, like PostgREST does
+        for json_type in ("json", "jsonb"):
+            await conn.set_type_codec(json_type, encoder=json.dumps, decoder=json.loads, schema="pg_catalog")
+    
+    async def start(self) -> None:
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=ASYNCPG_POOL_MIN_SIZE,
+                max_size=ASYNCPG_POOL_MAX_SIZE,
+                statement_cache_size=ASYNCPG_STATEMENT_CACHE_SIZE,
+                command_timeout=ASYNCPG_COMMAND_TIMEOUT,
+                init=self._init_connection
+            )
+            logger.info(f"🐘 asyncpg repository pool ready ({ASYNCPG_POOL_MIN_SIZE}-{ASYNCPG_POOL_MAX_SIZE} connections)")
+    
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+    
+    @staticmethod
+    def _value(value: Any) -> Any:
+        """Convert a Postgres value to the JSON-compatible form PostgREST returns"""
+        if isinstance(value, uuid.UUID):
+            return str(value)
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return int(value) if value == value.to_integral_value() else float(value)
+        return value
+    
+    def _row(self, record) -> Dict:
+        return {key: self._value(value) for key, value in record.items()}
+    
+    async def _fetch(self, operation: str, *args) -> List[Dict]:
+        if self.pool is None:
+            await self.start()
+        started = time.perf_counter()
+        records = await self.pool.fetch(self.SQL[operation], *args)
+        self._record(operation, started)
+        return [self._row(record) for record in records]
+    
+    @staticmethod
+    def _pattern(search: Optional[str]) -> Optional[str]:
+        return f"%{search}%" if search else None
+    
+    @staticmethod
+    def _bounds_args(bbox: Optional[Dict[str, float]]) -> tuple:
+        if not bbox:
+            return (None, None, None, None)
+        return (bbox['lat1'], bbox['lat2'], bbox['lng1'], bbox['lng2'])
+    
+    async def list_applicants(self, company_id: str, skip: int, limit: int, search: Optional[str] = None) -> List[Dict]:
+        return await self._fetch("list_applicants", company_id, self._pattern(search), skip, limit)
+    
+    async def list_projects(self, skip: int, limit: int, search: Optional[str] = None, status: Optional[str] = None) -> List[Dict]:
+        return await self._fetch("list_projects", self._pattern(search), status, skip, limit)
+    
+    async def get_applicant(self, applicant_id: str) -> Optional[Dict]:
+        rows = await self._fetch("get_applicant", applicant_id)
+        return rows[0] if rows else None
+    
+    async def get_project(self, project_id: str) -> Optional[Dict]:
+        rows = await self._fetch("get_project", project_id)
+        return rows[0] if rows else None
+    
+    async def list_projects_by_status(self, status: str) -> List[Dict]:
+        return await self._fetch("list_projects_by_status", status)
+    
+    async def list_all_applicants(self) -> List[Dict]:
+        return await self._fetch("list_all_applicants")
+    
+    @staticmethod
+    def _prefilter_args(prefilter: Optional[Dict[str, Dict]]) -> tuple:
+        def cap(branch: Optional[Dict]) -> Optional[float]:
+            return float(math.ceil(branch['max_income'])) if branch and branch['max_income'] is not None else None
+        
+        prefilter = prefilter or {}
+        near, unlocated, anywhere = prefilter.get('near'), prefilter.get('unlocated'), prefilter.get('any')
+        bbox = near['bbox'] if near else {'lat1': None, 'lat2': None, 'lng1': None, 'lng2': None}
+        return (
+            bool(prefilter),
+            near is not None, bbox['lat1'], bbox['lat2'], bbox['lng1'], bbox['lng2'], cap(near),
+            unlocated is not None, cap(unlocated),
+            anywhere is not None, cap(anywhere)
+        )
+    
+    async def list_match_candidates(self, company_id: Optional[str], prefilter: Optional[Dict[str, Dict]]) -> List[Dict]:
+        if prefilter is not None and not prefilter:
+            return []
+        return await self._fetch("list_match_candidates", company_id, *self._prefilter_args(prefilter))
+    
+    async def get_applicants_by_ids(self, applicant_ids: List[str]) -> List[Dict]:
+        if not applicant_ids:
+            return []
+        return await self._fetch("get_applicants_by_ids", applicant_ids)
+    
+    async def list_projects_in_bounds(self, bbox: Optional[Dict[str, float]] = None,
+                                      company_id: Optional[str] = None) -> List[Dict]:
+        return await self._fetch("list_projects_in_bounds", *self._bounds_args(bbox), company_id)
+    
+    async def list_applicants_in_bounds(self, bbox: Optional[Dict[str, float]] = None) -> List[Dict]:
+        return await self._fetch("list_applicants_in_bounds", *self._bounds_args(bbox))
+    
+    async def _heatmap_aggregates_sql(self, bbox: Optional[Dict[str, float]], resolution: float) -> Dict[str, Any]:
+        rows = await self._fetch("heatmap_aggregates", *self._bounds_args(bbox), Decimal(str(resolution)))
+        return rows[0]["aggregates"]
+    
+    async def _heatmap_hex_aggregates_sql(self, bbox: Optional[Dict[str, float]], resolution: int,
+                                          max_zones: int, layer: str) -> Dict[str, Any]:
+        rows = await self._fetch("heatmap_hex_aggregates", *self._bounds_args(bbox),
+                                 resolution, HEATMAP_H3_BASE_RESOLUTION, max_zones, layer)
+        return rows[0]["aggregates"]
+    
+    async def list_heatmap_cells(self, bbox: Optional[Dict[str, float]] = None,
+                                 company_id: Optional[str] = None) -> List[Dict]:
+        return await self._fetch("list_heatmap_cells", *self._bounds_args(bbox), company_id)
+    
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        if self.pool is not None:
+            stats["pool"] = {"size": self.pool.get_size(), "idle": self.pool.get_idle_size()}
+        return stats
+
+def create_repository(backend: str = DATABASE_BACKEND, dsn: Optional[str] = SUPABASE_DB_URL) -> Repository:
+    """Build the configured repository, falling back to PostgREST when asyncpg cannot be used"""
+    if backend == "asyncpg":
+        if not ASYNCPG_AVAILABLE:
+            logger.warning("⚠️ DATABASE_BACKEND=asyncpg but asyncpg is not installed - using Supabase repository")
+        elif not dsn:
+            logger.warning("⚠️ DATABASE_BACKEND=asyncpg but SUPABASE_DB_URL is not set - using Supabase repository")
+        else:
+            return AsyncpgRepository(dsn)
+    elif backend != "supabase":
+        logger.warning(f"⚠️ Unknown DATABASE_BACKEND '{backend}' - using Supabase repository")
+    return SupabaseRepository(db)
+
+# Initialize repository for hot read paths
+repository = create_repository()
+logger.info(f"🗄️ Repository backend: {repository.backend}")
+
 # PII Encryption Service
 class PIIEncryption:
     def __init__(self):
@@ -146,7 +1205,7 @@ async def send_notification_email(
         # Check user preferences if user_id provided
         if user_id and notification_type:
             try:
-                user_prefs = supabase.table('profiles').select('*').eq('id', user_id).single().execute()
+                user_prefs = await db.table('profiles').select('*').eq('id', user_id).single().execute()
                 if user_prefs.data:
                     # Check specific notification preferences
                     pref_key = f"email_{notification_type}"
@@ -161,7 +1220,7 @@ async def send_notification_email(
         resend.api_key = RESEND_API_KEY
         
         # Send email using Resend
-        response = resend.Emails.send({
+        response = await offloader.run("email", resend.Emails.send, {
             "from": "HomeVerse <noreply@homeverse.io>",
             "to": [to_email],
             "subject": subject,
@@ -172,7 +1231,7 @@ async def send_notification_email(
         
         # Log notification activity in database
         try:
-            supabase.table('activities').insert({
+            await activity_logger.log({
                 'action': 'email_sent',
                 'resource_type': 'notification',
                 'details': {
@@ -181,7 +1240,7 @@ async def send_notification_email(
                     'notification_type': notification_type,
                     'status': 'sent'
                 }
-            }).execute()
+            })
         except Exception as e:
             logger.warning(f"📧 Could not log email activity: {e}")
         
@@ -197,29 +1256,47 @@ app = FastAPI(title="HomeVerse API", version="2.0.0")
 # Rate limiting configuration
 def get_user_id_or_ip(request: Request):
     """Get user ID for authenticated users, IP for anonymous"""
-    # Try to get authenticated user from header
-    auth = request.headers.get("Authorization")
-    if auth and auth.startswith("Bearer "):
-        try:
-            token = auth.replace("Bearer ", "")
-            # Decode JWT to get user ID (don't verify here, just extract)
-            payload = jwt.decode(token, options={"verify_signature": False})
-            user_id = payload.get("sub")
-            if user_id:
-                return f"user:{user_id}"
-        except:
-            pass
+    # Reuse the claims verified once per request by the auth middleware
+    claims = get_request_auth(request)["claims"]
+    if claims and claims.get("sub"):
+        return f"user:{claims['sub']}"
     # Fall back to IP address
     forwarded_for = request.headers.get("X-Forwarded-For")
     if forwarded_for:
         return forwarded_for.split(",")[0].strip()
     return request.client.host if request.client else "unknown"
 
+# Rate limit storage: a shared backend (Redis protocol) keeps limits global
+# across workers; memory:// keeps per-process counters for local development
+RATE_LIMIT_STORAGE_URI = os.getenv("RATE_LIMIT_STORAGE_URI") or os.getenv("REDIS_URL") or "memory://"
+RATE_LIMIT_STRATEGY = os.getenv("RATE_LIMIT_STRATEGY", "sliding-window-counter")
+
+def create_rate_limiter(
+    storage_uri: str = RATE_LIMIT_STORAGE_URI,
+    strategy: str = RATE_LIMIT_STRATEGY,
+    storage_options: Optional[Dict[str, Any]] = None
+) -> Limiter:
+    """Build the limiter on a pluggable `limits` storage backend.
+    
+    Any storage URI supported by `limits` works (memory://, redis://,
+    rediss://, redis+sentinel://, redis+cluster://, ...). With the Redis
+    backends, sliding-window-counter increments and reads happen in a single
+    scripted round trip per check. If the shared store becomes unreachable,
+    the limiter falls back to in-memory counters instead of failing requests.
+    """
+    return Limiter(
+        key_func=get_user_id_or_ip,
+        default_limits=["1000 per hour"],  # Global default limit
+        storage_uri=storage_uri,
+        storage_options=storage_options or {},
+        strategy=strategy,
+        key_prefix="homeverse",
+        in_memory_fallback_enabled=not storage_uri.startswith("memory://"),
+    )
+
 # Initialize rate limiter
-limiter = Limiter(
-    key_func=get_user_id_or_ip,
-    default_limits=["1000 per hour"],  # Global default limit
-)
+limiter = create_rate_limiter()
+logger.info(f"🚦 Rate limiter using {RATE_LIMIT_STORAGE_URI.split('://')[0]} storage ({RATE_LIMIT_STRATEGY})")
 
 app.state.limiter = limiter
 
@@ -241,6 +1318,14 @@ async def rate_limit_handler(request: Request, exc: RateLimitExceeded):
     response.headers["X-RateLimit-Reset"] = str(exc.limit.reset_at)
     return response
 
+# Parse the bearer token once per request and share it via request.state
+@app.middleware("http")
+async def bearer_token_middleware(request: Request, call_next):
+    parsed = get_request_auth(request)
+    response = await call_next(request)
+    response.headers["Server-Timing"] = f"jwt;dur={parsed['decode_ms']:.3f}"
+    return response
+
 # CORS configuration - Environment-based for security
 # Development CORS
 CORS_ORIGINS_DEV = [
@@ -396,6 +1481,11 @@ class ApplicationUpdate(BaseModel):
     reviewed_by: Optional[str] = None
     reviewed_at: Optional[str] = None
 
+class BulkMatchRequest(BaseModel):
+    output: str = "stream"  # "stream" (NDJSON response) or "table" (write to matches)
+    limit: int = 20
+    min_score: float = 0
+
 class InvestmentCreate(BaseModel):
     project_id: str
     amount: float
@@ -410,78 +1500,772 @@ class InvestmentUpdate(BaseModel):
     actual_return: Optional[float] = None
     notes: Optional[str] = None
 
-# Authentication Helpers
-async def get_current_user(authorization: str = Header(None)):
-    """Get current user from JWT token with automatic profile creation"""
-    if not authorization or not authorization.startswith("Bearer "):
-        raise HTTPException(status_code=401, detail="Not authenticated")
+# JWT Verification Service
+class SupabaseJWTVerifier:
+    """Verify Supabase access tokens locally against cached signing keys.
     
-    token = authorization.replace("Bearer ", "")
+    HS256 tokens are checked against the project's JWT secret. Asymmetric
+    tokens (RS256/ES256) are checked against the project's JWKS, which is
+    cached and refreshed every `refresh_seconds`. `verify` returns None when
+    the signing key is unknown so callers can fall back to the auth server.
     
-    try:
-        # Verify token with Supabase
-        user = supabase.auth.get_user(token)
-        
-        if not user.user:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        # Get user profile with company info
-        profile = supabase.table('profiles').select('*, companies(*)').eq('id', user.user.id).single().execute()
-        
-        if not profile.data or not profile.data.get('company_id'):
-            # Profile missing or incomplete - fix it
-            logger.warning(f"Incomplete profile for user {user.user.email}, attempting to fix...")
-            
-            # Get default company
-            default_company = supabase.table('companies').select('*').eq('key', 'default-company').single().execute()
-            if not default_company.data:
-                # Create default company
-                default_company = supabase.table('companies').insert({
-                    "name": "Default Company",
-                    "key": "default-company",
-                    "plan": "trial",
-                    "seats": 100
-                }).execute()
-                company_id = default_company.data[0]['id']
-            else:
-                company_id = default_company.data['id']
-            
-            if not profile.data:
-                # Create new profile
-                new_profile = supabase.table('profiles').insert({
-                    "id": user.user.id,
-                    "company_id": company_id,
-                    "role": user.user.user_metadata.get('role', 'buyer'),
-                    "full_name": user.user.user_metadata.get('full_name', user.user.email)
-                }).execute()
-            else:
-                # Update existing profile with company_id
-                supabase.table('profiles').update({
-                    "company_id": company_id
-                }).eq('id', user.user.id).execute()
-            
-            # Re-fetch profile
-            profile = supabase.table('profiles').select('*, companies(*)').eq('id', user.user.id).single().execute()
+    `verify` runs on the event loop, so it never fetches: a stale key set (or
+    an unknown kid) starts one background refresh on the shared async HTTP
+    pool and the cached keys keep being served until it completes.
+    """
+    ASYMMETRIC_ALGORITHMS = ["RS256", "ES256", "EdDSA"]
+    
+    def __init__(self, jwt_secret: Optional[str], jwks_url: Optional[str], audience: str, refresh_seconds: int = 600):
+        self.jwt_secret = jwt_secret
+        self.jwks_url = jwks_url
+        self.audience = audience
+        self.refresh_seconds = refresh_seconds
+        self._keys: Dict[str, Any] = {}
+        self._keys_fetched_at = 0.0
+        # Don't hammer the JWKS endpoint when tokens carry an unknown kid
+        self._min_refetch_interval = 30.0
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._client: Optional[httpx.AsyncClient] = None
+        self.stats = {"local": 0, "unknown_key": 0, "jwks_refreshes": 0, "jwks_errors": 0}
+        logger.info(
+            f"🔑 JWT verifier initialized (secret: {'yes' if jwt_secret else 'no'}, jwks: {jwks_url or 'disabled'})"
+        )
+    
+    async def start(self) -> None:
+        """Load the signing keys before the first request"""
+        if self.jwks_url:
+            await self._refresh_jwks()
+    
+    async def _refresh_jwks(self) -> None:
+        """Fetch the JWKS and replace the cached signing keys"""
+        self._keys_fetched_at = time.monotonic()
+        if self._client is None:
+            self._client = http_pools.async_client("jwks")
+        try:
+            response = await self._client.get(self.jwks_url, timeout=5.0)
+            response.raise_for_status()
+            keys = {}
+            for jwk_data in response.json().get("keys", []):
+                try:
+                    jwk = jwt.PyJWK(jwk_data)
+                except Exception as e:
+                    logger.warning(f"🔑 Skipping unsupported JWKS key {jwk_data.get('kid')}: {e}")
+                    continue
+                keys[jwk_data.get("kid")] = jwk
+            self._keys = keys
+            self.stats["jwks_refreshes"] += 1
+        except Exception as e:
+            # Keep serving the previously cached keys
+            self.stats["jwks_errors"] += 1
+            logger.warning(f"🔑 Could not refresh JWKS from {self.jwks_url}: {e}")
+    
+    def _get_signing_key(self, kid: Optional[str]):
+        """Return the cached JWK for `kid`, refreshing the key set when stale"""
+        if not self.jwks_url:
+            return None
+        age = time.monotonic() - self._keys_fetched_at
+        if age > self.refresh_seconds or (kid not in self._keys and age > self._min_refetch_interval):
+            self._schedule_refresh()
+        return self._keys.get(kid)
+    
+    def _schedule_refresh(self) -> None:
+        """Start a background JWKS refresh unless one is already running"""
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        # Stamp now so concurrent stale lookups don't queue more refreshes
+        self._keys_fetched_at = time.monotonic()
+        self._refresh_task = loop.create_task(self._refresh_jwks())
+    
+    def verify(self, token: str) -> Optional[Dict[str, Any]]:
+        """Verify signature, expiry and audience of a token.
+        
+        Returns the verified claims, or None if the signing key is unknown.
+        Raises jwt.InvalidTokenError if the token is invalid.
+        """
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get("alg")
+        options = {"require": ["exp", "sub"]}
+        
+        if algorithm == "HS256":
+            if not self.jwt_secret:
+                self.stats["unknown_key"] += 1
+                return None
+            claims = jwt.decode(token, self.jwt_secret, algorithms=["HS256"], audience=self.audience, options=options)
+        elif algorithm in self.ASYMMETRIC_ALGORITHMS:
+            jwk = self._get_signing_key(header.get("kid"))
+            if jwk is None:
+                self.stats["unknown_key"] += 1
+                return None
+            claims = jwt.decode(token, jwk.key, algorithms=[algorithm], audience=self.audience, options=options)
+        else:
+            raise jwt.InvalidAlgorithmError(f"Unsupported token algorithm: {algorithm}")
         
+        self.stats["local"] += 1
+        return claims
+
+# Per-request bearer token decode/verify cost
+jwt_decode_stats = LatencyStats()
+
+# Initialize JWT verifier
+jwt_verifier = SupabaseJWTVerifier(
+    jwt_secret=SUPABASE_JWT_SECRET,
+    jwks_url=SUPABASE_JWKS_URL,
+    audience=SUPABASE_JWT_AUDIENCE,
+    refresh_seconds=SUPABASE_JWKS_REFRESH_SECONDS
+)
+
+def decode_bearer_token(token: str) -> Dict[str, Any]:
+    """Verify a bearer token once, capturing claims or the verification error"""
+    try:
+        return {"token": token, "claims": jwt_verifier.verify(token), "error": None}
+    except jwt.InvalidTokenError as e:
+        return {"token": token, "claims": None, "error": e}
+
+async def verify_access_token(token: str, parsed: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Verify an access token and return the authenticated identity.
+    
+    Tokens are verified locally; the Supabase auth server is only called
+    when the token's signing key is not known locally. Pass `parsed` (the
+    result of decode_bearer_token) to reuse an earlier decode.
+    """
+    if parsed is None:
+        parsed = decode_bearer_token(token)
+    if parsed["error"] is not None:
+        raise HTTPException(status_code=401, detail="Invalid token") from parsed["error"]
+    
+    claims = parsed["claims"]
+    if claims is not None:
         return {
-            "id": user.user.id,
-            "email": user.user.email,
-            "role": profile.data.get('role', 'buyer'),
-            "company_id": profile.data.get('company_id'),
-            "company": profile.data.get('companies'),
-            "full_name": profile.data.get('full_name')
+            "id": claims["sub"],
+            "email": claims.get("email"),
+            "user_metadata": claims.get("user_metadata") or {}
         }
-    except HTTPException:
-        raise
-    except Exception as e:
-        logger.error(f"Auth error: {str(e)}")
-        raise HTTPException(status_code=401, detail="Authentication failed")
+    
+    # Unknown signing key - fall back to remote verification (sync SDK call)
+    user = await offloader.run("auth", supabase.auth.get_user, token)
+    if not user or not user.user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return {
+        "id": user.user.id,
+        "email": user.user.email,
+        "user_metadata": user.user.user_metadata or {}
+    }
 
-# Role-based access decorator
-def require_role(allowed_roles: List[str]):
-    def decorator(func):
-        @wraps(func)
-        async def wrapper(*args, user=None, **kwargs):
+# Principal Cache
+class PrincipalCache:
+    """In-process LRU + TTL cache of resolved principals keyed by user id.
+    
+    Entries must be invalidated whenever a profile's role, company or name
+    changes, or when a company row changes; the TTL bounds staleness for
+    changes made by other workers.
+    """
+    
+    def __init__(self, ttl_seconds: float = 30.0, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return a copy of the cached principal, or None on miss/expiry"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return dict(entry[1])
+    
+    def set(self, user_id: str, principal: Dict[str, Any]) -> None:
+        """Cache a principal, evicting the least recently used entry if full"""
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl_seconds, dict(principal))
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def invalidate(self, user_id: str) -> None:
+        """Drop the cached principal for a user"""
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+    
+    def invalidate_company(self, company_id: str) -> None:
+        """Drop every cached principal that belongs to a company"""
+        with self._lock:
+            stale = [uid for uid, (_, p) in self._entries.items() if p.get('company_id') == company_id]
+            for uid in stale:
+                del self._entries[uid]
+            self.invalidations += len(stale)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+# Initialize principal cache
+principal_cache = PrincipalCache(
+    ttl_seconds=PRINCIPAL_CACHE_TTL_SECONDS,
+    max_entries=PRINCIPAL_CACHE_MAX_ENTRIES
+)
+
+# Profile Repair Worker
+class ProfileRepairWorker:
+    """Repair incomplete profiles (missing row or company_id) off the request path.
+    
+    Jobs are keyed by user id, so enqueueing a user that already has a
+    pending repair is a no-op. Repairs themselves are idempotent: profiles
+    are upserted and company_id is only set where it is still null.
+    """
+    DEFAULT_COMPANY_KEY = 'default-company'
+    
+    def __init__(self):
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: set = set()
+        self._default_company: Optional[Dict[str, Any]] = None
+        self._default_company_lock: Optional[asyncio.Lock] = None
+        self.stats = {"enqueued": 0, "deduplicated": 0, "repaired": 0, "failed": 0, "reconciled": 0}
+    
+    async def get_default_company(self) -> Dict[str, Any]:
+        """Return the default company row, creating it on first use (cached)"""
+        if self._default_company is not None:
+            return self._default_company
+        if self._default_company_lock is None:
+            self._default_company_lock = asyncio.Lock()
+        async with self._default_company_lock:
+            if self._default_company is None:
+                result = await db.table('companies').select('*').eq('key', self.DEFAULT_COMPANY_KEY).limit(1).execute()
+                if result.data:
+                    self._default_company = result.data[0]
+                else:
+                    created = await db.table('companies').insert({
+                        "name": "Default Company",
+                        "key": self.DEFAULT_COMPANY_KEY,
+                        "plan": "trial",
+                        "seats": 100
+                    }).execute()
+                    self._default_company = created.data[0]
+            return self._default_company
+    
+    def enqueue(self, auth_user: Dict[str, Any]) -> bool:
+        """Queue a repair for a user; returns False if one is already pending"""
+        if auth_user['id'] in self._pending:
+            self.stats["deduplicated"] += 1
+            return False
+        self._pending.add(auth_user['id'])
+        self.stats["enqueued"] += 1
+        
+        if self._task is None:
+            # Not started via the app lifecycle (e.g. scripts) - start lazily
+            self._start()
+        self._queue.put_nowait(auth_user)
+        return True
+    
+    async def _repair(self, auth_user: Dict[str, Any]) -> None:
+        """Create or complete a single profile"""
+        company_id = (await self.get_default_company())['id']
+        metadata = auth_user['user_metadata']
+        existing = await db.table('profiles').select('id').eq('id', auth_user['id']).limit(1).execute()
+        if not existing.data:
+            await db.table('profiles').upsert({
+                "id": auth_user['id'],
+                "company_id": company_id,
+                "role": metadata.get('role', 'buyer'),
+                "full_name": metadata.get('full_name', auth_user['email'])
+            }, on_conflict='id', ignore_duplicates=True).execute()
+        # Only fill in a missing company; never overwrite a concurrent assignment
+        await db.table('profiles').update({
+            "company_id": company_id
+        }).eq('id', auth_user['id']).is_('company_id', 'null').execute()
+    
+    async def _repair_and_release(self, auth_user: Dict[str, Any]) -> None:
+        try:
+            await self._repair(auth_user)
+            self.stats["repaired"] += 1
+            logger.info(f"🩹 Repaired profile for user {auth_user['email']}")
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"🩹 Profile repair failed for user {auth_user['email']}: {e}")
+        finally:
+            principal_cache.invalidate(auth_user['id'])
+            self._pending.discard(auth_user['id'])
+    
+    async def reconcile(self) -> int:
+        """Assign the default company to every profile that lacks one, in bulk"""
+        company_id = (await self.get_default_company())['id']
+        result = await db.table('profiles').update({
+            "company_id": company_id
+        }).is_('company_id', 'null').execute()
+        fixed = len(result.data or [])
+        self.stats["reconciled"] += fixed
+        if fixed:
+            logger.info(f"🩹 Startup reconciliation assigned a company to {fixed} profiles")
+        return fixed
+    
+    async def _run(self) -> None:
+        try:
+            await self.reconcile()
+        except Exception as e:
+            logger.error(f"🩹 Profile reconciliation failed: {e}")
+        while True:
+            auth_user = await self._queue.get()
+            try:
+                await self._repair_and_release(auth_user)
+            finally:
+                self._queue.task_done()
+    
+    def _start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def start(self) -> None:
+        if self._task is None:
+            self._start()
+    
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        self._queue = None
+
+# Initialize profile repair worker
+profile_repair_worker = ProfileRepairWorker()
+
+# Activity Log Writer
+class ActivityLogger:
+    """Write-behind queue for activity rows.
+    
+    Endpoints enqueue activities and return without waiting for a database
+    round trip. A background task collects them into bulk inserts of up to
+    ACTIVITY_LOG_BATCH_SIZE rows, or whatever arrived within
+    ACTIVITY_LOG_FLUSH_INTERVAL seconds.
+    
+    When the queue is full, callers wait up to ACTIVITY_LOG_ENQUEUE_TIMEOUT
+    (backpressure) and the row is then spilled to disk rather than dropped.
+    Batches that fail because the database is unreachable are appended to a
+    JSONL spill file and replayed once inserts succeed again. Rows PostgREST
+    rejects are retried one by one, so one bad row cannot sink its batch.
+    
+    Each process spills to its own file (ACTIVITY_LOG_SPILL_PATH suffixed
+    with the pid), so workers never replay each other's rows. Files left by
+    processes that are no longer running are adopted by the next replay.
+    Spill file IO runs on the offloader's disk pool.
+    """
+    FIELDS = ('company_id', 'user_id', 'action', 'resource_type', 'resource_id', 'details', 'created_at')
+    
+    def __init__(self, spill_path: str = ACTIVITY_LOG_SPILL_PATH):
+        self.spill_path = spill_path
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_replay = 0.0
+        self._adopt_pending = True
+        self.stats = {
+            "enqueued": 0, "inserted": 0, "batches": 0, "backpressure_waits": 0,
+            "spilled": 0, "replayed": 0, "rejected": 0, "failed_flushes": 0
+        }
+    
+    def _row(self, activity: Dict[str, Any]) -> Dict[str, Any]:
+        """Give every row the same keys - PostgREST bulk inserts require it"""
+        row = {field: activity.get(field) for field in self.FIELDS}
+        if row['details'] is None:
+            row['details'] = {}
+        if row['created_at'] is None:
+            # Stamp at enqueue time so the feed order reflects when things happened
+            row['created_at'] = datetime.now(timezone.utc).isoformat()
+        return row
+    
+    async def log(self, activity: Dict[str, Any]) -> None:
+        """Queue an activity row for the next bulk insert"""
+        row = self._row(activity)
+        if self._task is None:
+            # Not started via the app lifecycle (e.g. scripts) - start lazily
+            self._start()
+        self.stats["enqueued"] += 1
+        try:
+            self._queue.put_nowait(row)
+        except asyncio.QueueFull:
+            self.stats["backpressure_waits"] += 1
+            try:
+                await asyncio.wait_for(self._queue.put(row), ACTIVITY_LOG_ENQUEUE_TIMEOUT)
+            except asyncio.TimeoutError:
+                logger.warning("📝 Activity queue full - spilling activity to disk")
+                await self._spill([row])
+    
+    @property
+    def process_spill_path(self) -> str:
+        """This process's spill file (worker processes each get their own)"""
+        return f"{self.spill_path}.{os.getpid()}"
+    
+    @staticmethod
+    def _append(path: str, rows: List[Dict[str, Any]]) -> None:
+        with open(path, "a", encoding="utf-8") as spill:
+            for row in rows:
+                spill.write(json.dumps(row, default=str) + "\n")
+            spill.flush()
+            os.fsync(spill.fileno())
+    
+    async def _spill(self, rows: List[Dict[str, Any]]) -> None:
+        """Append rows to this process's durable spill file"""
+        try:
+            await offloader.run("disk", self._append, self.process_spill_path, rows)
+            self.stats["spilled"] += len(rows)
+        except Exception as e:
+            logger.error(f"📝 Could not spill {len(rows)} activities to {self.process_spill_path}: {e}")
+    
+    @staticmethod
+    def _is_rejection(error: APIError) -> bool:
+        """True when the rows themselves were refused, as opposed to the database being unavailable"""
+        code = str(error.code or "")
+        # SQLSTATE 22xxx data exceptions, 23xxx constraint violations, PGRST1xx bad requests
+        return code.startswith(("22", "23", "PGRST1"))
+    
+    async def _insert(self, rows: List[Dict[str, Any]]) -> None:
+        """Bulk insert; rejected batches fall back to row-by-row inserts"""
+        try:
+            await db.table('activities').insert(rows, returning=ReturnMethod.minimal).execute()
+            self.stats["inserted"] += len(rows)
+        except APIError as e:
+            if not self._is_rejection(e):
+                raise
+            if len(rows) == 1:
+                self.stats["rejected"] += 1
+                logger.error(f"📝 Activity rejected by database: {e}")
+                return
+            for row in rows:
+                await self._insert([row])
+    
+    async def _flush(self, rows: List[Dict[str, Any]]) -> bool:
+        """Write a batch, spilling it to disk if the database is unreachable"""
+        self.stats["batches"] += 1
+        try:
+            await self._insert(rows)
+            return True
+        except Exception as e:
+            self.stats["failed_flushes"] += 1
+            logger.warning(f"📝 Activity flush failed ({e}) - spilling {len(rows)} rows")
+            await self._spill(rows)
+            return False
+    
+    @staticmethod
+    def _process_running(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+    
+    def _orphaned_spills(self) -> List[str]:
+        """Spill files of processes that are gone (and the unsuffixed file of older versions)"""
+        directory = os.path.dirname(self.spill_path) or "."
+        prefix = os.path.basename(self.spill_path)
+        orphans = []
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return orphans
+        for name in names:
+            if name in (prefix, f"{prefix}.replay"):
+                orphans.append(os.path.join(directory, name))
+                continue
+            if not name.startswith(f"{prefix}."):
+                continue
+            pid = name[len(prefix) + 1:].split(".")[0]
+            if pid.isdigit() and int(pid) != os.getpid() and not self._process_running(int(pid)):
+                orphans.append(os.path.join(directory, name))
+        return orphans
+    
+    def _claim_spill(self, adopt: bool) -> tuple:
+        """(replay file, its rows): this process's spill, plus any orphaned files when `adopt`"""
+        replay_path = f"{self.process_spill_path}.replay"
+        if not os.path.exists(replay_path):
+            try:
+                # Claim the current spill file; new spills start a fresh one
+                os.replace(self.process_spill_path, replay_path)
+            except FileNotFoundError:
+                pass
+        for orphan in self._orphaned_spills() if adopt else []:
+            # Renaming is atomic, so only one worker adopts each orphan
+            adopted = f"{self.process_spill_path}.adopting"
+            try:
+                os.replace(orphan, adopted)
+            except FileNotFoundError:
+                continue
+            with open(adopted, encoding="utf-8") as spill:
+                rows = [json.loads(line) for line in spill if line.strip()]
+            self._append(replay_path, rows)
+            os.remove(adopted)
+        if not os.path.exists(replay_path):
+            return replay_path, []
+        with open(replay_path, encoding="utf-8") as spill:
+            return replay_path, [json.loads(line) for line in spill if line.strip()]
+    
+    async def replay_spill(self) -> int:
+        """Insert spilled rows; anything that still fails goes back to the spill file"""
+        self._last_replay = time.monotonic()
+        adopt, self._adopt_pending = self._adopt_pending, False
+        replay_path, rows = await offloader.run("disk", self._claim_spill, adopt)
+        if not rows and not os.path.exists(replay_path):
+            return 0
+        
+        replayed = 0
+        for start in range(0, len(rows), ACTIVITY_LOG_BATCH_SIZE):
+            batch = rows[start:start + ACTIVITY_LOG_BATCH_SIZE]
+            try:
+                await self._insert(batch)
+            except Exception as e:
+                logger.warning(f"📝 Activity replay stopped ({e}) - {len(rows) - start} rows stay spilled")
+                await self._spill(rows[start:])
+                self.stats["spilled"] -= len(rows) - start
+                break
+            replayed += len(batch)
+        await offloader.run("disk", os.remove, replay_path)
+        
+        self.stats["replayed"] += replayed
+        if replayed:
+            logger.info(f"📝 Replayed {replayed} spilled activities")
+        return replayed
+    
+    def _has_spill(self) -> bool:
+        return (self._adopt_pending or os.path.exists(self.process_spill_path)
+                or os.path.exists(f"{self.process_spill_path}.replay"))
+    
+    async def _next_batch(self) -> List[Dict[str, Any]]:
+        """Wait for one row, then collect more until the batch is full or the interval ends"""
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + ACTIVITY_LOG_FLUSH_INTERVAL
+        while len(batch) < ACTIVITY_LOG_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+    
+    async def _run(self) -> None:
+        while True:
+            if self._has_spill() and time.monotonic() - self._last_replay >= ACTIVITY_LOG_REPLAY_INTERVAL:
+                try:
+                    await self.replay_spill()
+                except Exception as e:
+                    logger.error(f"📝 Activity replay failed: {e}")
+            try:
+                batch = await asyncio.wait_for(self._next_batch(), ACTIVITY_LOG_REPLAY_INTERVAL)
+            except asyncio.TimeoutError:
+                continue
+            try:
+                await self._flush(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    def _start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=ACTIVITY_LOG_MAX_QUEUE)
+        # Replay leftovers from a previous run on the first loop iteration
+        self._last_replay = float("-inf")
+        self._task = asyncio.create_task(self._run())
+    
+    async def start(self) -> None:
+        if self._task is None:
+            self._start()
+    
+    async def stop(self) -> None:
+        """Drain queued activities, then stop; leftovers are spilled to disk"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), ACTIVITY_LOG_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning("📝 Activity drain timed out")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        leftovers = []
+        while not self._queue.empty():
+            leftovers.append(self._queue.get_nowait())
+        if leftovers:
+            await self._spill(leftovers)
+        self._task = None
+        self._queue = None
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "spill_pending": self._has_spill()
+        }
+
+# Initialize activity logger
+activity_logger = ActivityLogger()
+
+# Single-flight request coalescing
+class SingleFlight:
+    """Coalesce concurrent calls for the same key into one in-flight call.
+    
+    The first caller for a key starts the work as its own task; callers
+    arriving while it is in flight await the same result (or exception)
+    instead of repeating it. Every caller, the first included, waits through
+    a shield, so a cancelled caller stops waiting without cancelling the
+    work the others share.
+    """
+    
+    def __init__(self, name: str):
+        self.name = name
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self.calls = 0
+        self.shared = 0
+    
+    async def do(self, key: str, fn):
+        """Run `fn()` (an awaitable factory) once per key at a time"""
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.shared += 1
+        else:
+            self.calls += 1
+            task = asyncio.ensure_future(fn())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+        return await asyncio.shield(task)
+    
+    def _finished(self, key: str, task: asyncio.Future) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark retrieved so a failure every caller stopped waiting for isn't logged as unhandled
+        if not task.cancelled():
+            task.exception()
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"calls": self.calls, "shared": self.shared, "in_flight": len(self._in_flight)}
+
+# Initialize auth single-flight group
+auth_single_flight = SingleFlight("auth")
+
+# Authentication Helpers
+def get_request_auth(request: Request) -> Dict[str, Any]:
+    """Return the bearer token parsed for this request, parsing it at most once.
+    
+    The auth middleware calls this for every request; the rate limiter key
+    function and get_current_user then read the result from request.state.
+    """
+    parsed = getattr(request.state, "auth", None)
+    if parsed is not None:
+        return parsed
+    
+    started = time.perf_counter()
+    auth = request.headers.get("Authorization")
+    if auth and auth.startswith("Bearer "):
+        parsed = decode_bearer_token(auth.replace("Bearer ", ""))
+    else:
+        parsed = {"token": None, "claims": None, "error": None}
+    parsed["decode_ms"] = (time.perf_counter() - started) * 1000
+    jwt_decode_stats.record(parsed["decode_ms"])
+    request.state.auth = parsed
+    return parsed
+
+async def get_current_user(request: Request):
+    """Get current user from JWT token with automatic profile creation"""
+    parsed = get_request_auth(request)
+    token = parsed["token"]
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    
+    # Concurrent requests carrying the same token share one verification and
+    # profile load (and therefore at most one profile repair)
+    principal = await auth_single_flight.do(
+        hashlib.sha256(token.encode()).hexdigest(),
+        lambda: resolve_principal(token, parsed)
+    )
+    return dict(principal)
+
+async def resolve_principal(token: str, parsed: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Verify a token and load the user's profile.
+    
+    Incomplete profiles (missing row or company) are not repaired inline:
+    a repair job is queued and a provisional principal is returned.
+    """
+    try:
+        # Verify token (locally when the signing key is known)
+        auth_user = await verify_access_token(token, parsed)
+        
+        cached = principal_cache.get(auth_user['id'])
+        if cached is not None:
+            return cached
+        
+        # Get user profile with company info
+        profile = await db.table('profiles').select('*, companies(*)').eq('id', auth_user['id']).maybe_single().execute()
+        profile_data = profile.data if profile else None
+        
+        if not profile_data or not profile_data.get('company_id'):
+            # Profile missing or incomplete - repair it in the background
+            logger.warning(f"Incomplete profile for user {auth_user['email']}, queueing repair...")
+            profile_repair_worker.enqueue(auth_user)
+            
+            default_company = await profile_repair_worker.get_default_company()
+            metadata = auth_user['user_metadata']
+            # Provisional principals are not cached; the repaired profile is
+            # picked up on the next request once the job has run
+            return {
+                "id": auth_user['id'],
+                "email": auth_user['email'],
+                "role": (profile_data or {}).get('role') or metadata.get('role', 'buyer'),
+                "company_id": default_company['id'],
+                "company": default_company,
+                "full_name": (profile_data or {}).get('full_name') or metadata.get('full_name', auth_user['email']),
+                "provisional": True
+            }
+        
+        principal = {
+            "id": auth_user['id'],
+            "email": auth_user['email'],
+            "role": profile_data.get('role', 'buyer'),
+            "company_id": profile_data.get('company_id'),
+            "company": profile_data.get('companies'),
+            "full_name": profile_data.get('full_name')
+        }
+        principal_cache.set(auth_user['id'], principal)
+        return principal
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Auth error: {str(e)}")
+        raise HTTPException(status_code=401, detail="Authentication failed")
+
+# Role-based access decorator
+def require_role(allowed_roles: List[str]):
+    def decorator(func):
+        @wraps(func)
+        async def wrapper(*args, user=None, **kwargs):
             if not user:
                 raise HTTPException(status_code=401, detail="Not authenticated")
             if user.get('role') not in allowed_roles:
@@ -490,128 +2274,1925 @@ def require_role(allowed_roles: List[str]):
         return wrapper
     return decorator
 
-@app.get("/")
-async def root():
-    return {"message": "HomeVerse API v2.0 - Powered by Supabase"}
+@app.get("/")
+async def root():
+    return {"message": "HomeVerse API v2.0 - Powered by Supabase"}
+
+@app.get("/health")
+async def health_check():
+    try:
+        # Test Supabase connection
+        result = await db.table('companies').select('count').limit(1).execute()
+        return {
+            "status": "healthy",
+            "database": "connected",
+            "timestamp": datetime.now().isoformat()
+        }
+    except Exception as e:
+        logger.error(f"Health check failed: {str(e)}")
+        return {
+            "status": "unhealthy",
+            "database": "disconnected",
+            "error": str(e)
+        }
+
+# Background workers
+@app.on_event("startup")
+async def start_background_workers():
+    await jwt_verifier.start()
+    await repository.start()
+    await activity_logger.start()
+    await profile_repair_worker.start()
+    await match_materializer.start()
+    await project_notifier.start()
+    await heatmap_tiles.start()
+    await heatmap_cells.start()
+
+@app.on_event("shutdown")
+async def stop_background_workers():
+    await bulk_match_runner.stop()
+    await heatmap_cells.stop()
+    await heatmap_tiles.stop()
+    await project_notifier.stop()
+    await match_materializer.stop()
+    await profile_repair_worker.stop()
+    await activity_logger.stop()
+    await repository.close()
+    await db.aclose()
+    offloader.shutdown()
+    await http_pools.aclose()
+
+# Spatial Project Index
+class ProjectGridIndex:
+    """Fixed-size lat/lng grid over project coordinates.
+    
+    Projects without usable coordinates are kept in a separate list. Every
+    query returns them, because calculate_match_score gives them the neutral
+    location score instead of a distance-based one.
+    """
+    
+    MILES_PER_DEGREE = 3961 * math.pi / 180
+    
+    def __init__(self, projects: List[Dict], cell_degrees: float = MATCH_GRID_CELL_DEGREES):
+        self.cell_degrees = cell_degrees
+        self.lng_cells = math.ceil(360 / cell_degrees)
+        cells: Dict[tuple, List[int]] = {}
+        unlocated = []
+        for i, project in enumerate(projects):
+            lat, lng = project.get('latitude', 0), project.get('longitude', 0)
+            if (isinstance(lat, (int, float)) and isinstance(lng, (int, float)) and lat and lng
+                    and math.isfinite(lat) and math.isfinite(lng)):
+                cells.setdefault(self._cell(lat, lng), []).append(i)
+            else:
+                unlocated.append(i)
+        self.cells = {cell: np.array(indices, dtype=np.int64) for cell, indices in cells.items()}
+        self.unlocated = np.array(unlocated, dtype=np.int64)
+    
+    def _cell(self, lat: float, lng: float) -> tuple:
+        return (math.floor(lat / self.cell_degrees),
+                math.floor((lng + 180) / self.cell_degrees) % self.lng_cells)
+    
+    def candidates(self, lat: float, lng: float, radius_miles: float) -> "np.ndarray":
+        """Indices (ascending) of every project that may lie within radius_miles, plus unlocated ones"""
+        dlat = radius_miles / self.MILES_PER_DEGREE
+        lat_lo, lat_hi = math.floor((lat - dlat) / self.cell_degrees), math.floor((lat + dlat) / self.cell_degrees)
+        
+        max_cos = min(math.cos(math.radians(min(abs(lat) + dlat, 90))), math.cos(math.radians(max(abs(lat) - dlat, 0))))
+        dlng = dlat / max_cos if max_cos > 1e-9 else 360
+        if dlng >= 180:
+            lng_range = range(self.lng_cells)
+        else:
+            lng_lo = math.floor((lng - dlng + 180) / self.cell_degrees)
+            lng_hi = math.floor((lng + dlng + 180) / self.cell_degrees)
+            lng_range = {cell % self.lng_cells for cell in range(lng_lo, lng_hi + 1)}
+        
+        found = [self.unlocated]
+        for lat_cell in range(lat_lo, lat_hi + 1):
+            for lng_cell in lng_range:
+                indices = self.cells.get((lat_cell, lng_cell))
+                if indices is not None:
+                    found.append(indices)
+        return np.sort(np.concatenate(found))
+
+class ProjectCatalog:
+    """Active projects cached in memory, with a spatial index for match pruning.
+    
+    A project more than 20 miles from the applicant earns no location points.
+    Its score is then at most 40 (income) + 20 (household) + 10 (availability)
+    = 70. So only nearby and unlocated projects are scored first. If the K-th
+    best of those scores above 70, no far project can enter the top K and the
+    result equals a full scan. Otherwise every project is scored.
+    
+    The catalog reloads after MATCH_CATALOG_TTL_SECONDS, or sooner when a
+    project write calls invalidate().
+    """
+    
+    LOCATION_RADIUS_MILES = BatchMatchEngine.DISTANCE_BANDS[-1]
+    FAR_PROJECT_MAX_SCORE = 70
+    
+    def __init__(self, ttl_seconds: float = MATCH_CATALOG_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.version = 0
+        self.generation = 0
+        self.projects: List[Dict] = []
+        self.index: Optional[ProjectGridIndex] = None
+        self.columns: Optional[Dict[str, Any]] = None
+        self._loaded_version = -1
+        self._loaded_at = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.stats = {"loads": 0, "pruned": 0, "full_scans": 0, "no_location": 0, "candidates": 0}
+        
+        try:
+            lat, lng = (float(part) for part in MATCH_DEFAULT_LOCATION.split(','))
+            self.default_location = (lat, lng)
+        except ValueError:
+            logger.warning(f"⚠️ Invalid MATCH_DEFAULT_LOCATION '{MATCH_DEFAULT_LOCATION}' - using full scans")
+            self.default_location = None
+    
+    def invalidate(self) -> None:
+        """Mark the catalog stale after a project write"""
+        self.version += 1
+    
+    def _fresh(self) -> bool:
+        return (self._loaded_version == self.version
+                and time.monotonic() - self._loaded_at < self.ttl_seconds)
+    
+    async def load(self) -> List[Dict]:
+        """Return the active projects, reloading them if stale"""
+        if self._fresh():
+            return self.projects
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if not self._fresh():
+                version = self.version
+                self.set_projects(await repository.list_projects_by_status('active'), version)
+        return self.projects
+    
+    def set_projects(self, projects: List[Dict], version: Optional[int] = None) -> None:
+        """Install a project list and rebuild the index"""
+        self.projects = projects
+        self.index = ProjectGridIndex(projects) if NUMPY_AVAILABLE else None
+        self.columns = matching_engine.prepare(projects, 'project')
+        self._loaded_version = self.version if version is None else version
+        self._loaded_at = time.monotonic()
+        self.generation += 1
+        self.stats["loads"] += 1
+    
+    def _search_point(self, applicant: Dict) -> Optional[tuple]:
+        lat, lng = applicant.get('latitude', 0), applicant.get('longitude', 0)
+        if isinstance(lat, (int, float)) and isinstance(lng, (int, float)) and lat and lng:
+            if math.isfinite(lat) and math.isfinite(lng):
+                return (lat, lng)
+            return None
+        if lat and lng:
+            # Non-numeric coordinates: let the scorer handle them on a full scan
+            return None
+        self.stats["no_location"] += 1
+        if MATCH_NO_LOCATION_FALLBACK == "default_location":
+            return self.default_location
+        return None
+    
+    async def top_matches(self, applicant: Dict, limit: int, after: Optional[tuple] = None) -> tuple:
+        """Indices of an applicant's top `limit` projects (after the cursor), plus the project list"""
+        projects = await self.load()
+        point = self._search_point(applicant) if self.index is not None else None
+        if point is not None:
+            candidates = self.index.candidates(point[0], point[1], self.LOCATION_RADIUS_MILES)
+            subset = [projects[i] for i in candidates]
+            batch = matching_engine.score_projects(applicant, subset)
+            top = batch.ranked(limit=limit, after=after)
+            # Exact when the K-th candidate beats anything a far project can score
+            exact = (len(candidates) == len(projects)
+                     or len(top) == limit and batch.scores[top[-1]] > self.FAR_PROJECT_MAX_SCORE)
+            approximate_ok = MATCH_NO_LOCATION_FALLBACK == "default_location" and not self._has_location(applicant)
+            if exact or approximate_ok:
+                self.stats["pruned"] += 1
+                self.stats["candidates"] += len(candidates)
+                return projects, [int(candidates[i]) for i in top]
+        
+        self.stats["full_scans"] += 1
+        self.stats["candidates"] += len(projects)
+        batch = matching_engine.score_projects(applicant, projects, columns=self.columns)
+        return projects, batch.ranked(limit=limit, after=after)
+    
+    @staticmethod
+    def _has_location(applicant: Dict) -> bool:
+        return bool(applicant.get('latitude', 0) and applicant.get('longitude', 0))
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "projects": len(self.projects),
+            "version": self.version,
+            "generation": self.generation,
+            "indexed_cells": len(self.index.cells) if self.index is not None else 0
+        }
+
+# Initialize project catalog
+project_catalog = ProjectCatalog()
+
+# Match Result Cache
+class MatchResultCache:
+    """LRU cache of applicant match pages keyed by data versions.
+    
+    A key is (applicant id, applicant version, catalog generation, page).
+    Applicant writes bump that applicant's version; project writes invalidate
+    the project catalog, and its next load bumps the generation. Superseded
+    entries are never read again and age out of the LRU, so nothing is
+    evicted on a write. Callers take the key before computing a page, so a
+    write that lands mid-request leaves its result under the old key.
+    
+    Applicant versions are per process: other workers pick up an applicant
+    change when their catalog next reloads (MATCH_CATALOG_TTL_SECONDS).
+    """
+    
+    def __init__(self, max_entries: int = MATCH_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    async def key(self, applicant_id: str, page: tuple) -> tuple:
+        """Cache key for a page of an applicant's matches against the current catalog"""
+        await project_catalog.load()
+        return (applicant_id, self._versions.get(applicant_id, 0), project_catalog.generation, page)
+    
+    def get(self, key: tuple) -> Optional[Dict[str, Any]]:
+        """Return the cached response, or None on miss"""
+        response = self._entries.get(key)
+        if response is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return response
+    
+    def set(self, key: tuple, response: Dict[str, Any]) -> None:
+        """Cache a response, evicting the least recently used entry if full"""
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+    
+    def invalidate_applicant(self, applicant_id: str) -> None:
+        """Retire every cached page for an applicant after it changes"""
+        self._versions[applicant_id] = self._versions.get(applicant_id, 0) + 1
+        self.invalidations += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for sizing the cache"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "catalog_generation": project_catalog.generation,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations
+        }
+
+# Initialize match result cache
+match_cache = MatchResultCache()
+
+# Match Materialization
+class MatchMaterializer:
+    """Keep the matches table in step with applicant and project writes.
+    
+    Every (applicant, active project) pair scoring at least
+    MATCH_MATERIALIZE_MIN_SCORE is stored with its score, recommendation and
+    breakdown. Writing an applicant recomputes that applicant's pairs;
+    writing a project recomputes that project's pairs. Jobs run on a
+    background task and are keyed by (kind, id), so repeated writes to one
+    record while its job is pending collapse into a single recompute.
+    
+    A job upserts its pairs with one computed_at stamp, then deletes the
+    record's pairs with an older stamp. That drops pairs that fell below the
+    threshold (or whose project went inactive) without listing them.
+    
+    Each pair also stores the updated_at of the applicant and the project it
+    was scored from. A page is only served when every row's versions match
+    the records it embeds, so a write accepted by any worker retires the
+    pages showing the written record until its recompute lands. A write can
+    also move a record onto a page that does not show it yet. The worker that
+    accepted the write scores such pages live until its recompute lands;
+    other workers serve them from the table until then, usually seconds.
+    Otherwise reads return None and the endpoint scores live.
+    """
+    
+    TABLE = 'matches'
+    
+    def __init__(self, enabled: bool = MATCHES_MATERIALIZED,
+                 min_score: float = MATCH_MATERIALIZE_MIN_SCORE,
+                 batch_size: int = MATCH_MATERIALIZE_BATCH_SIZE):
+        self.enabled = enabled
+        self.min_score = min_score
+        self.batch_size = batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: set = set()
+        self._running: Optional[tuple] = None
+        self.stats = {
+            "enqueued": 0, "deduplicated": 0, "applicant_jobs": 0, "project_jobs": 0,
+            "rows_written": 0, "failed": 0, "table_reads": 0, "live_fallbacks": 0, "version_fallbacks": 0
+        }
+    
+    def enqueue(self, kind: str, record_id: str) -> bool:
+        """Queue a recompute for an 'applicant' or 'project'; False if disabled or already pending"""
+        if not self.enabled:
+            return False
+        key = (kind, record_id)
+        if key in self._pending:
+            self.stats["deduplicated"] += 1
+            return False
+        self._pending.add(key)
+        self.stats["enqueued"] += 1
+        
+        if self._task is None:
+            # Not started via the app lifecycle (e.g. scripts) - start lazily
+            self._start()
+        self._queue.put_nowait(key)
+        return True
+    
+    def enqueue_applicant(self, applicant_id: str) -> bool:
+        return self.enqueue('applicant', applicant_id)
+    
+    def enqueue_project(self, project_id: str) -> bool:
+        return self.enqueue('project', project_id)
+    
+    def _stale(self, kind: str, record_id: str) -> bool:
+        """True when queued or running jobs may still change this record's stored pairs"""
+        other = 'project' if kind == 'applicant' else 'applicant'
+        busy = self._pending | {self._running} if self._running else self._pending
+        return (kind, record_id) in busy or any(k == other for k, _ in busy)
+    
+    @staticmethod
+    def version(value: Any) -> Optional[str]:
+        """A record's updated_at as one UTC ISO string (PostgREST returns strings, asyncpg datetimes)"""
+        if value is None:
+            return None
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.astimezone(timezone.utc).isoformat()
+    
+    @classmethod
+    def _current(cls, row: Dict, applicant: Optional[Dict], project: Optional[Dict]) -> bool:
+        """True when a stored pair was scored from the current applicant and (active) project"""
+        return (applicant is not None and project is not None and project.get('status') == 'active'
+                and cls.version(row.get('applicant_updated_at')) == cls.version(applicant.get('updated_at'))
+                and cls.version(row.get('project_updated_at')) == cls.version(project.get('updated_at')))
+    
+    @classmethod
+    def _row(cls, applicant: Dict, project: Dict) -> Dict[str, Any]:
+        match_info = calculate_match_score(applicant, project)
+        return {
+            'company_id': applicant.get('company_id'),
+            'applicant_id': applicant['id'],
+            'project_id': project['id'],
+            'score': match_info['match_percentage'],
+            'recommendation': match_info['recommendation'],
+            'factors': match_info['breakdown'],
+            'applicant_updated_at': cls.version(applicant.get('updated_at')),
+            'project_updated_at': cls.version(project.get('updated_at'))
+        }
+    
+    async def _replace(self, column: str, record_id: str, rows: List[Dict[str, Any]]) -> int:
+        """Upsert a record's pairs, then delete the ones this pass did not write"""
+        computed_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        for start in range(0, len(rows), self.batch_size):
+            chunk = [{**row, 'computed_at': computed_at} for row in rows[start:start + self.batch_size]]
+            await db.table(self.TABLE).upsert(
+                chunk, on_conflict='applicant_id,project_id', returning=ReturnMethod.minimal
+            ).execute()
+        await db.table(self.TABLE).delete(returning=ReturnMethod.minimal).eq(
+            column, record_id
+        ).lt('computed_at', computed_at).execute()
+        self.stats["rows_written"] += len(rows)
+        return len(rows)
+    
+    async def recompute_applicant(self, applicant_id: str) -> int:
+        """Rescore one applicant against the active projects"""
+        self.stats["applicant_jobs"] += 1
+        applicant = await repository.get_applicant(applicant_id)
+        if not applicant:
+            return await self._replace('applicant_id', applicant_id, [])
+        projects = await project_catalog.load()
+        batch = matching_engine.score_projects(applicant, projects)
+        rows = [self._row(applicant, projects[i]) for i in batch.ranked(min_score=self.min_score)]
+        return await self._replace('applicant_id', applicant_id, rows)
+    
+    async def recompute_project(self, project_id: str) -> int:
+        """Rescore every applicant against one project; inactive projects keep no pairs"""
+        self.stats["project_jobs"] += 1
+        project = await repository.get_project(project_id)
+        if not project or project.get('status') != 'active':
+            return await self._replace('project_id', project_id, [])
+        prefilter = matching_engine.applicant_prefilter(project, self.min_score)
+        applicants = await repository.list_match_candidates(None, prefilter)
+        batch = matching_engine.score_applicants(project, applicants)
+        rows = [self._row(applicants[i], project) for i in batch.ranked(min_score=self.min_score)]
+        return await self._replace('project_id', project_id, rows)
+    
+    async def rebuild(self) -> int:
+        """Queue a recompute for every applicant (initial population or repair)"""
+        applicants = await repository.list_match_candidates(None, None)
+        return sum(self.enqueue_applicant(applicant['id']) for applicant in applicants)
+    
+    @staticmethod
+    def _after(query, column: str, after: Optional[tuple]):
+        """Keyset filter for rows ranked after the cursor (score desc, id asc)"""
+        if after is None:
+            return query
+        score, row_id = after
+        return postgrest_or(query, f"score.lt.{score},and(score.eq.{score},{column}.gt.{row_id})")
+    
+    async def top_for_applicant(self, applicant_id: str, limit: int,
+                                after: Optional[tuple] = None) -> Optional[List[Dict]]:
+        """Stored top matches (with embedded project) or None if the table can't answer exactly.
+        
+        Every pair above the threshold is stored, so `limit` stored rows are
+        the true top `limit`. Fewer rows means some of the top scores are
+        below the threshold (or the applicant was never materialized).
+        """
+        if not self.enabled or self._stale('applicant', applicant_id):
+            self.stats["live_fallbacks"] += 1
+            return None
+        query = db.table(self.TABLE).select(
+            'score, recommendation, factors, applicant_updated_at, project_updated_at, applicants(updated_at), projects(*)'
+        ).eq('applicant_id', applicant_id)
+        # One order parameter: postgrest-py 0.13 adds a separate one per order() call
+        result = await self._after(query, 'project_id', after).order('score.desc,project_id').limit(limit).execute()
+        rows = result.data or []
+        if len(rows) < limit:
+            self.stats["live_fallbacks"] += 1
+            return None
+        if not all(self._current(row, row['applicants'], row['projects']) for row in rows):
+            self.stats["version_fallbacks"] += 1
+            return None
+        self.stats["table_reads"] += 1
+        return rows
+    
+    async def top_for_project(self, project_id: str, company_id: str, limit: int, min_score: float,
+                              after: Optional[tuple] = None) -> Optional[tuple]:
+        """A company's stored (rows with embedded applicant, total at or above min_score), or None.
+        
+        An empty page is treated as unknown (the project may not have been
+        materialized yet) and left to live scoring.
+        """
+        if not self.enabled or min_score < self.min_score or self._stale('project', project_id):
+            self.stats["live_fallbacks"] += 1
+            return None
+        query = db.table(self.TABLE).select(
+            'score, recommendation, factors, applicant_updated_at, project_updated_at, applicants(*), projects(updated_at, status)'
+        ).eq('project_id', project_id).eq('company_id', company_id).gte('score', min_score)
+        page, total = await asyncio.gather(
+            self._after(query, 'applicant_id', after).order('score.desc,applicant_id').limit(limit).execute(),
+            db.table(self.TABLE).select('applicant_id', count='exact').eq(
+                'project_id', project_id
+            ).eq('company_id', company_id).gte('score', min_score).limit(1).execute()
+        )
+        if not page.data:
+            self.stats["live_fallbacks"] += 1
+            return None
+        if not all(self._current(row, row['applicants'], row['projects']) for row in page.data):
+            self.stats["version_fallbacks"] += 1
+            return None
+        self.stats["table_reads"] += 1
+        return page.data, total.count if total.count is not None else len(page.data)
+    
+    async def _process(self, key: tuple) -> None:
+        kind, record_id = key
+        # Release first: a write landing mid-job queues a fresh recompute
+        self._pending.discard(key)
+        self._running = key
+        try:
+            if kind == 'applicant':
+                written = await self.recompute_applicant(record_id)
+            else:
+                written = await self.recompute_project(record_id)
+            logger.debug(f"🎯 Materialized {written} matches for {kind} {record_id}")
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"🎯 Match materialization failed for {kind} {record_id}: {e}")
+        finally:
+            self._running = None
+    
+    async def _run(self) -> None:
+        while True:
+            key = await self._queue.get()
+            try:
+                await self._process(key)
+            finally:
+                self._queue.task_done()
+    
+    def _start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def start(self) -> None:
+        if self.enabled and self._task is None:
+            self._start()
+    
+    async def stop(self) -> None:
+        """Finish queued recomputes (up to MATCH_MATERIALIZE_DRAIN_TIMEOUT), then stop"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), MATCH_MATERIALIZE_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"🎯 Match materialization drain timed out - {self._queue.qsize()} jobs dropped")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._queue = None
+        self._pending.clear()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "min_score": self.min_score,
+            "queued": self._queue.qsize() if self._queue else 0
+        }
+
+# Initialize match materializer
+match_materializer = MatchMaterializer()
+
+# Bulk Matching
+class BulkMatchRunner:
+    """All of a company's applicants against all active projects, across processes.
+    
+    Applicants are split into BULK_MATCH_CHUNK_SIZE chunks and scored with
+    the batch engine (matching.score_bulk_chunk) in a pool of
+    BULK_MATCH_WORKERS processes that lives as long as the app. A job's
+    projects are pickled once and each process unpickles and prepares them
+    once per job. The pool uses spawn: forking a process that runs an event
+    loop and HTTP client threads is not safe. Spawned processes import only
+    the matching module, not this one.
+    
+    Results can be streamed as NDJSON or written to the matches table. Job
+    progress is tracked in memory and exposed through the jobs endpoint; a
+    job in which some applicants failed to score finishes as "partial".
+    
+    Table output replaces pairs one chunk at a time: the chunk's rows are
+    upserted with one computed_at stamp, then older pairs of the applicants
+    the chunk scored are deleted. Applicants that failed to score keep the
+    pairs they had.
+    """
+    
+    PROJECT_COLUMNS = ('id', 'ami_percentage', 'latitude', 'longitude', 'total_units', 'affordable_units', 'status')
+    # Applicant ids per stale-pair delete; they travel in the request URL
+    DELETE_BATCH_SIZE = 100
+    
+    def __init__(self, workers: int = BULK_MATCH_WORKERS, chunk_size: int = BULK_MATCH_CHUNK_SIZE):
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self.jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._tasks: set = set()
+        self._pools: Dict[int, ProcessPoolExecutor] = {}
+        self.stats = {"jobs": 0, "completed": 0, "partial": 0, "failed": 0, "applicants": 0, "pools_started": 0}
+    
+    def _pool(self, workers: int) -> ProcessPoolExecutor:
+        """The long-lived pool with `workers` processes, started on first use"""
+        if workers not in self._pools:
+            self._pools[workers] = ProcessPoolExecutor(
+                max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+            )
+            self.stats["pools_started"] += 1
+        return self._pools[workers]
+    
+    async def score(self, applicants: List[Dict], projects: List[Dict], limit: Optional[int] = None,
+                    min_score: Optional[float] = None, with_breakdown: bool = False,
+                    workers: Optional[int] = None):
+        """Yield per-applicant results one chunk at a time, in completion order"""
+        chunks = [applicants[i:i + self.chunk_size] for i in range(0, len(applicants), self.chunk_size)]
+        if not chunks:
+            return
+        scorer_projects = [{key: project[key] for key in self.PROJECT_COLUMNS if key in project} for project in projects]
+        projects_blob = pickle.dumps(scorer_projects, protocol=pickle.HIGHEST_PROTOCOL)
+        projects_key = str(uuid.uuid4())
+        size = max(1, workers or self.workers)
+        pool = self._pool(size)
+        loop = asyncio.get_running_loop()
+        futures = [
+            loop.run_in_executor(pool, matching.score_bulk_chunk, projects_key, projects_blob,
+                                 chunk, limit, min_score, with_breakdown)
+            for chunk in chunks
+        ]
+        try:
+            for future in asyncio.as_completed(futures):
+                yield await future
+        except BrokenProcessPool:
+            # A worker died; the next job starts a fresh pool
+            self._pools.pop(size, None)
+            raise
+        finally:
+            # Chunks not yet picked up by a process are dropped
+            for future in futures:
+                future.cancel()
+    
+    def create_job(self, company_id: str, output: str, total: int) -> Dict[str, Any]:
+        job = {
+            "id": str(uuid.uuid4()),
+            "company_id": company_id,
+            "output": output,
+            "status": "running",
+            "total": total,
+            "processed": 0,
+            "errors": 0,
+            "rows_written": 0,
+            "workers": self.workers,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "finished_at": None,
+            "applicants_per_second": None,
+            "error": None
+        }
+        self.jobs[job["id"]] = job
+        while len(self.jobs) > BULK_MATCH_MAX_JOBS:
+            self.jobs.popitem(last=False)
+        self.stats["jobs"] += 1
+        return job
+    
+    def running_job(self, company_id: str) -> Optional[Dict[str, Any]]:
+        return next((job for job in self.jobs.values()
+                     if job["company_id"] == company_id and job["status"] == "running"), None)
+    
+    def _progress(self, job: Dict[str, Any], results: List[Dict], started: float) -> None:
+        job["processed"] += len(results)
+        job["errors"] += sum(1 for result in results if 'error' in result)
+        job["applicants_per_second"] = round(job["processed"] / max(time.perf_counter() - started, 1e-9), 1)
+        self.stats["applicants"] += len(results)
+    
+    def _finish(self, job: Dict[str, Any], error: Optional[Exception] = None) -> None:
+        if error:
+            job["status"] = "failed"
+        else:
+            job["status"] = "partial" if job["errors"] else "completed"
+        job["error"] = str(error) if error else None
+        job["finished_at"] = datetime.now(timezone.utc).isoformat()
+        self.stats[job["status"]] += 1
+    
+    async def stream(self, job: Dict[str, Any], applicants: List[Dict], projects: List[Dict],
+                     limit: int, min_score: float):
+        """NDJSON lines: one 'match' per applicant, 'progress' after each chunk, then 'done'"""
+        started = time.perf_counter()
+        try:
+            async for results in self.score(applicants, projects, limit=limit, min_score=min_score):
+                for result in results:
+                    yield json.dumps({"type": "match", **result}) + "\n"
+                self._progress(job, results, started)
+                yield json.dumps({"type": "progress", "processed": job["processed"], "total": job["total"]}) + "\n"
+            self._finish(job)
+        except Exception as e:
+            self._finish(job, e)
+            logger.error(f"🧮 Bulk match job {job['id']} failed: {e}")
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+            return
+        finally:
+            if job["status"] == "running":
+                # Client went away mid-stream
+                self._finish(job, RuntimeError("stream closed before completion"))
+        yield json.dumps({"type": "done", **job}) + "\n"
+    
+    async def write_to_table(self, job: Dict[str, Any], applicants: List[Dict], projects: List[Dict]) -> None:
+        """Replace the scored applicants' materialized matches (every pair at or above the materializer threshold)"""
+        started = time.perf_counter()
+        # Stored with each pair so reads can tell whether it is current
+        versions = {
+            'applicant': {applicant['id']: MatchMaterializer.version(applicant.get('updated_at')) for applicant in applicants},
+            'project': {project['id']: MatchMaterializer.version(project.get('updated_at')) for project in projects}
+        }
+        try:
+            async for results in self.score(applicants, projects, min_score=match_materializer.min_score,
+                                            with_breakdown=True):
+                scored = [result for result in results if 'error' not in result]
+                job["rows_written"] += await self._replace_chunk(job["company_id"], scored, versions)
+                self._progress(job, results, started)
+            self._finish(job)
+            logger.info(f"🧮 Bulk match job {job['id']}: {job['processed']} applicants, "
+                        f"{job['errors']} failed, {job['rows_written']} matches written")
+        except Exception as e:
+            self._finish(job, e)
+            logger.error(f"🧮 Bulk match job {job['id']} failed: {e}")
+    
+    async def _replace_chunk(self, company_id: str, results: List[Dict], versions: Dict[str, Dict]) -> int:
+        """Upsert a chunk's pairs, then delete its applicants' pairs this pass did not write"""
+        computed_at = datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        rows = [
+            {
+                'company_id': result['company_id'],
+                'applicant_id': result['applicant_id'],
+                'project_id': match['project_id'],
+                'score': match['match_score'],
+                'recommendation': match['recommendation'],
+                'factors': match['breakdown'],
+                'applicant_updated_at': versions['applicant'].get(result['applicant_id']),
+                'project_updated_at': versions['project'].get(match['project_id']),
+                'computed_at': computed_at
+            }
+            for result in results
+            for match in result['matches']
+        ]
+        for start in range(0, len(rows), match_materializer.batch_size):
+            await db.table(MatchMaterializer.TABLE).upsert(
+                rows[start:start + match_materializer.batch_size],
+                on_conflict='applicant_id,project_id', returning=ReturnMethod.minimal
+            ).execute()
+        # Pairs these applicants kept from an earlier pass have dropped below the threshold
+        applicant_ids = [result['applicant_id'] for result in results]
+        for start in range(0, len(applicant_ids), self.DELETE_BATCH_SIZE):
+            await db.table(MatchMaterializer.TABLE).delete(returning=ReturnMethod.minimal).eq(
+                'company_id', company_id
+            ).in_('applicant_id', applicant_ids[start:start + self.DELETE_BATCH_SIZE]).lt(
+                'computed_at', computed_at
+            ).execute()
+        return len(rows)
+    
+    def start_table_job(self, job: Dict[str, Any], applicants: List[Dict], projects: List[Dict]) -> None:
+        task = asyncio.create_task(self.write_to_table(job, applicants, projects))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+    
+    async def stop(self) -> None:
+        """Cancel running table jobs and shut the pools down"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        for pool in self._pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        self._pools.clear()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "workers": self.workers,
+            "chunk_size": self.chunk_size,
+            "running": sum(1 for job in self.jobs.values() if job["status"] == "running")
+        }
+
+# Initialize bulk match runner
+bulk_match_runner = BulkMatchRunner()
+
+# Project Notification Fan-out
+class ProjectNotifier:
+    """Email matching applicants about new projects, off the request path.
+    
+    create_project queues a job and returns. The worker scores the company's
+    applicants against the project with the batch engine (prefiltered in the
+    database) and picks active applicants scoring at least NOTIFY_MIN_SCORE,
+    best first. Emails go out through Resend's batch endpoint, one request
+    per NOTIFY_EMAIL_BATCH_SIZE recipients. At most NOTIFY_EMAIL_CONCURRENCY
+    requests are in flight, request starts are spaced to stay under
+    NOTIFY_EMAIL_REQUESTS_PER_SECOND, and a 429 backs off and retries.
+    
+    Preferences are read once per batch and each batch logs one activity
+    row. Jobs live in memory: queued jobs not drained at shutdown are lost.
+    """
+    
+    NOTIFICATION_TYPE = 'new_projects'
+    SENDER = "HomeVerse <noreply@homeverse.io>"
+    
+    def __init__(self, min_score: float = NOTIFY_MIN_SCORE,
+                 batch_size: int = NOTIFY_EMAIL_BATCH_SIZE,
+                 concurrency: int = NOTIFY_EMAIL_CONCURRENCY,
+                 requests_per_second: float = NOTIFY_EMAIL_REQUESTS_PER_SECOND):
+        self.min_score = min_score
+        self.batch_size = min(max(batch_size, 1), 100)
+        self.concurrency = max(concurrency, 1)
+        self.interval = 1 / requests_per_second if requests_per_second > 0 else 0.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._next_request_at = 0.0
+        self.stats = {
+            "jobs": 0, "failed_jobs": 0, "candidates": 0, "recipients": 0, "sent": 0,
+            "opted_out": 0, "batches": 0, "failed_batches": 0, "rate_limited": 0
+        }
+    
+    def enqueue(self, project: Dict, company_id: str) -> bool:
+        """Queue emails about a newly created project; False if email is not configured"""
+        if not RESEND_AVAILABLE or not RESEND_API_KEY:
+            logger.warning(f"📧 Email not sent - Resend not configured: new project {project.get('name')}")
+            return False
+        if self._task is None:
+            # Not started via the app lifecycle (e.g. scripts) - start lazily
+            self._start()
+        self._queue.put_nowait((project, company_id))
+        return True
+    
+    async def recipients(self, project: Dict, company_id: str) -> List[str]:
+        """Ids of the company's applicants scoring at least min_score, best first"""
+        prefilter = matching_engine.applicant_prefilter(project, self.min_score)
+        candidates = await repository.list_match_candidates(company_id, prefilter)
+        self.stats["candidates"] += len(candidates)
+        batch = matching_engine.score_applicants(project, candidates)
+        return [candidates[i]['id'] for i in batch.ranked(min_score=self.min_score)]
+    
+    async def _opted_out(self, user_ids: set) -> set:
+        """User ids whose profile turns off this notification type (one query per batch)"""
+        if not user_ids:
+            return set()
+        key = f"email_{self.NOTIFICATION_TYPE}"
+        try:
+            result = await db.table('profiles').select('*').in_('id', list(user_ids)).execute()
+        except Exception as e:
+            logger.warning(f"📧 Could not check user preferences: {e}")
+            return set()
+        opted_out = set()
+        for profile in result.data or []:
+            preferences = profile.get('notification_preferences') or {}
+            if profile.get(key, preferences.get(key, True)) is False:
+                opted_out.add(profile['id'])
+        return opted_out
+    
+    async def _pace(self) -> None:
+        """Space request starts at least 1 / NOTIFY_EMAIL_REQUESTS_PER_SECOND apart"""
+        now = time.monotonic()
+        start = max(now, self._next_request_at)
+        self._next_request_at = start + self.interval
+        if start > now:
+            await asyncio.sleep(start - now)
+    
+    async def _request(self, messages: List[Dict[str, Any]]) -> None:
+        """One Resend batch request, retried with backoff while rate limited"""
+        for attempt in range(NOTIFY_EMAIL_MAX_RETRIES + 1):
+            await self._pace()
+            try:
+                await offloader.run("email", resend.Batch.send, messages)
+                return
+            except Exception as e:
+                if str(getattr(e, 'code', '')) != '429' or attempt == NOTIFY_EMAIL_MAX_RETRIES:
+                    raise
+                self.stats["rate_limited"] += 1
+                await asyncio.sleep(min(2 ** attempt, 30))
+    
+    async def _send_batch(self, project: Dict, company_id: str, applicant_ids: List[str],
+                          subject: str, html_content: str) -> int:
+        async with self._semaphore:
+            rows = await repository.get_applicants_by_ids(applicant_ids)
+            applicants = [
+                pii_encryption.decrypt_dict(row, PII_FIELDS['applicants'])
+                for row in rows if row.get('status') == 'active'
+            ]
+            applicants = [a for a in applicants if a.get('email')]
+            opted_out = await self._opted_out({a['user_id'] for a in applicants if a.get('user_id')})
+            emails = [a['email'] for a in applicants if a.get('user_id') not in opted_out]
+            self.stats["opted_out"] += len(applicants) - len(emails)
+            if not emails:
+                return 0
+            
+            await self._request([
+                {"from": self.SENDER, "to": [email], "subject": subject, "html": html_content}
+                for email in emails
+            ])
+            self.stats["batches"] += 1
+            self.stats["sent"] += len(emails)
+        
+        await activity_logger.log({
+            'company_id': company_id,
+            'action': 'email_sent',
+            'resource_type': 'notification',
+            'resource_id': project['id'],
+            'details': {
+                'subject': subject,
+                'notification_type': self.NOTIFICATION_TYPE,
+                'recipients': len(emails),
+                'status': 'sent'
+            }
+        })
+        return len(emails)
+    
+    async def notify(self, project: Dict, company_id: str) -> int:
+        """Email every matching applicant about a project; returns the number of emails sent"""
+        resend.api_key = RESEND_API_KEY
+        applicant_ids = await self.recipients(project, company_id)
+        self.stats["recipients"] += len(applicant_ids)
+        subject = f"🏠 New Affordable Housing: {project.get('name')}"
+        html_content = self.email_html(project)
+        
+        results = await asyncio.gather(*(
+            self._send_batch(project, company_id, applicant_ids[start:start + self.batch_size], subject, html_content)
+            for start in range(0, len(applicant_ids), self.batch_size)
+        ), return_exceptions=True)
+        for error in (r for r in results if isinstance(r, Exception)):
+            self.stats["failed_batches"] += 1
+            logger.error(f"📧 New project email batch failed for project {project['id']}: {error}")
+        sent = sum(r for r in results if not isinstance(r, Exception))
+        logger.info(f"📧 Notified {sent} of {len(applicant_ids)} matching applicants about project {project['id']}")
+        return sent
+    
+    @staticmethod
+    def email_html(project: Dict) -> str:
+        return f"""
+        <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
+            <h2 style="color: #0d9488;">New Affordable Housing Available!</h2>
+            
+            <div style="background: #f0fdfa; padding: 20px; border-radius: 8px; margin: 20px 0;">
+                <h3 style="color: #0d9488; margin-top: 0;">Project Details</h3>
+                <p><strong>Name:</strong> {project.get('name')}</p>
+                <p><strong>Location:</strong> {project.get('address')}, {project.get('city')}, {project.get('state')}</p>
+                <p><strong>Total Units:</strong> {project.get('total_units')}</p>
+                {f"<p><strong>Affordable Units:</strong> {project['affordable_units']}</p>" if project.get('affordable_units') else ""}
+                {f"<p><strong>Description:</strong> {project['description']}</p>" if project.get('description') else ""}
+            </div>
+            
+            <div style="background: #e0f2fe; padding: 15px; border-radius: 8px; margin: 20px 0;">
+                <p style="margin: 0; color: #0277bd;">
+                    <strong>📅 Apply Now:</strong> This is a new opportunity that matches your housing preferences. 
+                    Applications are typically processed on a first-come, first-served basis.
+                </p>
+            </div>
+            
+            <div style="text-align: center; margin: 30px 0;">
+                <a href="http://localhost:3000/dashboard/projects/{project['id']}" 
+                   style="background: #0d9488; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">
+                    View Project Details
+                </a>
+            </div>
+            
+            <p style="color: #64748b; font-size: 14px; margin-top: 30px;">
+                This notification was sent because you're on our affordable housing waiting list.<br>
+                You can update your housing preferences in your account settings.
+            </p>
+        </div>
+        """
+    
+    async def _run(self) -> None:
+        while True:
+            project, company_id = await self._queue.get()
+            try:
+                self.stats["jobs"] += 1
+                await self.notify(project, company_id)
+            except Exception as e:
+                self.stats["failed_jobs"] += 1
+                logger.warning(f"📧 Failed to send new project notification emails: {e}")
+            finally:
+                self._queue.task_done()
+    
+    def _start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._task = asyncio.create_task(self._run())
+    
+    async def start(self) -> None:
+        if self._task is None:
+            self._start()
+    
+    async def stop(self) -> None:
+        """Finish queued jobs (up to NOTIFY_DRAIN_TIMEOUT), then stop"""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), NOTIFY_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"📧 Notification drain timed out - {self._queue.qsize()} jobs dropped")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._queue = None
+    
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "min_score": self.min_score,
+            "queued": self._queue.qsize() if self._queue else 0
+        }
+
+# Initialize project notifier
+project_notifier = ProjectNotifier()
+
+# Heatmap Binning
+class HeatmapBinning:
+    """Bins a heatmap layer into H3 hexagons at a resolution that fits the view.
+    
+    A layer's rows (applicants for demand, projects for supply, both for gap)
+    are binned once at the base resolution; each coarser level
+    sums the cells of the level below (`rollup`) instead of re-reading rows.
+    A view asks for the finest resolution at which its bounds, or a map tile
+    at its zoom, span about max_zones hexagons, and the rollup keeps
+    coarsening until the occupied cells fit, so zones stay bounded. Without
+    H3 (HEATMAP_HEX_BINNING=false, or neither the h3 extension nor the h3
+    package) zones fall back to a degree grid sized the same way.
+    """
+    
+    DEMAND_COUNTS = ('applicant_count', 'total_income', 'total_household_size')
+    SUPPLY_COUNTS = ('project_count', 'total_units', 'affordable_units')
+    # Rows each layer bins, and the counts its zones carry
+    LAYER_SOURCES = {"demand": ('applicant',), "supply": ('project',), "gap": ('applicant', 'project')}
+    LAYER_COUNTS = {"demand": DEMAND_COUNTS, "supply": SUPPLY_COUNTS, "gap": DEMAND_COUNTS + SUPPLY_COUNTS}
+    
+    # Average hexagon area in km² per resolution (h3.average_hexagon_area)
+    HEX_AREA_KM2 = (
+        4357449.416, 609788.4418, 86801.78040, 12393.43466, 1770.347654, 252.9038582,
+        36.12906216, 5.161293360, 0.7373275976, 0.1053325134, 0.01504750191,
+        0.002149643129, 0.0003070918756, 0.00004387026795, 0.000006267181135, 0.0000008953115908
+    )
+    KM_PER_DEGREE = 111.32
+    
+    def __init__(self, base_resolution: int = HEATMAP_H3_BASE_RESOLUTION, max_zones: int = HEATMAP_MAX_ZONES):
+        self.base_resolution = max(0, min(base_resolution, len(self.HEX_AREA_KM2) - 1))
+        self.max_zones = max_zones
+    
+    def finest_fitting(self, area_km2: float, cells: int) -> int:
+        """Finest resolution (up to the base) at which area_km2 spans at most `cells` hexagons"""
+        for resolution in range(self.base_resolution, -1, -1):
+            if area_km2 / self.HEX_AREA_KM2[resolution] <= cells:
+                return resolution
+        return 0
+    
+    def bbox_km2(self, bbox: Dict[str, float]) -> float:
+        mid_lat = math.radians((bbox["lat1"] + bbox["lat2"]) / 2)
+        height = abs(bbox["lat2"] - bbox["lat1"]) * self.KM_PER_DEGREE
+        width = abs(bbox["lng2"] - bbox["lng1"]) * self.KM_PER_DEGREE * abs(math.cos(mid_lat))
+        return height * width
+    
+    def resolution(self, bbox: Optional[Dict[str, float]] = None, zoom: Optional[int] = None,
+                   bins: int = HEATMAP_TILE_BINS) -> int:
+        """H3 resolution for a zoom level (about `bins` hexagons along a tile edge) or for bounds"""
+        if zoom is not None:
+            tile_km = 360 * self.KM_PER_DEGREE / 2 ** max(zoom, 0)
+            return self.finest_fitting(tile_km ** 2, bins ** 2)
+        if bbox is not None:
+            return self.finest_fitting(self.bbox_km2(bbox), self.max_zones)
+        return self.base_resolution
+    
+    def grid_degrees(self, bbox: Optional[Dict[str, float]] = None, zoom: Optional[int] = None,
+                     bins: int = HEATMAP_TILE_BINS) -> float:
+        """Degree grid cell size for the same view when hexagons are unavailable"""
+        if zoom is not None:
+            return max(HEATMAP_CLUSTER_DEGREES, 360 / (2 ** max(zoom, 0) * bins))
+        if bbox is not None:
+            area = abs(bbox["lat2"] - bbox["lat1"]) * abs(bbox["lng2"] - bbox["lng1"])
+            return max(HEATMAP_CLUSTER_DEGREES, math.sqrt(area / max(self.max_zones, 1)))
+        return HEATMAP_CLUSTER_DEGREES
+    
+    @staticmethod
+    def contribution(kind: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        """What one 'applicant' (demand) or 'project' (supply) row adds to its cell"""
+        if kind == 'applicant':
+            # float: asyncpg returns NUMERIC incomes as Decimal, which JSON cannot carry
+            return {"applicant_count": 1, "total_income": float(row.get("income", 0) or 0),
+                    "total_household_size": row.get("household_size", 1) or 1}
+        return {"project_count": 1, "total_units": row.get("total_units") or 0,
+                "affordable_units": row.get("affordable_units") or 0}
+    
+    @staticmethod
+    def rollup(cells: Dict[int, Dict[str, Any]], resolution: int) -> Dict[int, Dict[str, Any]]:
+        """Sum cells into their parents at a coarser resolution"""
+        parents: Dict[int, Dict[str, Any]] = {}
+        for cell, counts in cells.items():
+            parent = h3.cell_to_parent(cell, resolution)
+            if parent not in parents:
+                parents[parent] = dict.fromkeys(counts, 0)
+            totals = parents[parent]
+            for name, value in counts.items():
+                totals[name] += value
+        return parents
+    
+    def bin(self, applicants: List[Dict[str, Any]], resolution: int, max_zones: int,
+            projects: Optional[List[Dict[str, Any]]] = None, layer: str = "demand") -> tuple:
+        """(resolution used, zones) for a layer's rows, rolled up from the base resolution"""
+        cells: Dict[int, Dict[str, Any]] = {}
+        sources = [('applicant', applicants), ('project', projects or [])]
+        for kind, rows in sources:
+            if kind not in self.LAYER_SOURCES[layer]:
+                continue
+            for row in rows:
+                lat, lng = row.get("latitude"), row.get("longitude")
+                if lat and lng:
+                    cell = h3.latlng_to_cell(lat, lng, self.base_resolution)
+                    if cell not in cells:
+                        cells[cell] = dict.fromkeys(self.LAYER_COUNTS[layer], 0)
+                    for name, value in self.contribution(kind, row).items():
+                        cells[cell][name] += value
+        return self.roll(cells, resolution, max_zones)
+    
+    def roll(self, cells: Dict[int, Dict[str, Any]], resolution: int, max_zones: int) -> tuple:
+        """(resolution used, zones) for base-resolution cells, rolled up until at most max_zones remain"""
+        level = max(0, min(resolution, self.base_resolution))
+        if level < self.base_resolution:
+            cells = self.rollup(cells, level)
+        while len(cells) > max_zones and level > 0:
+            level -= 1
+            cells = self.rollup(cells, level)
+        zones = []
+        for cell in sorted(cells):
+            lat, lng = h3.cell_to_latlng(cell)
+            zones.append({"cell": cell, "lat": lat, "lng": lng, **cells[cell]})
+        return level, zones
+    
+    async def aggregates(self, bbox: Optional[Dict[str, float]] = None, zoom: Optional[int] = None,
+                         max_zones: Optional[int] = None, bins: int = HEATMAP_TILE_BINS,
+                         layer: str = "demand") -> Dict[str, Any]:
+        """Repository heatmap aggregates of a layer for a view, plus the `binning` and `resolution` used"""
+        max_zones = self.max_zones if max_zones is None else max_zones
+        if HEATMAP_HEX_BINNING:
+            resolution = self.resolution(bbox, zoom, bins)
+            aggregates = None
+            if heatmap_cells.enabled:
+                aggregates = await heatmap_cells.aggregates(bbox, resolution, max_zones, layer)
+            if aggregates is None:
+                aggregates = await repository.heatmap_hex_aggregates(bbox, resolution, max_zones, layer)
+            if aggregates is not None:
+                return {**aggregates, "binning": "h3"}
+        degrees = self.grid_degrees(bbox, zoom, bins)
+        aggregates = await repository.heatmap_aggregates(bbox, degrees, layer)
+        return {**aggregates, "binning": "grid", "resolution": degrees}
+
+# Initialize heatmap binning
+heatmap_binning = HeatmapBinning()
+
+def heatmap_zone(zone: Dict[str, Any]) -> Dict[str, Any]:
+    """Position of an aggregated cell, with its H3 ids when hex-binned"""
+    position = {"lat": float(zone["lat"]), "lng": float(zone["lng"])}
+    if zone.get("cell") is not None:
+        # Integer H3 index, plus its hex string for JavaScript clients (ids exceed 2**53)
+        position["cell"] = int(zone["cell"])
+        position["h3_index"] = format(int(zone["cell"]), "x")
+    return position
+
+def heatmap_demand_zones(zones: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Demand zones from aggregated cells; intensity is relative to the busiest zone"""
+    max_count = max([zone["applicant_count"] for zone in zones], default=1)
+    return [{
+        **heatmap_zone(zone),
+        "intensity": min(zone["applicant_count"] / max_count, 1.0),
+        "applicant_count": zone["applicant_count"],
+        "avg_income": round(float(zone["total_income"]) / zone["applicant_count"], 0),
+        "avg_household_size": round(float(zone["total_household_size"]) / zone["applicant_count"], 1)
+    } for zone in zones if zone["applicant_count"] > 0]
+
+def heatmap_supply_zones(zones: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Supply zones from aggregated cells; intensity is relative to the most affordable units"""
+    max_units = max([zone["affordable_units"] for zone in zones], default=0) or 1
+    return [{
+        **heatmap_zone(zone),
+        "intensity": min(max(zone["affordable_units"], 0) / max_units, 1.0),
+        "project_count": zone["project_count"],
+        "total_units": zone["total_units"],
+        "affordable_units": zone["affordable_units"]
+    } for zone in zones if zone["project_count"] > 0]
+
+def heatmap_gap_zones(zones: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Gap zones: affordable units minus applicants per cell.
+    
+    Negative gaps are shortages; intensity is relative to the largest shortage
+    (0 where supply covers demand).
+    """
+    max_shortage = max([zone["applicant_count"] - zone["affordable_units"] for zone in zones], default=0)
+    max_shortage = max_shortage if max_shortage > 0 else 1
+    return [{
+        **heatmap_zone(zone),
+        "supply": zone["affordable_units"],
+        "demand": zone["applicant_count"],
+        "gap": zone["affordable_units"] - zone["applicant_count"],
+        "intensity": min(max(zone["applicant_count"] - zone["affordable_units"], 0) / max_shortage, 1.0)
+    } for zone in zones if zone["applicant_count"] > 0 or zone["project_count"] > 0]
+
+# Heatmap Tiles
+
+class HeatmapTileService:
+    """Heatmap aggregates per web-map tile (zoom, x, y), served from a cache.
+    
+    A tile holds the demand zones and supply totals of rows inside its
+    bounds. Zones are H3 hexagons about 1/HEATMAP_TILE_BINS of the tile edge
+    across (HeatmapBinning), at most HEATMAP_TILE_BINS² per tile, so each
+    zoom level has its own cell size. Tiles live in an in-memory LRU
+    and, when HEATMAP_TILE_CACHE_DIR is set, as JSON files on disk. Entries
+    expire after HEATMAP_TILE_TTL_SECONDS.
+    
+    An applicant or project write touches one tile per zoom level around
+    its old and new coordinates. Those tiles are dropped; a background task
+    rebuilds the ones held in memory and deletes the others from disk. While
+    a tile is being built, writes bump its version, which stops a build that
+    overlapped a write from caching its result; versions are dropped once no
+    build of the tile is running, so they stay bounded by concurrent builds.
+    Other workers see the change when their entry expires.
+    """
+    
+    MAX_LATITUDE = 85.05112878  # Web Mercator limit
+    
+    def __init__(self, max_zoom: int = HEATMAP_TILE_MAX_ZOOM, bins: int = HEATMAP_TILE_BINS,
+                 max_entries: int = HEATMAP_TILE_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = HEATMAP_TILE_TTL_SECONDS,
+                 cache_dir: str = HEATMAP_TILE_CACHE_DIR):
+        self.max_zoom = max_zoom
+        self.bins = bins
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.cache_dir = cache_dir
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._versions: Dict[tuple, int] = {}
+        self._building: Dict[tuple, int] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pending: Dict[tuple, bool] = {}
+        self.stats = {
+            "hits": 0, "disk_hits": 0, "misses": 0, "builds": 0, "evictions": 0,
+            "invalidations": 0, "rebuilds": 0, "failed": 0
+        }
+    
+    def valid(self, z: int, x: int, y: int) -> bool:
+        return 0 <= z <= self.max_zoom and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+    
+    @staticmethod
+    def tile_bounds(z: int, x: int, y: int) -> Dict[str, float]:
+        """Lat/lng bounding box of a tile"""
+        n = 2 ** z
+        def latitude(row: int) -> float:
+            return math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * row / n))))
+        return {"lat1": latitude(y + 1), "lng1": x / n * 360 - 180, "lat2": latitude(y), "lng2": (x + 1) / n * 360 - 180}
+    
+    def tile_for(self, lat: float, lng: float, z: int) -> tuple:
+        """Tile containing a point"""
+        n = 2 ** z
+        lat = max(min(lat, self.MAX_LATITUDE), -self.MAX_LATITUDE)
+        x = int((lng + 180) / 360 * n)
+        y = int((1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n)
+        return (z, min(max(x, 0), n - 1), min(max(y, 0), n - 1))
+    
+    def resolution(self, z: int) -> float:
+        """Grid cell size in degrees at a zoom level"""
+        return 360 / (2 ** z * self.bins)
+    
+    async def build(self, z: int, x: int, y: int) -> Dict[str, Any]:
+        bbox = self.tile_bounds(z, x, y)
+        aggregates = await heatmap_binning.aggregates(bbox, zoom=z, max_zones=self.bins ** 2, bins=self.bins)
+        self.stats["builds"] += 1
+        return {
+            "tile": {"z": z, "x": x, "y": y},
+            "bounds": bbox,
+            "demand_zones": heatmap_demand_zones(aggregates["zones"]),
+            "statistics": {
+                "total_projects": aggregates["total_projects"],
+                "total_applicants": aggregates["total_applicants"],
+                "total_units": aggregates["total_units"],
+                "total_affordable_units": aggregates["total_affordable_units"]
+            },
+            "metadata": {
+                "generated_at": datetime.now().isoformat(),
+                "binning": aggregates["binning"],
+                "clustering_resolution": aggregates["resolution"]  # H3 resolution, or degrees for the grid
+            }
+        }
+    
+    def _path(self, key: tuple) -> str:
+        z, x, y = key
+        return os.path.join(self.cache_dir, str(z), str(x), f"{y}.json")
+    
+    def _read_file(self, path: str) -> Optional[Dict[str, Any]]:
+        try:
+            if time.time() - os.path.getmtime(path) >= self.ttl_seconds:
+                return None
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    def _write_file(self, path: str, payload: Dict[str, Any]) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        partial = f"{path}.{os.getpid()}.tmp"
+        with open(partial, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(partial, path)
+    
+    def _remove_file(self, path: str) -> bool:
+        try:
+            os.remove(path)
+            return True
+        except FileNotFoundError:
+            return False
+    
+    def _remember(self, key: tuple, payload: Dict[str, Any]) -> None:
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl_seconds, payload)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
+    
+    async def _build_and_store(self, key: tuple) -> Dict[str, Any]:
+        version = self._versions.get(key, 0)
+        self._building[key] = self._building.get(key, 0) + 1
+        try:
+            payload = await self.build(*key)
+            overtaken = self._versions.get(key, 0) != version
+        finally:
+            self._building[key] -= 1
+            if not self._building[key]:
+                del self._building[key]
+                self._versions.pop(key, None)
+        # Only cache what no write has overtaken
+        if not overtaken:
+            self._remember(key, payload)
+            if self.cache_dir:
+                try:
+                    await offloader.run("disk", self._write_file, self._path(key), payload)
+                except Exception as e:
+                    logger.warning(f"🗺️ Could not write heatmap tile {key} to disk: {e}")
+        return payload
+    
+    async def get(self, z: int, x: int, y: int) -> Dict[str, Any]:
+        """A tile from memory, then disk, building it on a miss"""
+        key = (z, x, y)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+        # A pending key was invalidated and its file may not be deleted yet
+        if self.cache_dir and key not in self._pending:
+            try:
+                payload = await offloader.run("disk", self._read_file, self._path(key))
+            except Exception:
+                payload = None
+            if payload is not None:
+                self._remember(key, payload)
+                self.stats["disk_hits"] += 1
+                return payload
+        self.stats["misses"] += 1
+        return await self._build_and_store(key)
+    
+    def _enqueue(self, key: tuple, rebuild: bool) -> None:
+        if key in self._pending:
+            self._pending[key] = self._pending[key] or rebuild
+            return
+        if self._task is None:
+            # Not started via the app lifecycle (e.g. scripts) - start lazily
+            self._start()
+        self._pending[key] = rebuild
+        self._queue.put_nowait(key)
+    
+    def invalidate_point(self, lat: Any, lng: Any) -> None:
+        """Drop every tile containing a point, one per zoom level"""
+        if not (lat and lng) or not isinstance(lat, (int, float)) or not isinstance(lng, (int, float)):
+            return
+        if not (math.isfinite(lat) and math.isfinite(lng)):
+            return
+        for z in range(self.max_zoom + 1):
+            key = self.tile_for(lat, lng, z)
+            if key in self._building:
+                self._versions[key] = self._versions.get(key, 0) + 1
+            self.stats["invalidations"] += 1
+            cached = self._entries.pop(key, None) is not None
+            if cached or self.cache_dir:
+                self._enqueue(key, rebuild=cached)
+    
+    def invalidate_rows(self, *rows: Optional[Dict[str, Any]]) -> None:
+        """Drop the tiles around each row's coordinates (pass old and new versions of a row)"""
+        for row in rows:
+            if row:
+                self.invalidate_point(row.get('latitude'), row.get('longitude'))
+    
+    async def precompute(self, max_zoom: int) -> int:
+        """Queue builds for every tile up to max_zoom that contains applicants"""
+        max_zoom = max(0, min(max_zoom, self.max_zoom))
+        aggregates = await repository.heatmap_aggregates(None, self.resolution(max_zoom))
+        keys = set()
+        for zone in aggregates["zones"]:
+            for z in range(max_zoom + 1):
+                keys.add(self.tile_for(float(zone["lat"]), float(zone["lng"]), z))
+        for key in sorted(keys):
+            self._enqueue(key, rebuild=True)
+        return len(keys)
+    
+    async def _process(self, key: tuple) -> None:
+        rebuild = self._pending.pop(key, False)
+        try:
+            if self.cache_dir:
+                removed = await offloader.run("disk", self._remove_file, self._path(key))
+                rebuild = rebuild or removed
+            if rebuild:
+                await self._build_and_store(key)
+                self.stats["rebuilds"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            logger.error(f"🗺️ Heatmap tile {key} rebuild failed: {e}")
+    
+    async def _run(self) -> None:
+        while True:
+            key = await self._queue.get()
+            try:
+                await self._process(key)
+            finally:
+                self._queue.task_done()
+    
+    def _start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+    
+    async def start(self) -> None:
+        if self._task is None:
+            self._start()
+    
+    async def stop(self) -> None:
+        """Stop rebuilding; queued rebuilds are dropped (tiles rebuild on demand)"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._queue = None
+        self._pending.clear()
+    
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round((self.stats["hits"] + self.stats["disk_hits"]) / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "building": len(self._building),
+            "disk_cache": bool(self.cache_dir),
+            "queued": self._queue.qsize() if self._queue else 0
+        }
+
+# Initialize heatmap tile service
+heatmap_tiles = HeatmapTileService()
 
-@app.get("/health")
-async def health_check():
-    try:
-        # Test Supabase connection
-        result = supabase.table('companies').select('count').limit(1).execute()
-        return {
-            "status": "healthy",
-            "database": "connected",
-            "timestamp": datetime.now().isoformat()
+# Heatmap Cell Aggregates
+class HeatmapCellAggregates:
+    """Running demand/supply totals per (company, H3 cell) in the heatmap_cells table.
+    
+    Cells are HEATMAP_H3_BASE_RESOLUTION hexagons; cell 0 holds rows without
+    coordinates. Applicant and project writes queue signed deltas for the
+    cells of the row's old and new versions. A background task merges queued
+    deltas per cell, applies them with one apply_heatmap_cell_deltas() call
+    and then drops the heatmap tiles around the touched cells. Heatmap and
+    dashboard reads sum stored cells, O(cells) rather than O(rows); a cell
+    is inside a bounding box when its centre is.
+    
+    Deltas can drift from the rows (a failed flush, writes outside the API).
+    Reconciliation recomputes the cells from the rows at startup and every
+    HEATMAP_CELLS_RECONCILE_SECONDS, in one reconcile_heatmap_cells() call
+    (INSERT ... SELECT ... GROUP BY company_id, cell). A write's delta can
+    land after a pass that already counted its row, so companies this
+    process writes to during a pass are recomputed again once their deltas
+    are applied. Without the h3 extension the cells are recomputed here from
+    paged reads and swapped in with one replace_heatmap_cells() call per
+    company, skipping companies written to during the pass.
+    """
+    
+    COUNTS = HeatmapBinning.LAYER_COUNTS["gap"]
+    UNLOCATED = 0
+    SQL_PASSES = 3  # reconcile_heatmap_cells() calls per reconciliation, counting re-runs for written companies
+    
+    def __init__(self, enabled: bool = HEATMAP_CELL_AGGREGATES,
+                 reconcile_seconds: float = HEATMAP_CELLS_RECONCILE_SECONDS,
+                 batch_size: int = HEATMAP_CELLS_BATCH_SIZE):
+        if enabled and not H3_AVAILABLE:
+            logger.warning("⚠️ HEATMAP_CELL_AGGREGATES=true but the h3 package is not installed - heatmaps read rows")
+            enabled = False
+        self.enabled = enabled
+        self.reconcile_seconds = reconcile_seconds
+        self.batch_size = batch_size
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._reconcile_task: Optional[asyncio.Task] = None
+        self._touched: Optional[set] = None  # companies written during a reconciliation
+        self._lock: Optional[asyncio.Lock] = None
+        self._sql_warned = False
+        self.last_reconciled: Optional[str] = None
+        self.stats = {
+            "enqueued": 0, "flushes": 0, "cells_written": 0, "failed_flushes": 0, "reads": 0,
+            "live_fallbacks": 0, "reconciliations": 0, "cells_reconciled": 0, "companies_skipped": 0
         }
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
+    
+    def cell(self, lat: Any, lng: Any) -> int:
+        """Base-resolution H3 cell of a point (UNLOCATED without coordinates)"""
+        if lat and lng:
+            return h3.latlng_to_cell(lat, lng, heatmap_binning.base_resolution)
+        return self.UNLOCATED
+    
+    def add(self, cells: Dict[tuple, Dict[str, Any]], kind: str, row: Dict[str, Any], sign: int = 1) -> None:
+        """Add (or with sign=-1, remove) a row's contribution, keyed by (company_id, cell)"""
+        if not row.get('company_id'):
+            return
+        key = (str(row['company_id']), self.cell(row.get('latitude'), row.get('longitude')))
+        if key not in cells:
+            cells[key] = dict.fromkeys(self.COUNTS, 0)
+        totals = cells[key]
+        for name, value in HeatmapBinning.contribution(kind, row).items():
+            totals[name] += sign * value
+    
+    def _row(self, key: tuple, totals: Dict[str, Any]) -> Dict[str, Any]:
+        company_id, cell = key
+        lat, lng = h3.cell_to_latlng(cell) if cell != self.UNLOCATED else (None, None)
+        return {"company_id": company_id, "cell": cell, "latitude": lat, "longitude": lng, **totals}
+    
+    def record(self, kind: str, old: Optional[Dict[str, Any]] = None, new: Optional[Dict[str, Any]] = None) -> None:
+        """Queue the cell deltas of an 'applicant' or 'project' write (old row out, new row in)"""
+        if not self.enabled:
+            return
+        deltas: Dict[tuple, Dict[str, Any]] = {}
+        if old:
+            self.add(deltas, kind, old, -1)
+        if new:
+            self.add(deltas, kind, new)
+        deltas = {key: totals for key, totals in deltas.items() if any(totals.values())}
+        if not deltas:
+            return
+        if self._touched is not None:
+            self._touched.update(company_id for company_id, _ in deltas)
+        if self._task is None:
+            # Not started via the app lifecycle (e.g. scripts) - start lazily
+            self._start()
+        self.stats["enqueued"] += 1
+        self._queue.put_nowait(deltas)
+    
+    async def _flush(self, batch: List[Dict[tuple, Dict[str, Any]]]) -> None:
+        merged: Dict[tuple, Dict[str, Any]] = {}
+        for deltas in batch:
+            for key, totals in deltas.items():
+                if key not in merged:
+                    merged[key] = dict.fromkeys(self.COUNTS, 0)
+                for name, value in totals.items():
+                    merged[key][name] += value
+        rows = [self._row(key, totals) for key, totals in merged.items() if any(totals.values())]
+        if not rows:
+            return
+        self.stats["flushes"] += 1
+        try:
+            await db.rpc('apply_heatmap_cell_deltas', {'deltas': rows}).execute()
+        except Exception as e:
+            # The next reconciliation repairs the cells
+            self.stats["failed_flushes"] += 1
+            logger.warning(f"🧮 Heatmap cell deltas failed ({e}) - {len(rows)} cells drift until reconciliation")
+            return
+        self.stats["cells_written"] += len(rows)
+        for row in rows:
+            heatmap_tiles.invalidate_point(row["latitude"], row["longitude"])
+            kinds = tuple(kind for kind, count in (('applicant', row["applicant_count"]), ('project', row["project_count"])) if count)
+            heatmap_layers.invalidate_point(kinds, row["latitude"], row["longitude"])
+    
+    async def _run(self) -> None:
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            try:
+                await self._flush(batch)
+            except Exception as e:
+                logger.error(f"🧮 Heatmap cell flush failed: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    async def reconcile(self) -> int:
+        """Recompute every company's cells from its rows; returns the number of cells written"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            if self._queue is not None:
+                # Deltas queued before the pass must land first, or it would count them twice
+                await self._queue.join()
+            self._touched = set()
+            try:
+                written = await self._reconcile_sql()
+                if written is None:
+                    written = await self._reconcile_rows()
+            finally:
+                self._touched = None
+            self.stats["reconciliations"] += 1
+            self.stats["cells_reconciled"] += written
+            self.last_reconciled = datetime.now(timezone.utc).isoformat()
+        logger.info(f"🧮 Reconciled {written} heatmap cells")
+        return written
+    
+    async def _reconcile_sql(self) -> Optional[int]:
+        """Recompute cells with reconcile_heatmap_cells(); None when the function cannot run"""
+        companies = None  # every company
+        written = 0
+        for _ in range(self.SQL_PASSES):
+            try:
+                result = await db.rpc('reconcile_heatmap_cells', {
+                    'base_resolution': heatmap_binning.base_resolution, 'only_companies': companies
+                }).execute()
+            except Exception as e:
+                if companies is not None:
+                    raise
+                if not self._sql_warned:
+                    self._sql_warned = True
+                    logger.warning(f"⚠️ reconcile_heatmap_cells() failed ({e}) - reconciling in Python; "
+                                   "apply supabase_heatmap_cells.sql with the h3 extension")
+                return None
+            written += result.data or 0
+            if not self._touched:
+                return written
+            # Their deltas may land after the pass counted the rows: recompute once they have
+            companies = sorted(self._touched)
+            self._touched = set()
+            if self._queue is not None:
+                await self._queue.join()
+        self.stats["companies_skipped"] += len(self._touched)
+        return written
+    
+    async def _reconcile_rows(self) -> int:
+        """Recompute cells from paged row reads and swap them in per company"""
+        applicants, projects, stored = await asyncio.gather(
+            repository.list_all_applicants(),
+            repository.list_projects_in_bounds(None),
+            repository.list_heatmap_cells(None)
+        )
+        by_company = await offloader.run("compute", self._company_cells, applicants, projects, stored)
+        written = 0
+        for company_id, rows in sorted(by_company.items()):
+            if company_id in self._touched:
+                self.stats["companies_skipped"] += 1
+                continue
+            await db.rpc('replace_heatmap_cells', {'company': company_id, 'cells': rows}).execute()
+            written += len(rows)
+        return written
+    
+    def _company_cells(self, applicants: List[Dict[str, Any]], projects: List[Dict[str, Any]],
+                       stored: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+        """Cell rows per company from applicant and project rows (empty for companies with stored cells only)"""
+        cells: Dict[tuple, Dict[str, Any]] = {}
+        for applicant in applicants:
+            self.add(cells, 'applicant', applicant)
+        for project in projects:
+            self.add(cells, 'project', project)
+        by_company: Dict[str, List[Dict[str, Any]]] = {str(row['company_id']): [] for row in stored}
+        for key, totals in cells.items():
+            by_company.setdefault(key[0], []).append(self._row(key, totals))
+        return by_company
+    
+    async def _reconcile_periodically(self) -> None:
+        while True:
+            try:
+                await self.reconcile()
+            except Exception as e:
+                logger.error(f"🧮 Heatmap cell reconciliation failed: {e}")
+            await asyncio.sleep(self.reconcile_seconds)
+    
+    async def aggregates(self, bbox: Optional[Dict[str, float]], resolution: int, max_zones: int,
+                         layer: str = "demand") -> Optional[Dict[str, Any]]:
+        """Repository.heatmap_hex_aggregates from stored cells; None when they cannot be read"""
+        try:
+            rows = await repository.list_heatmap_cells(bbox)
+        except Exception as e:
+            self.stats["live_fallbacks"] += 1
+            logger.warning(f"🧮 Could not read heatmap cells ({e}) - aggregating rows")
+            return None
+        self.stats["reads"] += 1
+        cells: Dict[int, Dict[str, Any]] = {}
+        for row in rows:
+            # Sum across companies
+            cell = int(row["cell"])
+            if cell not in cells:
+                cells[cell] = dict.fromkeys(self.COUNTS, 0)
+            for name in self.COUNTS:
+                cells[cell][name] += row[name] or 0
+        totals = {name: sum(cell[name] for cell in cells.values()) for name in self.COUNTS}
+        names = HeatmapBinning.LAYER_COUNTS[layer]
+        occupied = {
+            cell: {name: counts[name] for name in names} for cell, counts in cells.items()
+            if cell != self.UNLOCATED and any(counts[name] for name in names)
+        }
+        level, zones = heatmap_binning.roll(occupied, resolution, max_zones)
         return {
-            "status": "unhealthy",
-            "database": "disconnected",
-            "error": str(e)
+            "zones": zones,
+            "resolution": level,
+            "total_applicants": totals["applicant_count"],
+            "total_projects": totals["project_count"],
+            "total_units": totals["total_units"],
+            "total_affordable_units": totals["affordable_units"]
         }
-
-# Matching Algorithm Functions
-def calculate_distance(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
-    """Calculate distance between two points using Haversine formula"""
-    R = 3961  # Earth radius in miles
     
-    lat1_rad = math.radians(lat1)
-    lat2_rad = math.radians(lat2)
-    dlat = math.radians(lat2 - lat1)
-    dlng = math.radians(lng2 - lng1)
+    async def company_totals(self, company_id: str) -> Dict[str, Any]:
+        """COUNTS summed over one company's cells, or over its rows when cells are disabled"""
+        totals = dict.fromkeys(self.COUNTS, 0)
+        if self.enabled:
+            rows = await repository.list_heatmap_cells(None, company_id)
+            source = "cells"
+        else:
+            applicants, projects = await asyncio.gather(
+                repository.list_match_candidates(company_id, None),
+                repository.list_projects_in_bounds(None, company_id)
+            )
+            rows = [HeatmapBinning.contribution('applicant', a) for a in applicants]
+            rows += [HeatmapBinning.contribution('project', p) for p in projects]
+            source = "rows"
+        for row in rows:
+            for name in self.COUNTS:
+                totals[name] += row.get(name) or 0
+        return {**totals, "source": source}
+    
+    def _start(self) -> None:
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
     
-    a = (math.sin(dlat/2) * math.sin(dlat/2) + 
-         math.cos(lat1_rad) * math.cos(lat2_rad) * 
-         math.sin(dlng/2) * math.sin(dlng/2))
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    async def start(self) -> None:
+        if not self.enabled:
+            return
+        if self._task is None:
+            self._start()
+        if self._reconcile_task is None and self.reconcile_seconds > 0:
+            self._reconcile_task = asyncio.create_task(self._reconcile_periodically())
+    
+    async def stop(self) -> None:
+        """Stop reconciling and apply queued deltas (bounded by HEATMAP_CELLS_DRAIN_TIMEOUT)"""
+        if self._reconcile_task is not None:
+            self._reconcile_task.cancel()
+            try:
+                await self._reconcile_task
+            except asyncio.CancelledError:
+                pass
+            self._reconcile_task = None
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), HEATMAP_CELLS_DRAIN_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"🧮 Heatmap cell drain timed out - {self._queue.qsize()} writes drift until reconciliation")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._queue = None
     
-    return R * c
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "enabled": self.enabled,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "last_reconciled": self.last_reconciled
+        }
+
+# Initialize heatmap cell aggregates
+heatmap_cells = HeatmapCellAggregates()
+
+# Heatmap Layers
+def heatmap_project_markers(projects: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Project markers; intensity is the affordable share of a project's units"""
+    markers = []
+    for p in projects:
+        total_units = p.get("total_units", 0)
+        affordable_units = p.get("affordable_units", 0)
+        intensity = min(affordable_units / max(total_units, 1), 1.0) if total_units > 0 else 0
+        
+        markers.append({
+            "id": p["id"],
+            "name": p["name"],
+            "lat": p.get("latitude") or 37.7749,
+            "lng": p.get("longitude") or -122.4194,
+            "units": total_units,
+            "affordable_units": affordable_units,
+            "ami_percentage": p.get("ami_percentage", 80),
+            "intensity": intensity,
+            "status": p.get("status", "planning"),
+            "developer": p.get("developer_name", "Unknown"),
+            "price_range": p.get("price_range", "Contact for pricing")
+        })
+    return markers
 
-def calculate_match_score(applicant: Dict, project: Dict) -> Dict:
-    """Calculate match score between applicant and project"""
-    score = 0
-    breakdown = {}
+class HeatmapLayers:
+    """The heatmap's demand, supply and gap layers, built and cached per layer.
     
-    # Income qualification (40% weight)
-    applicant_income = applicant.get('income', 0)
-    project_max_income = project.get('ami_percentage', 100) * 50000 / 100  # Rough AMI calculation
+    A request builds only its data_type's layer: demand zones, or project
+    markers plus supply zones, or gap zones (affordable units minus
+    applicants per cell). Each layer's zones come from its own aggregation,
+    so a demand request never reads projects beyond the supply totals.
+    Layers are cached per (layer, bounds, zoom) for HEATMAP_LAYER_TTL_SECONDS.
     
-    if applicant_income <= project_max_income:
-        income_score = 40
-        breakdown['income'] = {'score': 40, 'qualified': True}
-    else:
-        # Partial score if close
-        ratio = project_max_income / applicant_income if applicant_income > 0 else 0
-        income_score = min(40, 40 * ratio)
-        breakdown['income'] = {'score': income_score, 'qualified': False}
-    
-    score += income_score
-    
-    # Location proximity (30% weight)
-    applicant_lat = applicant.get('latitude', 0)
-    applicant_lng = applicant.get('longitude', 0)
-    project_lat = project.get('latitude', 0)
-    project_lng = project.get('longitude', 0)
-    
-    if all([applicant_lat, applicant_lng, project_lat, project_lng]):
-        distance = calculate_distance(applicant_lat, applicant_lng, project_lat, project_lng)
-        
-        if distance <= 5:  # Within 5 miles
-            location_score = 30
-        elif distance <= 10:  # Within 10 miles
-            location_score = 20
-        elif distance <= 20:  # Within 20 miles
-            location_score = 10
-        else:
-            location_score = 0
-            
-        breakdown['location'] = {'score': location_score, 'distance': distance}
-    else:
-        location_score = 15  # Neutral score if no location data
-        breakdown['location'] = {'score': location_score, 'distance': None}
+    An applicant write drops the demand and gap entries whose bounds contain
+    it; a project write drops supply and gap entries. A per-layer generation
+    stops a build that overlapped a write from caching its result.
+    """
     
-    score += location_score
+    LAYER_KEYS = {"demand": ("demand_zones",), "supply": ("projects", "supply_zones"), "gap": ("gap_zones",)}
+    ALIASES = {"gap_analysis": "gap"}  # the frontend's name for the gap layer
     
-    # Household size fit (20% weight)
-    household_size = applicant.get('household_size', 1)
-    total_units = project.get('total_units', 0)
+    def __init__(self, max_entries: int = HEATMAP_LAYER_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = HEATMAP_LAYER_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._generations = dict.fromkeys(self.LAYER_KEYS, 0)
+        self._builds = SingleFlight("heatmap_layers")
+        self.stats = {"hits": 0, "misses": 0, "builds": 0, "evictions": 0, "invalidations": 0}
     
-    if total_units > 0:
-        # Prefer projects with multiple units for larger households
-        if household_size <= 2:
-            household_score = 20  # Any project works
-        elif household_size <= 4:
-            household_score = 20 if total_units >= 50 else 15  # Prefer larger developments
-        else:
-            household_score = 20 if total_units >= 100 else 10  # Need large developments
-    else:
-        household_score = 10
+    def layer(self, data_type: str) -> Optional[str]:
+        """Canonical layer name for a data_type, None when unknown"""
+        layer = self.ALIASES.get(data_type, data_type)
+        return layer if layer in self.LAYER_KEYS else None
     
-    breakdown['household'] = {'score': household_score, 'size': household_size}
-    score += household_score
+    async def build(self, layer: str, bbox: Optional[Dict[str, float]], zoom: Optional[int]) -> Dict[str, Any]:
+        if layer == "supply":
+            projects, aggregates = await asyncio.gather(
+                repository.list_projects_in_bounds(bbox),
+                heatmap_binning.aggregates(bbox, zoom, layer=layer)
+            )
+            payload = {
+                "projects": heatmap_project_markers(projects),
+                "supply_zones": heatmap_supply_zones(aggregates["zones"])
+            }
+        else:
+            aggregates = await heatmap_binning.aggregates(bbox, zoom, layer=layer)
+            zones = heatmap_demand_zones if layer == "demand" else heatmap_gap_zones
+            payload = {self.LAYER_KEYS[layer][0]: zones(aggregates["zones"])}
+        self.stats["builds"] += 1
+        
+        total_affordable_units = aggregates["total_affordable_units"]
+        total_units = aggregates["total_units"]
+        total_applicants = aggregates["total_applicants"]
+        return {
+            **payload,
+            "statistics": {
+                "total_projects": aggregates["total_projects"],
+                "total_applicants": total_applicants,
+                "total_units": total_units,
+                "total_affordable_units": total_affordable_units,
+                "supply_demand_ratio": round(total_affordable_units / max(total_applicants, 1), 2),
+                "avg_affordability_ratio": round(total_affordable_units / max(total_units, 1), 2),
+                "data_type": layer,
+                "bounds": bbox
+            },
+            "metadata": {
+                "generated_at": datetime.now().isoformat(),
+                "data_type": layer,
+                "bounds": bbox,
+                "binning": aggregates["binning"],
+                "clustering_resolution": aggregates["resolution"]  # H3 resolution, or degrees for the grid
+            }
+        }
     
-    # Availability (10% weight)
-    available_units = project.get('affordable_units', 0)
-    project_status = project.get('status', 'planning')
+    async def get(self, layer: str, bbox: Optional[Dict[str, float]] = None,
+                  zoom: Optional[int] = None) -> Dict[str, Any]:
+        """A layer from the cache, building it on a miss"""
+        key = (layer, tuple(bbox[k] for k in ("lat1", "lng1", "lat2", "lng2")) if bbox else None, zoom)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+        self.stats["misses"] += 1
+        generation = self._generations[layer]
+        payload = await self._builds.do(repr(key), lambda: self.build(layer, bbox, zoom))
+        # Only cache what no write has overtaken
+        if self._generations[layer] == generation and self.max_entries > 0:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return payload
     
-    if project_status == 'active' and available_units > 0:
-        availability_score = 10
-    elif project_status == 'active':
-        availability_score = 5
-    else:
-        availability_score = 0
+    def invalidate_point(self, kinds: tuple, lat: Any, lng: Any) -> None:
+        """Drop cached layers built from `kinds` ('applicant', 'project') whose bounds contain a point"""
+        layers = [layer for layer in self.LAYER_KEYS if set(kinds) & set(HeatmapBinning.LAYER_SOURCES[layer])]
+        for layer in layers:
+            self._generations[layer] += 1
+        located = isinstance(lat, (int, float)) and isinstance(lng, (int, float)) and bool(lat and lng)
+        for key in list(self._entries):
+            layer, bounds, _ = key
+            if layer not in layers:
+                continue
+            # Unbounded views count every row, located or not
+            if bounds is None or (located and bounds[0] <= lat <= bounds[2] and bounds[1] <= lng <= bounds[3]):
+                del self._entries[key]
+                self.stats["invalidations"] += 1
     
-    breakdown['availability'] = {'score': availability_score, 'status': project_status, 'units': available_units}
-    score += availability_score
+    def invalidate_rows(self, kind: str, *rows: Optional[Dict[str, Any]]) -> None:
+        """Drop the cached layers around each row's coordinates (pass old and new versions of a row)"""
+        for row in rows:
+            if row:
+                self.invalidate_point((kind,), row.get('latitude'), row.get('longitude'))
     
-    return {
-        'total_score': round(score, 1),
-        'match_percentage': round(score, 1),  # Score is already out of 100
-        'breakdown': breakdown,
-        'recommendation': 'excellent' if score >= 80 else 'good' if score >= 60 else 'fair' if score >= 40 else 'poor'
-    }
+    def snapshot(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "single_flight": self._builds.stats()
+        }
+
+# Initialize heatmap layers
+heatmap_layers = HeatmapLayers()
 
 # Authentication Endpoints
 @app.post("/api/v1/auth/register")
@@ -620,11 +4201,11 @@ async def register(request: Request, register_data: RegisterRequest):
     """Register a new user"""
     try:
         # Check if company exists
-        company = supabase.table('companies').select('*').eq('key', register_data.company_key).single().execute()
+        company = await db.table('companies').select('*').eq('key', register_data.company_key).single().execute()
         
         if not company.data:
             # Create new company if it doesn't exist
-            company = supabase.table('companies').insert({
+            company = await db.table('companies').insert({
                 "name": f"Company {register_data.company_key}",
                 "key": register_data.company_key
             }).execute()
@@ -635,7 +4216,7 @@ async def register(request: Request, register_data: RegisterRequest):
         # Register user with Supabase Auth
         # Use admin API to create user (bypasses email confirmation)
         try:
-            auth_response = supabase.auth.admin.create_user({
+            auth_response = await offloader.run("auth", supabase.auth.admin.create_user, {
                 "email": register_data.email,
                 "password": register_data.password,
                 "email_confirm": True,  # Auto-confirm email
@@ -651,7 +4232,7 @@ async def register(request: Request, register_data: RegisterRequest):
         except Exception as e:
             # Fallback to regular signup if admin method fails
             logger.warning(f"Admin create failed, trying regular signup: {str(e)}")
-            auth_response = supabase.auth.sign_up({
+            auth_response = await offloader.run("auth", supabase.auth.sign_up, {
                 "email": register_data.email,
                 "password": register_data.password,
                 "options": {
@@ -667,11 +4248,12 @@ async def register(request: Request, register_data: RegisterRequest):
                 raise HTTPException(status_code=400, detail="Registration failed")
         
         # Update profile with company_id and role
-        profile_update = supabase.table('profiles').update({
+        profile_update = await db.table('profiles').update({
             "company_id": company_id,
             "role": register_data.role,
             "full_name": register_data.full_name
         }).eq('id', auth_response.user.id).execute()
+        principal_cache.invalidate(auth_response.user.id)
         
         return {
             "message": "Registration successful",
@@ -694,10 +4276,10 @@ async def create_user_admin(request: RegisterRequest, user=Depends(get_current_u
     
     try:
         # Get company
-        company = supabase.table('companies').select('*').eq('key', request.company_key).single().execute()
+        company = await db.table('companies').select('*').eq('key', request.company_key).single().execute()
         
         if not company.data:
-            company = supabase.table('companies').insert({
+            company = await db.table('companies').insert({
                 "name": f"Company {register_data.company_key}",
                 "key": register_data.company_key
             }).execute()
@@ -706,7 +4288,7 @@ async def create_user_admin(request: RegisterRequest, user=Depends(get_current_u
             company_id = company.data['id']
         
         # Create user with admin API (always confirms email)
-        auth_response = supabase.auth.admin.create_user({
+        auth_response = await offloader.run("auth", supabase.auth.admin.create_user, {
             "email": request.email,
             "password": request.password,
             "email_confirm": True,
@@ -721,12 +4303,13 @@ async def create_user_admin(request: RegisterRequest, user=Depends(get_current_u
             raise HTTPException(status_code=400, detail="User creation failed")
         
         # Create profile
-        profile = supabase.table('profiles').insert({
+        profile = await db.table('profiles').insert({
             "id": auth_response.user.id,
             "company_id": company_id,
             "role": register_data.role,
             "full_name": register_data.full_name
         }).execute()
+        principal_cache.invalidate(auth_response.user.id)
         
         return {
             "message": "User created successfully",
@@ -747,7 +4330,7 @@ async def login(request: Request, login_data: LoginRequest):
     """Login user"""
     try:
         # Authenticate with Supabase
-        auth_response = supabase.auth.sign_in_with_password({
+        auth_response = await offloader.run("auth", supabase.auth.sign_in_with_password, {
             "email": login_data.email,
             "password": login_data.password
         })
@@ -756,7 +4339,7 @@ async def login(request: Request, login_data: LoginRequest):
             raise HTTPException(status_code=401, detail="Invalid credentials")
         
         # Get user profile
-        profile = supabase.table('profiles').select('*, companies(*)').eq('id', auth_response.user.id).single().execute()
+        profile = await db.table('profiles').select('*, companies(*)').eq('id', auth_response.user.id).single().execute()
         
         return {
             "access_token": auth_response.session.access_token,
@@ -801,7 +4384,7 @@ async def get_user_settings(user=Depends(get_current_user)):
     try:
         # Try to get user preferences from profiles table
         try:
-            result = supabase.table('profiles').select('preferences').eq('id', user['id']).single().execute()
+            result = await db.table('profiles').select('preferences').eq('id', user['id']).single().execute()
             preferences = result.data.get('preferences', {}) if result.data else {}
         except Exception as pref_error:
             logger.warning(f"Could not get preferences column (may not exist): {pref_error}")
@@ -869,7 +4452,7 @@ async def update_user_settings(settings: UserSettingsUpdate, user=Depends(get_cu
         # This is a temporary solution until we can add the preferences column
         try:
             # Try to get current preferences
-            result = supabase.table('profiles').select('preferences').eq('id', user['id']).single().execute()
+            result = await db.table('profiles').select('preferences').eq('id', user['id']).single().execute()
             current_prefs = result.data.get('preferences', {}) if result.data else {}
             
             # Merge with new settings
@@ -887,7 +4470,7 @@ async def update_user_settings(settings: UserSettingsUpdate, user=Depends(get_cu
                 current_prefs['display'].update(settings.display)
             
             # Try to update in database
-            supabase.table('profiles').update({
+            await db.table('profiles').update({
                 'preferences': current_prefs
             }).eq('id', user['id']).execute()
             
@@ -906,7 +4489,7 @@ async def update_company_settings(settings: CompanySettingsUpdate, user=Depends(
     """Update company settings"""
     try:
         # Get user's company
-        profile_result = supabase.table('profiles').select('company_id').eq('id', user['id']).single().execute()
+        profile_result = await db.table('profiles').select('company_id').eq('id', user['id']).single().execute()
         if not profile_result.data or not profile_result.data.get('company_id'):
             raise HTTPException(status_code=400, detail="User not associated with a company")
         
@@ -932,7 +4515,8 @@ async def update_company_settings(settings: CompanySettingsUpdate, user=Depends(
             update_data['description'] = settings.description
         
         if update_data:
-            supabase.table('companies').update(update_data).eq('id', company_id).execute()
+            await db.table('companies').update(update_data).eq('id', company_id).execute()
+            principal_cache.invalidate_company(company_id)
         
         return {"message": "Company settings updated successfully"}
     except Exception as e:
@@ -944,14 +4528,14 @@ async def get_company_settings(user=Depends(get_current_user)):
     """Get company settings"""
     try:
         # Get user's company
-        profile_result = supabase.table('profiles').select('company_id').eq('id', user['id']).single().execute()
+        profile_result = await db.table('profiles').select('company_id').eq('id', user['id']).single().execute()
         if not profile_result.data or not profile_result.data.get('company_id'):
             raise HTTPException(status_code=400, detail="User not associated with a company")
         
         company_id = profile_result.data['company_id']
         
         # Get company details
-        company_result = supabase.table('companies').select('*').eq('id', company_id).single().execute()
+        company_result = await db.table('companies').select('*').eq('id', company_id).single().execute()
         if not company_result.data:
             raise HTTPException(status_code=404, detail="Company not found")
         
@@ -964,146 +4548,38 @@ async def get_company_settings(user=Depends(get_current_user)):
 async def get_heatmap_data(
     data_type: str = "demand",
     bounds: str = None,
+    zoom: Optional[int] = Query(None, ge=0, le=30),  # 2 ** zoom sizes the zones
     user=Depends(get_current_user)
 ):
-    """Get heatmap data for analytics with enhanced filtering"""
+    """Get one heatmap layer for analytics with enhanced filtering.
+    
+    data_type picks the layer: "demand" (demand zones), "supply" (project
+    markers and supply zones) or "gap" / "gap_analysis" (gap zones). Zones
+    are H3 hexagons sized for `zoom` when given, else for `bounds`, and never
+    more than HEATMAP_MAX_ZONES of them.
+    """
     if user.get('role') not in ['lender', 'admin', 'developer', 'buyer']:
         raise HTTPException(status_code=403, detail="Access denied")
+    layer = heatmap_layers.layer(data_type)
+    if layer is None:
+        raise HTTPException(status_code=400, detail="data_type must be one of: demand, supply, gap")
+    
+    # Parse bounds if provided (format: "lat1,lng1,lat2,lng2")
+    bbox = None
+    if bounds:
+        try:
+            lat1, lng1, lat2, lng2 = map(float, bounds.split(','))
+            bbox = {"lat1": lat1, "lng1": lng1, "lat2": lat2, "lng2": lng2}
+        except:
+            logger.warning(f"Invalid bounds format: {bounds}")
     
     try:
-        # Parse bounds if provided (format: "lat1,lng1,lat2,lng2")
-        bbox = None
-        if bounds:
-            try:
-                lat1, lng1, lat2, lng2 = map(float, bounds.split(','))
-                bbox = {"lat1": lat1, "lng1": lng1, "lat2": lat2, "lng2": lng2}
-            except:
-                logger.warning(f"Invalid bounds format: {bounds}")
-
-        # Get all projects with their locations
-        projects_query = supabase.table('projects').select('*')
-        if bbox:
-            # Filter by bounding box if provided
-            projects_query = projects_query.gte('latitude', bbox['lat1']).lte('latitude', bbox['lat2'])
-            projects_query = projects_query.gte('longitude', bbox['lng1']).lte('longitude', bbox['lng2'])
-        
-        projects = projects_query.execute()
-        
-        # Get all applicants with their desired locations
-        applicants_query = supabase.table('applicants').select('*')
-        if bbox:
-            applicants_query = applicants_query.gte('latitude', bbox['lat1']).lte('latitude', bbox['lat2'])
-            applicants_query = applicants_query.gte('longitude', bbox['lng1']).lte('longitude', bbox['lng2'])
-        
-        applicants = applicants_query.execute()
-        
-        # Decrypt PII fields for all applicants
-        for i, applicant in enumerate(applicants.data or []):
-            applicants.data[i] = pii_encryption.decrypt_dict(applicant, PII_FIELDS['applicants'])
-        
-        # Enhanced project data
-        enhanced_projects = []
-        for p in projects.data or []:
-            # Calculate intensity based on affordable housing ratio
-            total_units = p.get("total_units", 0)
-            affordable_units = p.get("affordable_units", 0)
-            intensity = min(affordable_units / max(total_units, 1), 1.0) if total_units > 0 else 0
-            
-            enhanced_projects.append({
-                "id": p["id"],
-                "name": p["name"],
-                "lat": p.get("latitude") or 37.7749,
-                "lng": p.get("longitude") or -122.4194,
-                "units": total_units,
-                "affordable_units": affordable_units,
-                "ami_percentage": p.get("ami_percentage", 80),
-                "intensity": intensity,
-                "status": p.get("status", "planning"),
-                "developer": p.get("developer_name", "Unknown"),
-                "price_range": p.get("price_range", "Contact for pricing")
-            })
-
-        # Enhanced demand zones with clustering
-        demand_zones = []
-        applicant_locations = {}
-        
-        for a in applicants.data or []:
-            lat = a.get("latitude")
-            lng = a.get("longitude")
-            if lat and lng:
-                # Round coordinates to create clusters (0.01 degree = ~1km)
-                cluster_lat = round(lat, 2)
-                cluster_lng = round(lng, 2)
-                cluster_key = f"{cluster_lat},{cluster_lng}"
-                
-                if cluster_key not in applicant_locations:
-                    applicant_locations[cluster_key] = {
-                        "lat": cluster_lat,
-                        "lng": cluster_lng,
-                        "count": 0,
-                        "total_income": 0,
-                        "total_household_size": 0
-                    }
-                
-                cluster = applicant_locations[cluster_key]
-                cluster["count"] += 1
-                cluster["total_income"] += a.get("income", 0) or 0
-                cluster["total_household_size"] += a.get("household_size", 1) or 1
-
-        # Convert clusters to demand zones
-        max_count = max([loc["count"] for loc in applicant_locations.values()], default=1)
-        
-        for cluster in applicant_locations.values():
-            if cluster["count"] > 0:
-                intensity = min(cluster["count"] / max_count, 1.0)
-                avg_income = cluster["total_income"] / cluster["count"] if cluster["count"] > 0 else 0
-                avg_household_size = cluster["total_household_size"] / cluster["count"] if cluster["count"] > 0 else 1
-                
-                demand_zones.append({
-                    "lat": cluster["lat"],
-                    "lng": cluster["lng"],
-                    "intensity": intensity,
-                    "applicant_count": cluster["count"],
-                    "avg_income": round(avg_income, 0),
-                    "avg_household_size": round(avg_household_size, 1)
-                })
-
-        # Calculate enhanced statistics
-        total_affordable_units = sum(p.get("affordable_units", 0) for p in projects.data or [])
-        total_units = sum(p.get("total_units", 0) for p in projects.data or [])
-        total_applicants = len(applicants.data) if applicants.data else 0
-        
-        # Gap analysis
-        supply_demand_ratio = total_affordable_units / max(total_applicants, 1)
-        
-        heatmap_data = {
-            "projects": enhanced_projects,
-            "demand_zones": demand_zones,
-            "statistics": {
-                "total_projects": len(projects.data) if projects.data else 0,
-                "total_applicants": total_applicants,
-                "total_units": total_units,
-                "total_affordable_units": total_affordable_units,
-                "supply_demand_ratio": round(supply_demand_ratio, 2),
-                "avg_affordability_ratio": round(total_affordable_units / max(total_units, 1), 2),
-                "data_type": data_type,
-                "bounds": bbox
-            },
-            "metadata": {
-                "generated_at": datetime.now().isoformat(),
-                "data_type": data_type,
-                "bounds": bbox,
-                "clustering_resolution": 0.01  # degrees
-            }
-        }
-        
-        return heatmap_data
+        return await heatmap_layers.get(layer, bbox, zoom)
         
     except Exception as e:
         logger.error(f"Error getting heatmap data: {e}")
         return {
-            "projects": [],
-            "demand_zones": [],
+            **{key: [] for key in HeatmapLayers.LAYER_KEYS[layer]},
             "statistics": {
                 "total_projects": 0,
                 "total_applicants": 0,
@@ -1111,16 +4587,85 @@ async def get_heatmap_data(
                 "total_affordable_units": 0,
                 "supply_demand_ratio": 0,
                 "avg_affordability_ratio": 0,
-                "data_type": data_type,
+                "data_type": layer,
                 "bounds": bbox
             },
             "metadata": {
                 "generated_at": datetime.now().isoformat(),
-                "data_type": data_type,
+                "data_type": layer,
                 "error": str(e)
             }
         }
 
+@app.get("/api/v1/analytics/heatmap/tiles/{z}/{x}/{y}")
+async def get_heatmap_tile(
+    z: int,
+    x: int,
+    y: int,
+    user=Depends(get_current_user)
+):
+    """Heatmap aggregates for one map tile (intensity is relative to the tile)"""
+    if user.get('role') not in ['lender', 'admin', 'developer', 'buyer']:
+        raise HTTPException(status_code=403, detail="Access denied")
+    if not heatmap_tiles.valid(z, x, y):
+        raise HTTPException(status_code=400, detail=f"Invalid tile (zoom 0-{heatmap_tiles.max_zoom})")
+    
+    try:
+        return await heatmap_tiles.get(z, x, y)
+    except Exception as e:
+        logger.error(f"Error getting heatmap tile {z}/{x}/{y}: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get heatmap tile")
+
+@app.post("/api/v1/admin/heatmap/tiles/precompute")
+async def precompute_heatmap_tiles(max_zoom: int = 8, user: dict = Depends(get_current_user)):
+    """Build every tile with applicants up to max_zoom in the background (admin only)"""
+    if user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    
+    queued = await heatmap_tiles.precompute(max_zoom)
+    return {"queued_tiles": queued, "max_zoom": max(0, min(max_zoom, heatmap_tiles.max_zoom))}
+
+@app.post("/api/v1/admin/heatmap/cells/reconcile")
+async def reconcile_heatmap_cells(user: dict = Depends(get_current_user)):
+    """Recompute the stored heatmap cells from applicant and project rows (admin only)"""
+    if user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Admin access required")
+    if not heatmap_cells.enabled:
+        raise HTTPException(status_code=409, detail="Heatmap cell aggregates are disabled (HEATMAP_CELL_AGGREGATES=false)")
+    
+    try:
+        cells = await heatmap_cells.reconcile()
+        return {"cells": cells, "reconciled_at": heatmap_cells.last_reconciled}
+    except Exception as e:
+        logger.error(f"Error reconciling heatmap cells: {e}")
+        raise HTTPException(status_code=500, detail="Failed to reconcile heatmap cells")
+
+@app.get("/api/v1/analytics/summary")
+async def get_analytics_summary(user=Depends(get_current_user)):
+    """Demand and supply totals for the user's company"""
+    if user.get('role') not in ['lender', 'admin', 'developer', 'buyer']:
+        raise HTTPException(status_code=403, detail="Access denied")
+    if not user.get('company_id'):
+        raise HTTPException(status_code=400, detail="User is not assigned to a company")
+    
+    try:
+        totals = await heatmap_cells.company_totals(user['company_id'])
+        applicants = totals["applicant_count"]
+        return {
+            "total_applicants": applicants,
+            "avg_income": round(float(totals["total_income"]) / applicants, 0) if applicants else 0,
+            "avg_household_size": round(float(totals["total_household_size"]) / applicants, 1) if applicants else 0,
+            "total_projects": totals["project_count"],
+            "total_units": totals["total_units"],
+            "total_affordable_units": totals["affordable_units"],
+            "supply_demand_ratio": round(totals["affordable_units"] / max(applicants, 1), 2),
+            "avg_affordability_ratio": round(totals["affordable_units"] / max(totals["total_units"], 1), 2),
+            "source": totals["source"]
+        }
+    except Exception as e:
+        logger.error(f"Error getting analytics summary: {e}")
+        raise HTTPException(status_code=500, detail="Failed to get analytics summary")
+
 @app.post("/api/v1/contact")
 @limiter.limit("3 per hour")  # Prevent contact form spam
 async def submit_contact_form(
@@ -1134,7 +4679,7 @@ async def submit_contact_form(
     """Submit contact form"""
     try:
         # Save to database
-        result = supabase.table('contact_submissions').insert({
+        result = await db.table('contact_submissions').insert({
             "name": name,
             "email": email,
             "company": company,
@@ -1160,7 +4705,7 @@ async def submit_contact_form(
                 """
                 
                 # Send notification to admin
-                resend.Emails.send({
+                await offloader.run("email", resend.Emails.send, {
                     "from": "HomeVerse <noreply@homeverse.io>",
                     "to": ["holdenbryce06@gmail.com"],
                     "subject": subject,
@@ -1168,7 +4713,7 @@ async def submit_contact_form(
                 })
                 
                 # Send auto-reply
-                resend.Emails.send({
+                await offloader.run("email", resend.Emails.send, {
                     "from": "HomeVerse <noreply@homeverse.io>",
                     "to": [email],
                     "subject": "Thank you for contacting HomeVerse",
@@ -1230,7 +4775,8 @@ async def update_me(
         allowed_fields = ['full_name', 'phone', 'timezone', 'language', 'notification_preferences']
         filtered_updates = {k: v for k, v in updates.items() if k in allowed_fields}
         
-        result = supabase.table('profiles').update(filtered_updates).eq('id', user['id']).execute()
+        result = await db.table('profiles').update(filtered_updates).eq('id', user['id']).execute()
+        principal_cache.invalidate(user['id'])
         
         return {"message": "Profile updated", "data": result.data}
     except Exception as e:
@@ -1247,16 +4793,9 @@ async def get_applicants(
 ):
     """Get all applicants for user's company"""
     try:
-        query = supabase.table('applicants').select('*').eq('company_id', user['company_id'])
-        
-        if search:
-            query = query.or_(f"full_name.ilike.%{search}%,email.ilike.%{search}%")
-        
-        query = query.range(skip, skip + limit - 1)
-        result = query.execute()
+        applicants = await repository.list_applicants(user['company_id'], skip, limit, search)
         
         # Decrypt PII fields and split full_name for compatibility
-        applicants = result.data
         for i, applicant in enumerate(applicants):
             # Decrypt PII fields
             applicants[i] = pii_encryption.decrypt_dict(applicant, PII_FIELDS['applicants'])
@@ -1307,17 +4846,21 @@ async def create_applicant(
         applicant_data.pop('first_name', None)
         applicant_data.pop('last_name', None)
         
-        result = supabase.table('applicants').insert(applicant_data).execute()
+        result = await db.table('applicants').insert(applicant_data).execute()
+        match_materializer.enqueue_applicant(result.data[0]['id'])
+        heatmap_tiles.invalidate_rows(result.data[0])
+        heatmap_layers.invalidate_rows('applicant', result.data[0])
+        heatmap_cells.record('applicant', new=result.data[0])
         
         # Log activity
-        supabase.table('activities').insert({
+        await activity_logger.log({
             'company_id': user['company_id'],
             'user_id': user['id'],
             'action': 'created_applicant',
             'resource_type': 'applicant',
             'resource_id': result.data[0]['id'],
             'details': {'applicant_name': f"{applicant.first_name} {applicant.last_name}"}
-        }).execute()
+        })
         
         return result.data[0]
     except Exception as e:
@@ -1331,7 +4874,7 @@ async def get_applicant(
 ):
     """Get specific applicant"""
     try:
-        result = supabase.table('applicants').select('*').eq('id', applicant_id).eq('company_id', user['company_id']).single().execute()
+        result = await db.table('applicants').select('*').eq('id', applicant_id).eq('company_id', user['company_id']).single().execute()
         
         if not result.data:
             raise HTTPException(status_code=404, detail="Applicant not found")
@@ -1359,7 +4902,7 @@ async def update_applicant(
     """Update applicant"""
     try:
         # Check applicant exists and belongs to company
-        existing = supabase.table('applicants').select('id').eq('id', applicant_id).eq('company_id', user['company_id']).single().execute()
+        existing = await db.table('applicants').select('id, company_id, latitude, longitude, income, household_size').eq('id', applicant_id).eq('company_id', user['company_id']).single().execute()
         
         if not existing.data:
             raise HTTPException(status_code=404, detail="Applicant not found")
@@ -1370,7 +4913,7 @@ async def update_applicant(
         # Handle name fields
         if 'first_name' in update_data or 'last_name' in update_data:
             # Get current applicant data to handle partial name updates
-            current = supabase.table('applicants').select('full_name').eq('id', applicant_id).single().execute()
+            current = await db.table('applicants').select('full_name').eq('id', applicant_id).single().execute()
             current_parts = current.data['full_name'].split(' ', 1) if current.data.get('full_name') else ['', '']
             
             first = update_data.pop('first_name', current_parts[0] if len(current_parts) > 0 else '').strip()
@@ -1386,17 +4929,22 @@ async def update_applicant(
         # Encrypt PII fields before updating
         update_data = pii_encryption.encrypt_dict(update_data, PII_FIELDS['applicants'])
         
-        result = supabase.table('applicants').update(update_data).eq('id', applicant_id).execute()
+        result = await db.table('applicants').update(update_data).eq('id', applicant_id).execute()
+        match_materializer.enqueue_applicant(applicant_id)
+        match_cache.invalidate_applicant(applicant_id)
+        heatmap_tiles.invalidate_rows(existing.data, result.data[0] if result.data else None)
+        heatmap_layers.invalidate_rows('applicant', existing.data, result.data[0] if result.data else None)
+        heatmap_cells.record('applicant', existing.data, result.data[0] if result.data else None)
         
         # Log activity
-        supabase.table('activities').insert({
+        await activity_logger.log({
             'company_id': user['company_id'],
             'user_id': user['id'],
             'action': 'updated_applicant',
             'resource_type': 'applicant',
             'resource_id': applicant_id,
             'details': {'updates': update_data}
-        }).execute()
+        })
         
         return result.data[0]
     except Exception as e:
@@ -1411,23 +4959,28 @@ async def delete_applicant(
     """Delete applicant"""
     try:
         # Check applicant exists and belongs to company
-        existing = supabase.table('applicants').select('full_name').eq('id', applicant_id).eq('company_id', user['company_id']).single().execute()
+        existing = await db.table('applicants').select('full_name, company_id, latitude, longitude, income, household_size').eq('id', applicant_id).eq('company_id', user['company_id']).single().execute()
         
         if not existing.data:
             raise HTTPException(status_code=404, detail="Applicant not found")
         
         # Delete applicant
-        supabase.table('applicants').delete().eq('id', applicant_id).execute()
+        await db.table('applicants').delete().eq('id', applicant_id).execute()
+        match_materializer.enqueue_applicant(applicant_id)
+        match_cache.invalidate_applicant(applicant_id)
+        heatmap_tiles.invalidate_rows(existing.data)
+        heatmap_layers.invalidate_rows('applicant', existing.data)
+        heatmap_cells.record('applicant', old=existing.data)
         
         # Log activity
-        supabase.table('activities').insert({
+        await activity_logger.log({
             'company_id': user['company_id'],
             'user_id': user['id'],
             'action': 'deleted_applicant',
             'resource_type': 'applicant',
             'resource_id': applicant_id,
             'details': {'applicant_name': existing.data.get('full_name')}
-        }).execute()
+        })
         
         return {"message": "Applicant deleted successfully"}
     except Exception as e:
@@ -1444,20 +4997,11 @@ async def get_projects(
 ):
     """Get all projects (public endpoint)"""
     try:
-        query = supabase.table('projects').select('*, companies(*)')
-        
-        if search:
-            query = query.or_(f"name.ilike.%{search}%,description.ilike.%{search}%,location.ilike.%{search}%")
-        
-        if status:
-            query = query.eq('status', status)
-        
-        query = query.range(skip, skip + limit - 1)
-        result = query.execute()
+        projects = await repository.list_projects(skip, limit, search, status)
         
         return {
-            "data": result.data,
-            "count": len(result.data),
+            "data": projects,
+            "count": len(projects),
             "skip": skip,
             "limit": limit
         }
@@ -1479,79 +5023,25 @@ async def create_project(
         project_data = project.dict(exclude_none=True)
         project_data['company_id'] = user['company_id']
         
-        result = supabase.table('projects').insert(project_data).execute()
+        result = await db.table('projects').insert(project_data).execute()
+        project_catalog.invalidate()
+        match_materializer.enqueue_project(result.data[0]['id'])
+        heatmap_tiles.invalidate_rows(result.data[0])
+        heatmap_layers.invalidate_rows('project', result.data[0])
+        heatmap_cells.record('project', new=result.data[0])
         
         # Log activity
-        supabase.table('activities').insert({
+        await activity_logger.log({
             'company_id': user['company_id'],
             'user_id': user['id'],
             'action': 'created_project',
             'resource_type': 'project',
             'resource_id': result.data[0]['id'],
             'details': {'project_name': project.name}
-        }).execute()
+        })
         
-        # Send email notification to matching applicants
-        try:
-            created_project = result.data[0]
-            
-            # Find applicants who might be interested in this project
-            # For now, we'll use a simple location-based matching (same city)
-            # In a full implementation, this would use the AI matching algorithm
-            matching_applicants = supabase.table('applicants').select(
-                'email, first_name, last_name, user_id'
-            ).eq('company_id', user['company_id']).eq('status', 'active').execute()
-            
-            for applicant in matching_applicants.data or []:
-                # Decrypt PII fields
-                decrypted_applicant = pii_encryption.decrypt_dict(applicant, PII_FIELDS['applicants'])
-                if decrypted_applicant.get('email'):
-                    subject = f"🏠 New Affordable Housing: {project.name}"
-                    html_content = f"""
-                    <div style="font-family: Arial, sans-serif; max-width: 600px; margin: 0 auto;">
-                        <h2 style="color: #0d9488;">New Affordable Housing Available!</h2>
-                        
-                        <div style="background: #f0fdfa; padding: 20px; border-radius: 8px; margin: 20px 0;">
-                            <h3 style="color: #0d9488; margin-top: 0;">Project Details</h3>
-                            <p><strong>Name:</strong> {project.name}</p>
-                            <p><strong>Location:</strong> {project.address}, {project.city}, {project.state}</p>
-                            <p><strong>Total Units:</strong> {project.total_units}</p>
-                            {f"<p><strong>Affordable Units:</strong> {project.affordable_units}</p>" if project.affordable_units else ""}
-                            {f"<p><strong>Description:</strong> {project.description}</p>" if project.description else ""}
-                        </div>
-                        
-                        <div style="background: #e0f2fe; padding: 15px; border-radius: 8px; margin: 20px 0;">
-                            <p style="margin: 0; color: #0277bd;">
-                                <strong>📅 Apply Now:</strong> This is a new opportunity that matches your housing preferences. 
-                                Applications are typically processed on a first-come, first-served basis.
-                            </p>
-                        </div>
-                        
-                        <div style="text-align: center; margin: 30px 0;">
-                            <a href="http://localhost:3000/dashboard/projects/{created_project['id']}" 
-                               style="background: #0d9488; color: white; padding: 12px 24px; text-decoration: none; border-radius: 6px; font-weight: bold;">
-                                View Project Details
-                            </a>
-                        </div>
-                        
-                        <p style="color: #64748b; font-size: 14px; margin-top: 30px;">
-                            This notification was sent because you're on our affordable housing waiting list.<br>
-                            You can update your housing preferences in your account settings.
-                        </p>
-                    </div>
-                    """
-                    
-                    await send_notification_email(
-                        to_email=decrypted_applicant['email'],
-                        subject=subject,
-                        html_content=html_content,
-                        notification_type='new_projects',
-                        user_id=decrypted_applicant.get('user_id')
-                    )
-                    
-        except Exception as e:
-            logger.warning(f"📧 Failed to send new project notification emails: {e}")
-            # Don't fail the project creation if email fails
+        # Email matching applicants from the background worker
+        project_notifier.enqueue(result.data[0], user['company_id'])
         
         return result.data[0]
     except Exception as e:
@@ -1562,7 +5052,7 @@ async def create_project(
 async def get_project(project_id: str):
     """Get specific project (public)"""
     try:
-        result = supabase.table('projects').select('*, companies(*)').eq('id', project_id).single().execute()
+        result = await db.table('projects').select('*, companies(*)').eq('id', project_id).single().execute()
         
         if not result.data:
             raise HTTPException(status_code=404, detail="Project not found")
@@ -1581,24 +5071,29 @@ async def update_project(
     """Update project"""
     try:
         # Check project exists and belongs to company
-        existing = supabase.table('projects').select('id').eq('id', project_id).eq('company_id', user['company_id']).single().execute()
+        existing = await db.table('projects').select('id, company_id, latitude, longitude, total_units, affordable_units').eq('id', project_id).eq('company_id', user['company_id']).single().execute()
         
         if not existing.data:
             raise HTTPException(status_code=404, detail="Project not found")
         
         # Update project
         update_data = {k: v for k, v in updates.dict().items() if v is not None}
-        result = supabase.table('projects').update(update_data).eq('id', project_id).execute()
+        result = await db.table('projects').update(update_data).eq('id', project_id).execute()
+        project_catalog.invalidate()
+        match_materializer.enqueue_project(project_id)
+        heatmap_tiles.invalidate_rows(existing.data, result.data[0] if result.data else None)
+        heatmap_layers.invalidate_rows('project', existing.data, result.data[0] if result.data else None)
+        heatmap_cells.record('project', existing.data, result.data[0] if result.data else None)
         
         # Log activity
-        supabase.table('activities').insert({
+        await activity_logger.log({
             'company_id': user['company_id'],
             'user_id': user['id'],
             'action': 'updated_project',
             'resource_type': 'project',
             'resource_id': project_id,
             'details': {'updates': update_data}
-        }).execute()
+        })
         
         return result.data[0]
     except Exception as e:
@@ -1611,7 +5106,7 @@ async def submit_contact(request: Request):
     """Submit contact form (public)"""
     try:
         # Save to database
-        result = supabase.table('contact_submissions').insert(contact.dict()).execute()
+        result = await db.table('contact_submissions').insert(contact.dict()).execute()
         
         # TODO: Send email notification
         # For now, just log it
@@ -1631,7 +5126,7 @@ async def get_activities(
 ):
     """Get company activities"""
     try:
-        result = supabase.table('activities').select('*, profiles(full_name)').eq('company_id', user['company_id']).order('created_at', desc=True).range(skip, skip + limit - 1).execute()
+        result = await db.table('activities').select('*, profiles(full_name)').eq('company_id', user['company_id']).order('created_at', desc=True).range(skip, skip + limit - 1).execute()
         
         return {
             "data": result.data,
@@ -1665,7 +5160,7 @@ async def upload_document(
         
         # Upload to Supabase Storage
         file_content = await file.read()
-        storage_response = supabase.storage.from_('applicant-documents').upload(unique_filename, file_content)
+        storage_response = await offloader.run("storage", supabase.storage.from_('applicant-documents').upload, unique_filename, file_content)
         
         if storage_response.error:
             raise HTTPException(status_code=400, detail="Upload failed")
@@ -1696,7 +5191,7 @@ async def upload_project_image(
     if user.get('role') not in ['developer', 'admin']:
         raise HTTPException(status_code=403, detail="Only developers and admins can upload project images")
     # Verify project exists and belongs to user's company
-    project = supabase.table('projects').select('*').eq('id', project_id).eq('company_id', user['company_id']).execute()
+    project = await db.table('projects').select('*').eq('id', project_id).eq('company_id', user['company_id']).execute()
     if not project.data:
         raise HTTPException(status_code=404, detail="Project not found")
     
@@ -1717,11 +5212,13 @@ async def upload_project_image(
         
         # Create bucket if it doesn't exist
         try:
-            supabase.storage.create_bucket('project-images', public=True)
+            await offloader.run("storage", supabase.storage.create_bucket, 'project-images', public=True)
         except:
             pass  # Bucket might already exist
         
-        result = supabase.storage.from_('project-images').upload(
+        result = await offloader.run(
+            "storage",
+            supabase.storage.from_('project-images').upload,
             unique_filename,
             file_content,
             file_options={"content-type": file.content_type}
@@ -1750,7 +5247,8 @@ async def upload_project_image(
         images.append(new_image)
         
         # Update project
-        supabase.table('projects').update({"images": images}).eq('id', project_id).execute()
+        await db.table('projects').update({"images": images}).eq('id', project_id).execute()
+        project_catalog.invalidate()
         
         return {
             "id": new_image['id'],
@@ -1767,7 +5265,7 @@ async def upload_project_image(
 async def get_project_images(project_id: str):
     """Get all images for a project (public)"""
     try:
-        project = supabase.table('projects').select('images').eq('id', project_id).execute()
+        project = await db.table('projects').select('images').eq('id', project_id).execute()
         if project.data:
             return project.data[0].get('images', [])
         return []
@@ -1787,7 +5285,7 @@ async def delete_project_image(
         raise HTTPException(status_code=403, detail="Only developers and admins can delete project images")
     try:
         # Verify project belongs to user's company
-        project = supabase.table('projects').select('*').eq('id', project_id).eq('company_id', user['company_id']).execute()
+        project = await db.table('projects').select('*').eq('id', project_id).eq('company_id', user['company_id']).execute()
         if not project.data:
             raise HTTPException(status_code=404, detail="Project not found")
         
@@ -1796,7 +5294,8 @@ async def delete_project_image(
         images = [img for img in images if img.get('id') != image_id]
         
         # Update project
-        supabase.table('projects').update({"images": images}).eq('id', project_id).execute()
+        await db.table('projects').update({"images": images}).eq('id', project_id).execute()
+        project_catalog.invalidate()
         
         return {"message": "Image deleted successfully"}
     except Exception as e:
@@ -1805,85 +5304,229 @@ async def delete_project_image(
 
 # Matching and Application Endpoints
 
+def parse_match_cursor(after_score: Optional[float], after_id: Optional[str]) -> Optional[tuple]:
+    """(score, id) of the previous page's last match, or None for the first page"""
+    if after_score is None and after_id is None:
+        return None
+    if after_score is None or not after_id:
+        raise HTTPException(status_code=400, detail="after_score and after_id must be given together")
+    # Both end up in a PostgREST filter string, so only accept a finite score and a UUID
+    try:
+        after_id = str(uuid.UUID(after_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="after_id must be a UUID")
+    if not math.isfinite(after_score):
+        raise HTTPException(status_code=400, detail="after_score must be a finite number")
+    return (after_score, after_id)
+
+def next_match_cursor(matches: List[Dict], limit: int, side: str) -> Optional[Dict[str, Any]]:
+    """Cursor for the page after `matches`, or None when this was the last page"""
+    if len(matches) < limit:
+        return None
+    last = matches[-1]
+    return {'after_score': last['match_score'], 'after_id': str(last[side]['id'])}
+
 @app.get("/api/v1/applicants/{applicant_id}/matches")
-async def get_applicant_matches(applicant_id: str, user: dict = Depends(get_current_user)):
-    """Get matched projects for an applicant"""
+async def get_applicant_matches(
+    applicant_id: str,
+    limit: int = 20,
+    after_score: Optional[float] = None,
+    after_id: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
+    """Get matched projects for an applicant (page through with next_cursor)"""
+    limit = min(max(limit, 1), 100)
+    after = parse_match_cursor(after_score, after_id)
     try:
+        # Repeat reads are served from memory until the applicant or a project changes
+        cache_key = await match_cache.key(applicant_id, (limit, after))
+        cached = match_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Served from the matches table when it holds the complete page
+        stored = await match_materializer.top_for_applicant(applicant_id, limit=limit, after=after)
+        if stored is not None:
+            matches = [{
+                'project': row['projects'],
+                'match_score': row['score'],
+                'recommendation': row['recommendation'],
+                'breakdown': row['factors']
+            } for row in stored]
+            response = {
+                'applicant_id': applicant_id,
+                'total_matches': len(await project_catalog.load()),
+                'matches': matches,
+                'next_cursor': next_match_cursor(matches, limit, 'project')
+            }
+            match_cache.set(cache_key, response)
+            return response
+        
         # Get applicant data
-        applicant = supabase.table('applicants').select('*').eq('id', applicant_id).single().execute()
-        if not applicant.data:
+        applicant = await repository.get_applicant(applicant_id)
+        if not applicant:
             raise HTTPException(status_code=404, detail="Applicant not found")
         
         # Decrypt PII fields
-        applicant.data = pii_encryption.decrypt_dict(applicant.data, PII_FIELDS['applicants'])
+        applicant = pii_encryption.decrypt_dict(applicant, PII_FIELDS['applicants'])
         
-        # Get all active projects
-        projects = supabase.table('projects').select('*').eq('status', 'active').execute()
-        
-        # Calculate matches
+        # Score active projects (nearby candidates first, via the spatial index),
+        # select the page's top K, then build breakdowns for those rows only
+        projects, top = await project_catalog.top_matches(applicant, limit=limit, after=after)
         matches = []
-        for project in projects.data or []:
-            match_info = calculate_match_score(applicant.data, project)
+        for i in top:
+            match_info = calculate_match_score(applicant, projects[i])
             matches.append({
-                'project': project,
+                'project': projects[i],
                 'match_score': match_info['match_percentage'],
                 'recommendation': match_info['recommendation'],
                 'breakdown': match_info['breakdown']
             })
         
-        # Sort by match score
-        matches.sort(key=lambda x: x['match_score'], reverse=True)
-        
-        return {
+        response = {
             'applicant_id': applicant_id,
-            'total_matches': len(matches),
-            'matches': matches[:20]  # Return top 20 matches
+            'total_matches': len(projects),
+            'matches': matches,
+            'next_cursor': next_match_cursor(matches, limit, 'project')
         }
+        match_cache.set(cache_key, response)
+        return response
     except Exception as e:
         logger.error(f"Error getting matches: {e}")
         raise HTTPException(status_code=500, detail="Failed to get matches")
 
 @app.get("/api/v1/projects/{project_id}/matches")
-async def get_project_matches(project_id: str, user: dict = Depends(get_current_user)):
-    """Get matched applicants for a project"""
+async def get_project_matches(
+    project_id: str,
+    limit: int = 50,
+    after_score: Optional[float] = None,
+    after_id: Optional[str] = None,
+    user: dict = Depends(get_current_user)
+):
+    """Get matched applicants for a project (page through with next_cursor)"""
     if user.get('role') not in ['developer', 'admin']:
         raise HTTPException(status_code=403, detail="Access denied")
+    limit = min(max(limit, 1), 100)
+    after = parse_match_cursor(after_score, after_id)
     
     try:
+        # Served from the matches table when it has rows for this project
+        stored = await match_materializer.top_for_project(
+            project_id, user['company_id'], limit=limit, min_score=50, after=after
+        )
+        if stored is not None:
+            rows, total = stored
+            matches = [{
+                'applicant': pii_encryption.decrypt_dict(row['applicants'], PII_FIELDS['applicants']),
+                'match_score': row['score'],
+                'recommendation': row['recommendation'],
+                'breakdown': row['factors']
+            } for row in rows]
+            return {
+                'project_id': project_id,
+                'total_matches': total,
+                'matches': matches,
+                'next_cursor': next_match_cursor(matches, limit, 'applicant')
+            }
+        
         # Get project data
-        project = supabase.table('projects').select('*').eq('id', project_id).single().execute()
-        if not project.data:
+        project = await repository.get_project(project_id)
+        if not project:
             raise HTTPException(status_code=404, detail="Project not found")
         
-        # Get all applicants
-        applicants = supabase.table('applicants').select('*').execute()
+        # Load only this company's applicants that can still reach 50, and only
+        # the columns the scorer reads
+        prefilter = matching_engine.applicant_prefilter(project, min_score=50)
+        candidates = await repository.list_match_candidates(user['company_id'], prefilter)
         
-        # Calculate matches
+        # Score them in one batch; only decent matches (>= 50) count, and only
+        # the page's top K are selected and broken down
+        batch = matching_engine.score_applicants(project, candidates)
+        top = batch.ranked(limit=limit, min_score=50, after=after)
+        
+        # Fetch full rows and decrypt PII for the page only
+        rows = await repository.get_applicants_by_ids([candidates[i]['id'] for i in top])
+        applicants = {row['id']: row for row in rows}
         matches = []
-        for applicant in applicants.data or []:
-            # Decrypt PII fields for each applicant
-            decrypted_applicant = pii_encryption.decrypt_dict(applicant, PII_FIELDS['applicants'])
-            match_info = calculate_match_score(decrypted_applicant, project.data)
+        for i in top:
+            if candidates[i]['id'] not in applicants:
+                continue  # deleted since it was scored
+            applicant = pii_encryption.decrypt_dict(applicants[candidates[i]['id']], PII_FIELDS['applicants'])
+            match_info = calculate_match_score(applicant, project)
             matches.append({
-                'applicant': decrypted_applicant,
+                'applicant': applicant,
                 'match_score': match_info['match_percentage'],
                 'recommendation': match_info['recommendation'],
                 'breakdown': match_info['breakdown']
             })
         
-        # Sort by match score and filter for good matches
-        matches.sort(key=lambda x: x['match_score'], reverse=True)
-        good_matches = [m for m in matches if m['match_score'] >= 50]  # Only show decent matches
-        
         return {
             'project_id': project_id,
-            'total_matches': len(good_matches),
-            'matches': good_matches[:50]  # Return top 50 matches
+            'total_matches': batch.count(min_score=50),
+            'matches': matches,
+            'next_cursor': next_match_cursor(matches, limit, 'applicant')
         }
     except Exception as e:
         logger.error(f"Error getting project matches: {e}")
         raise HTTPException(status_code=500, detail="Failed to get project matches")
 
+@app.post("/api/v1/admin/matches/rebuild")
+async def rebuild_matches(user: dict = Depends(get_current_user)):
+    """Recompute the matches table for every applicant (admin only)"""
+    if user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    if not match_materializer.enabled:
+        raise HTTPException(status_code=409, detail="Match materialization is disabled (MATCHES_MATERIALIZED=false)")
+    
+    try:
+        queued = await match_materializer.rebuild()
+        return {"queued": queued}
+    except Exception as e:
+        logger.error(f"Rebuild matches error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to queue match rebuild")
+
+@app.post("/api/v1/matches/bulk")
+async def start_bulk_match(request: BulkMatchRequest, user: dict = Depends(get_current_user)):
+    """Match every company applicant against every active project (developers and admins).
+    
+    output="stream" returns NDJSON as chunks finish; output="table" runs in
+    the background, writes the matches table and returns a job to poll.
+    """
+    if user.get('role') not in ['developer', 'admin']:
+        raise HTTPException(status_code=403, detail="Access denied")
+    if request.output not in ("stream", "table"):
+        raise HTTPException(status_code=400, detail="output must be 'stream' or 'table'")
+    if request.output == "table" and not match_materializer.enabled:
+        raise HTTPException(status_code=409, detail="Match materialization is disabled (MATCHES_MATERIALIZED=false)")
+    running = bulk_match_runner.running_job(user['company_id'])
+    if running:
+        raise HTTPException(status_code=409, detail=f"Bulk match job {running['id']} is already running")
+    
+    try:
+        applicants = await repository.list_match_candidates(user['company_id'], None)
+        projects = await project_catalog.load()
+    except Exception as e:
+        logger.error(f"Bulk match load error: {e}")
+        raise HTTPException(status_code=500, detail="Failed to load matching data")
+    
+    job = bulk_match_runner.create_job(user['company_id'], request.output, len(applicants))
+    if request.output == "table":
+        bulk_match_runner.start_table_job(job, applicants, projects)
+        return JSONResponse(status_code=202, content=job)
+    return StreamingResponse(
+        bulk_match_runner.stream(job, applicants, projects, limit=min(max(request.limit, 1), 100),
+                                 min_score=request.min_score),
+        media_type="application/x-ndjson"
+    )
+
+@app.get("/api/v1/matches/bulk/{job_id}")
+async def get_bulk_match_job(job_id: str, user: dict = Depends(get_current_user)):
+    """Progress of a bulk match job"""
+    job = bulk_match_runner.jobs.get(job_id)
+    if not job or job['company_id'] != user['company_id']:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
 # Application Management Endpoints
 
 @app.post("/api/v1/applications")
@@ -1891,7 +5534,7 @@ async def create_application(application: ApplicationCreate, user: dict = Depend
     """Create a new application"""
     try:
         # Get the project to determine which company owns it
-        project_data = supabase.table('projects').select('company_id').eq('id', application.project_id).single().execute()
+        project_data = await db.table('projects').select('company_id').eq('id', application.project_id).single().execute()
         if not project_data.data:
             raise HTTPException(status_code=404, detail="Project not found")
         
@@ -1910,23 +5553,23 @@ async def create_application(application: ApplicationCreate, user: dict = Depend
             'updated_at': datetime.now().isoformat()
         })
         
-        result = supabase.table('applications').insert(application_data).execute()
+        result = await db.table('applications').insert(application_data).execute()
         
         # Log activity - use project's company_id so developers can see this activity
-        supabase.table('activities').insert({
+        await activity_logger.log({
             'company_id': project_company_id,  # Use project's company_id
             'user_id': user['id'],
             'action': 'created_application',
             'resource_type': 'application',
             'resource_id': result.data[0]['id'],
             'details': {'project_id': application.project_id, 'applicant_id': application.applicant_id}
-        }).execute()
+        })
         
         # Send email notification to developers
         try:
             # Get project and applicant details for the email
-            project_data = supabase.table('projects').select('name, address, city, state').eq('id', application.project_id).single().execute()
-            applicant_data = supabase.table('applicants').select('first_name, last_name, email, phone').eq('id', application.applicant_id).single().execute()
+            project_data = await db.table('projects').select('name, address, city, state').eq('id', application.project_id).single().execute()
+            applicant_data = await db.table('applicants').select('first_name, last_name, email, phone').eq('id', application.applicant_id).single().execute()
             
             if project_data.data and applicant_data.data:
                 project = project_data.data
@@ -1934,7 +5577,7 @@ async def create_application(application: ApplicationCreate, user: dict = Depend
                 applicant = pii_encryption.decrypt_dict(applicant_data.data, PII_FIELDS['applicants'])
                 
                 # Find developers in the project's company to notify
-                developers = supabase.table('profiles').select('email, full_name').eq('company_id', project_company_id).eq('role', 'developer').execute()
+                developers = await db.table('profiles').select('email, full_name').eq('company_id', project_company_id).eq('role', 'developer').execute()
                 
                 for dev in developers.data or []:
                     if dev.get('email'):
@@ -1995,7 +5638,7 @@ async def get_applications(
 ):
     """Get applications with optional filtering"""
     try:
-        query = supabase.table('applications').select('*, projects(name), applicants(first_name, last_name)')
+        query = db.table('applications').select('*, projects(name), applicants(first_name, last_name)')
         
         if status:
             query = query.eq('status', status)
@@ -2014,7 +5657,7 @@ async def get_applications(
         elif user.get('role') not in ['admin', 'lender']:
             query = query.eq('company_id', user['company_id'])
         
-        result = query.order('created_at', desc=True).execute()
+        result = await query.order('created_at', desc=True).execute()
         return {"data": result.data or [], "count": len(result.data or [])}
     except Exception as e:
         logger.error(f"Get applications error: {str(e)}")
@@ -2033,7 +5676,7 @@ async def update_application(
     
     try:
         # Verify application exists
-        app = supabase.table('applications').select('*').eq('id', application_id).single().execute()
+        app = await db.table('applications').select('*').eq('id', application_id).single().execute()
         if not app.data:
             raise HTTPException(status_code=404, detail="Application not found")
         
@@ -2044,23 +5687,23 @@ async def update_application(
             'reviewed_at': datetime.now().isoformat()
         })
         
-        result = supabase.table('applications').update(update_dict).eq('id', application_id).execute()
+        result = await db.table('applications').update(update_dict).eq('id', application_id).execute()
         
         # Log activity
-        supabase.table('activities').insert({
+        await activity_logger.log({
             'company_id': user['company_id'],
             'user_id': user['id'],
             'action': 'updated_application',
             'resource_type': 'application',
             'resource_id': application_id,
             'details': {'status': update_data.status, 'notes': update_data.developer_notes}
-        }).execute()
+        })
         
         # Send email notification to applicant about status update
         try:
             if update_data.status:  # Only send email if status was actually updated
                 # Get full application details with project and applicant info
-                app_details = supabase.table('applications').select(
+                app_details = await db.table('applications').select(
                     '*, projects(name, address, city, state), applicants(first_name, last_name, email, user_id)'
                 ).eq('id', application_id).single().execute()
                 
@@ -2159,17 +5802,17 @@ async def create_investment(investment: InvestmentCreate, user: dict = Depends(g
             'updated_at': datetime.now().isoformat()
         })
         
-        result = supabase.table('investments').insert(investment_data).execute()
+        result = await db.table('investments').insert(investment_data).execute()
         
         # Log activity
-        supabase.table('activities').insert({
+        await activity_logger.log({
             'company_id': user['company_id'],
             'user_id': user['id'],
             'action': 'created_investment',
             'resource_type': 'investment',
             'resource_id': result.data[0]['id'],
             'details': {'project_id': investment.project_id, 'amount': investment.amount}
-        }).execute()
+        })
         
         return result.data[0]
     except Exception as e:
@@ -2184,7 +5827,7 @@ async def get_investments(
 ):
     """Get investments with optional filtering"""
     try:
-        query = supabase.table('investments').select('*, projects(name, total_units), profiles(full_name)')
+        query = db.table('investments').select('*, projects(name, total_units), profiles(full_name)')
         
         if project_id:
             query = query.eq('project_id', project_id)
@@ -2200,7 +5843,7 @@ async def get_investments(
         elif user.get('role') not in ['admin']:
             query = query.eq('company_id', user['company_id'])
         
-        result = query.order('created_at', desc=True).execute()
+        result = await query.order('created_at', desc=True).execute()
         return {"data": result.data or [], "count": len(result.data or [])}
     except Exception as e:
         logger.error(f"Get investments error: {str(e)}")
@@ -2215,7 +5858,7 @@ async def get_lender_portfolio(user: dict = Depends(get_current_user)):
     
     try:
         # Get all investments for this lender
-        investments = supabase.table('investments').select('*, projects(*)').eq('lender_id', user['id']).execute()
+        investments = await db.table('investments').select('*, projects(*)').eq('lender_id', user['id']).execute()
         
         portfolio_data = {
             'total_investments': len(investments.data or []),
@@ -2256,7 +5899,7 @@ async def export_portfolio(
     
     try:
         # Get portfolio data
-        investments = supabase.table('investments').select(
+        investments = await db.table('investments').select(
             '*, projects(name, address, city, state, total_units, affordable_units, status)'
         ).eq('lender_id', user['id']).execute()
         
@@ -2346,14 +5989,14 @@ async def export_investments(
         raise HTTPException(status_code=403, detail="Only lenders and admins can export investments")
     
     try:
-        query = supabase.table('investments').select(
+        query = db.table('investments').select(
             '*, projects(name, address, city, state, status, total_units, affordable_units)'
         ).eq('lender_id', user['id'])
         
         if status:
             query = query.eq('status', status)
             
-        investments = query.execute()
+        investments = await query.execute()
         
         if format.lower() == "csv":
             output = io.StringIO()
@@ -2433,7 +6076,7 @@ async def export_performance_report(
     
     try:
         # Get all investments with project data
-        investments = supabase.table('investments').select(
+        investments = await db.table('investments').select(
             '*, projects(name, address, city, state, status, total_units, affordable_units)'
         ).eq('lender_id', user['id']).execute()
         
@@ -2545,7 +6188,7 @@ async def debug_tables(user: dict = Depends(get_current_user)):
         table_info = {}
         
         for table in tables:
-            result = supabase.table(table).select('*').limit(1).execute()
+            result = await db.table(table).select('*').limit(1).execute()
             sample_data = result.data[0] if result.data else None
             
             # Decrypt PII fields for applicants table
@@ -2561,6 +6204,32 @@ async def debug_tables(user: dict = Depends(get_current_user)):
     except Exception as e:
         return {"error": str(e)}
 
+@app.get("/api/v1/debug/performance")
+async def debug_performance(user: dict = Depends(get_current_user)):
+    """Debug endpoint exposing in-process cache and auth counters"""
+    if user.get('role') != 'admin':
+        raise HTTPException(status_code=403, detail="Admin only")
+    
+    return {
+        "principal_cache": principal_cache.stats(),
+        "jwt_verifier": dict(jwt_verifier.stats),
+        "jwt_decode": jwt_decode_stats.snapshot(),
+        "auth_single_flight": auth_single_flight.stats(),
+        "profile_repair": dict(profile_repair_worker.stats),
+        "offload_pools": offloader.stats(),
+        "http_pools": http_pools.stats(),
+        "repository": repository.stats(),
+        "activity_log": activity_logger.snapshot(),
+        "project_catalog": project_catalog.snapshot(),
+        "match_materializer": match_materializer.snapshot(),
+        "match_cache": match_cache.stats(),
+        "bulk_matching": bulk_match_runner.snapshot(),
+        "project_notifications": project_notifier.snapshot(),
+        "heatmap_tiles": heatmap_tiles.snapshot(),
+        "heatmap_cells": heatmap_cells.snapshot(),
+        "heatmap_layers": heatmap_layers.snapshot()
+    }
+
 # Run the server
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "8000"))
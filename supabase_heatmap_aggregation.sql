@@ -0,0 +1,73 @@
+-- Server-side aggregation for GET /api/v1/analytics/heatmap
+-- Run this in Supabase SQL Editor. Until it is applied the backend logs a
+-- warning and aggregates in Python (or set HEATMAP_SQL_AGGREGATION=false).
+--
+-- heatmap_aggregates() returns demand zones (applicant count, total income
+-- and total household size per grid cell of `resolution` degrees) and the
+-- supply totals for the bounding box, so only aggregates leave the database.
+-- Applicants without coordinates (NULL or 0) count towards total_applicants
+-- but not towards any zone. Missing income counts as 0, missing household
+-- size as 1. Cells round half away from zero, so a coordinate exactly on a
+-- cell boundary can land one cell over from Python's round().
+
+-- Bounding-box filters on both tables
+CREATE INDEX IF NOT EXISTS idx_applicants_coordinates ON applicants (latitude, longitude);
+CREATE INDEX IF NOT EXISTS idx_projects_coordinates ON projects (latitude, longitude);
+
+CREATE OR REPLACE FUNCTION heatmap_aggregates(
+    lat1 DOUBLE PRECISION DEFAULT NULL,
+    lng1 DOUBLE PRECISION DEFAULT NULL,
+    lat2 DOUBLE PRECISION DEFAULT NULL,
+    lng2 DOUBLE PRECISION DEFAULT NULL,
+    resolution NUMERIC DEFAULT 0.01
+) RETURNS JSONB
+LANGUAGE sql STABLE
+AS $$
+    WITH bounded_applicants AS (
+        SELECT latitude, longitude, income, household_size
+        FROM applicants
+        WHERE lat1 IS NULL OR (
+            latitude >= lat1 AND latitude <= lat2
+            AND longitude >= lng1 AND longitude <= lng2)
+    ),
+    zones AS (
+        SELECT round(latitude::numeric / resolution) * resolution AS lat,
+               round(longitude::numeric / resolution) * resolution AS lng,
+               count(*) AS applicant_count,
+               sum(COALESCE(income, 0)) AS total_income,
+               sum(COALESCE(NULLIF(household_size, 0), 1)) AS total_household_size
+        FROM bounded_applicants
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+          AND latitude <> 0 AND longitude <> 0
+        GROUP BY 1, 2
+    ),
+    supply AS (
+        SELECT count(*) AS total_projects,
+               COALESCE(sum(total_units), 0) AS total_units,
+               COALESCE(sum(affordable_units), 0) AS total_affordable_units
+        FROM projects
+        WHERE lat1 IS NULL OR (
+            latitude >= lat1 AND latitude <= lat2
+            AND longitude >= lng1 AND longitude <= lng2)
+    )
+    SELECT jsonb_build_object(
+        'zones', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'lat', lat,
+                'lng', lng,
+                'applicant_count', applicant_count,
+                'total_income', total_income,
+                'total_household_size', total_household_size
+            ) ORDER BY lat, lng)
+            FROM zones
+        ), '[]'::jsonb),
+        'total_applicants', (SELECT count(*) FROM bounded_applicants),
+        'total_projects', supply.total_projects,
+        'total_units', supply.total_units,
+        'total_affordable_units', supply.total_affordable_units
+    )
+    FROM supply
+$$;
+
+-- Verify
+SELECT heatmap_aggregates(37.0, -123.0, 38.5, -121.5) -> 'total_applicants' AS applicants_in_bay_area;
@@ -0,0 +1,134 @@
+-- Running demand/supply totals per (company, H3 cell) for the heatmap and dashboards
+-- Run this in Supabase SQL Editor, then set HEATMAP_CELL_AGGREGATES=true.
+-- The backend fills the table with a full reconciliation at startup (or call
+-- POST /api/v1/admin/heatmap/cells/reconcile) and keeps it current as
+-- applicants and projects are written.
+--
+-- Cells are H3 indexes at HEATMAP_H3_BASE_RESOLUTION stored as bigint; cell 0
+-- holds rows without coordinates. Reconcile after changing the resolution.
+--
+-- Reconciliation runs reconcile_heatmap_cells(), which needs the h3 extension
+-- (h3-pg 4.x). Without it the backend logs a warning, recomputes the cells
+-- in Python and swaps them in with replace_heatmap_cells().
+
+CREATE TABLE IF NOT EXISTS heatmap_cells (
+    company_id UUID NOT NULL,
+    cell BIGINT NOT NULL,
+    latitude DOUBLE PRECISION,   -- cell centre, NULL for cell 0
+    longitude DOUBLE PRECISION,
+    applicant_count BIGINT NOT NULL DEFAULT 0,
+    total_income NUMERIC NOT NULL DEFAULT 0,
+    total_household_size BIGINT NOT NULL DEFAULT 0,
+    project_count BIGINT NOT NULL DEFAULT 0,
+    total_units BIGINT NOT NULL DEFAULT 0,
+    affordable_units BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (company_id, cell)
+);
+
+-- Bounding-box reads
+CREATE INDEX IF NOT EXISTS idx_heatmap_cells_coordinates ON heatmap_cells (latitude, longitude);
+
+-- Only the service role reads and writes cells
+ALTER TABLE heatmap_cells ENABLE ROW LEVEL SECURITY;
+
+-- Add signed deltas (one entry per company and cell) and drop cells that emptied out
+CREATE OR REPLACE FUNCTION apply_heatmap_cell_deltas(deltas JSONB) RETURNS VOID
+LANGUAGE sql VOLATILE
+AS $$
+    INSERT INTO heatmap_cells AS c (
+        company_id, cell, latitude, longitude, applicant_count, total_income,
+        total_household_size, project_count, total_units, affordable_units)
+    SELECT company_id, cell, latitude, longitude, applicant_count, total_income,
+           total_household_size, project_count, total_units, affordable_units
+    FROM jsonb_to_recordset(deltas) AS d(
+        company_id UUID, cell BIGINT, latitude DOUBLE PRECISION, longitude DOUBLE PRECISION,
+        applicant_count BIGINT, total_income NUMERIC, total_household_size BIGINT,
+        project_count BIGINT, total_units BIGINT, affordable_units BIGINT)
+    ON CONFLICT (company_id, cell) DO UPDATE SET
+        applicant_count = c.applicant_count + EXCLUDED.applicant_count,
+        total_income = c.total_income + EXCLUDED.total_income,
+        total_household_size = c.total_household_size + EXCLUDED.total_household_size,
+        project_count = c.project_count + EXCLUDED.project_count,
+        total_units = c.total_units + EXCLUDED.total_units,
+        affordable_units = c.affordable_units + EXCLUDED.affordable_units,
+        updated_at = NOW();
+
+    DELETE FROM heatmap_cells c
+    USING jsonb_to_recordset(deltas) AS d(company_id UUID, cell BIGINT)
+    WHERE c.company_id = d.company_id AND c.cell = d.cell
+      AND c.applicant_count = 0 AND c.project_count = 0;
+$$;
+
+-- Swap in a company's recomputed cells in one transaction (reconciliation)
+CREATE OR REPLACE FUNCTION replace_heatmap_cells(company UUID, cells JSONB) RETURNS VOID
+LANGUAGE sql VOLATILE
+AS $$
+    DELETE FROM heatmap_cells WHERE company_id = company;
+
+    INSERT INTO heatmap_cells (
+        company_id, cell, latitude, longitude, applicant_count, total_income,
+        total_household_size, project_count, total_units, affordable_units)
+    SELECT company, cell, latitude, longitude, applicant_count, total_income,
+           total_household_size, project_count, total_units, affordable_units
+    FROM jsonb_to_recordset(cells) AS d(
+        cell BIGINT, latitude DOUBLE PRECISION, longitude DOUBLE PRECISION,
+        applicant_count BIGINT, total_income NUMERIC, total_household_size BIGINT,
+        project_count BIGINT, total_units BIGINT, affordable_units BIGINT);
+$$;
+
+-- Recompute cells from the applicant and project rows (reconciliation);
+-- `only_companies` limits the pass to those companies, NULL means every one.
+-- plpgsql so the table and delta functions install without the h3 extension.
+CREATE OR REPLACE FUNCTION reconcile_heatmap_cells(
+    base_resolution INTEGER DEFAULT 9,
+    only_companies UUID[] DEFAULT NULL
+) RETURNS BIGINT
+LANGUAGE plpgsql VOLATILE
+AS $$
+DECLARE
+    written BIGINT;
+BEGIN
+    DELETE FROM heatmap_cells
+    WHERE only_companies IS NULL OR company_id = ANY(only_companies);
+
+    INSERT INTO heatmap_cells (
+        company_id, cell, latitude, longitude, applicant_count, total_income,
+        total_household_size, project_count, total_units, affordable_units)
+    SELECT company_id, cell,
+           CASE WHEN cell <> 0 THEN (h3_cell_to_lat_lng(cell::h3index))[1] END,
+           CASE WHEN cell <> 0 THEN (h3_cell_to_lat_lng(cell::h3index))[0] END,
+           sum(applicant_count), sum(total_income), sum(total_household_size),
+           sum(project_count), sum(total_units), sum(affordable_units)
+    FROM (
+        SELECT company_id, latitude, longitude,
+               1 AS applicant_count,
+               COALESCE(income, 0) AS total_income,
+               COALESCE(NULLIF(household_size, 0), 1) AS total_household_size,
+               0 AS project_count, 0 AS total_units, 0 AS affordable_units
+        FROM applicants
+        WHERE company_id IS NOT NULL
+          AND (only_companies IS NULL OR company_id = ANY(only_companies))
+        UNION ALL
+        SELECT company_id, latitude, longitude, 0, 0, 0,
+               1, COALESCE(total_units, 0), COALESCE(affordable_units, 0)
+        FROM projects
+        WHERE company_id IS NOT NULL
+          AND (only_companies IS NULL OR company_id = ANY(only_companies))
+    ) AS contributions,
+    LATERAL (
+        SELECT CASE
+            WHEN latitude IS NOT NULL AND longitude IS NOT NULL AND latitude <> 0 AND longitude <> 0
+            THEN h3_lat_lng_to_cell(point(longitude, latitude), base_resolution)::bigint
+            ELSE 0
+        END AS cell
+    ) AS located
+    GROUP BY company_id, cell;
+
+    GET DIAGNOSTICS written = ROW_COUNT;
+    RETURN written;
+END;
+$$;
+
+-- Verify
+SELECT count(*) AS cells, sum(applicant_count) AS applicants, sum(project_count) AS projects FROM heatmap_cells;
@@ -0,0 +1,131 @@
+-- H3 hexagon demand zones for GET /api/v1/analytics/heatmap and heatmap tiles
+-- Run this in Supabase SQL Editor after supabase_heatmap_aggregation.sql (it
+-- reuses the coordinate indexes). Needs the h3 extension (h3-pg 4.x). Until
+-- it is applied the backend logs a warning and bins in Python with the h3
+-- package, or falls back to the degree grid of heatmap_aggregates().
+--
+-- heatmap_hex_aggregates() bins one heatmap layer once at `base_resolution`:
+-- applicants for 'demand', projects for 'supply', both for 'gap'. It then
+-- rolls those cells up with h3_cell_to_parent() to the finest resolution
+-- (at most `resolution`) with no more than `max_zones` occupied cells. Zones
+-- carry the H3 index as a bigint (`cell`), the cell centre, and demand
+-- (applicant_count, total_income, total_household_size) and supply
+-- (project_count, total_units, affordable_units) counts; counts outside the
+-- layer are 0. Coordinate handling and the totals match heatmap_aggregates().
+
+CREATE EXTENSION IF NOT EXISTS h3;
+
+-- Earlier version without the layer argument
+DROP FUNCTION IF EXISTS heatmap_hex_aggregates(
+    DOUBLE PRECISION, DOUBLE PRECISION, DOUBLE PRECISION, DOUBLE PRECISION, INTEGER, INTEGER, INTEGER);
+
+CREATE OR REPLACE FUNCTION heatmap_hex_aggregates(
+    lat1 DOUBLE PRECISION DEFAULT NULL,
+    lng1 DOUBLE PRECISION DEFAULT NULL,
+    lat2 DOUBLE PRECISION DEFAULT NULL,
+    lng2 DOUBLE PRECISION DEFAULT NULL,
+    resolution INTEGER DEFAULT 9,
+    base_resolution INTEGER DEFAULT 9,
+    max_zones INTEGER DEFAULT 2000,
+    layer TEXT DEFAULT 'demand'
+) RETURNS JSONB
+LANGUAGE sql STABLE
+AS $$
+    WITH bounded_applicants AS (
+        SELECT latitude, longitude, income, household_size
+        FROM applicants
+        WHERE lat1 IS NULL OR (
+            latitude >= lat1 AND latitude <= lat2
+            AND longitude >= lng1 AND longitude <= lng2)
+    ),
+    bounded_projects AS (
+        SELECT latitude, longitude, total_units, affordable_units
+        FROM projects
+        WHERE lat1 IS NULL OR (
+            latitude >= lat1 AND latitude <= lat2
+            AND longitude >= lng1 AND longitude <= lng2)
+    ),
+    -- Finest cells, computed once from the layer's rows
+    layer_rows AS (
+        SELECT latitude, longitude,
+               1 AS applicant_count,
+               COALESCE(income, 0) AS total_income,
+               COALESCE(NULLIF(household_size, 0), 1) AS total_household_size,
+               0 AS project_count, 0 AS total_units, 0 AS affordable_units
+        FROM bounded_applicants
+        WHERE layer IN ('demand', 'gap')
+        UNION ALL
+        SELECT latitude, longitude, 0, 0, 0,
+               1, COALESCE(total_units, 0), COALESCE(affordable_units, 0)
+        FROM bounded_projects
+        WHERE layer IN ('supply', 'gap')
+    ),
+    base_cells AS (
+        SELECT h3_lat_lng_to_cell(point(longitude, latitude), base_resolution) AS cell,
+               sum(applicant_count) AS applicant_count,
+               sum(total_income) AS total_income,
+               sum(total_household_size) AS total_household_size,
+               sum(project_count) AS project_count,
+               sum(total_units) AS total_units,
+               sum(affordable_units) AS affordable_units
+        FROM layer_rows
+        WHERE latitude IS NOT NULL AND longitude IS NOT NULL
+          AND latitude <> 0 AND longitude <> 0
+        GROUP BY 1
+    ),
+    -- Occupied cells per candidate level, counted from the base cells
+    levels AS (
+        SELECT level, count(DISTINCT h3_cell_to_parent(cell, level)) AS zones
+        FROM base_cells, generate_series(0, LEAST(resolution, base_resolution)) AS level
+        GROUP BY level
+    ),
+    chosen AS (
+        SELECT COALESCE(
+            (SELECT max(level) FROM levels WHERE zones <= max_zones),
+            CASE WHEN EXISTS (SELECT 1 FROM base_cells) THEN 0
+                 ELSE GREATEST(LEAST(resolution, base_resolution), 0) END
+        ) AS level
+    ),
+    zones AS (
+        SELECT h3_cell_to_parent(cell, chosen.level) AS cell,
+               sum(applicant_count) AS applicant_count,
+               sum(total_income) AS total_income,
+               sum(total_household_size) AS total_household_size,
+               sum(project_count) AS project_count,
+               sum(total_units) AS total_units,
+               sum(affordable_units) AS affordable_units
+        FROM base_cells, chosen
+        GROUP BY 1
+    ),
+    supply AS (
+        SELECT count(*) AS total_projects,
+               COALESCE(sum(total_units), 0) AS total_units,
+               COALESCE(sum(affordable_units), 0) AS total_affordable_units
+        FROM bounded_projects
+    )
+    SELECT jsonb_build_object(
+        'zones', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'cell', cell::bigint,
+                'lat', (h3_cell_to_lat_lng(cell))[1],
+                'lng', (h3_cell_to_lat_lng(cell))[0],
+                'applicant_count', applicant_count,
+                'total_income', total_income,
+                'total_household_size', total_household_size,
+                'project_count', project_count,
+                'total_units', total_units,
+                'affordable_units', affordable_units
+            ) ORDER BY cell::bigint)
+            FROM zones
+        ), '[]'::jsonb),
+        'resolution', (SELECT level FROM chosen),
+        'total_applicants', (SELECT count(*) FROM bounded_applicants),
+        'total_projects', supply.total_projects,
+        'total_units', supply.total_units,
+        'total_affordable_units', supply.total_affordable_units
+    )
+    FROM supply
+$$;
+
+-- Verify
+SELECT heatmap_hex_aggregates(37.0, -123.0, 38.5, -121.5, 7, layer => 'gap') -> 'resolution' AS bay_area_resolution;
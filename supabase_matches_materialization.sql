@@ -0,0 +1,44 @@
+-- Materialized match scores for the /matches endpoints
+-- Run this in Supabase SQL Editor, then set MATCHES_MATERIALIZED=true and
+-- call POST /api/v1/admin/matches/rebuild once to populate the table.
+--
+-- The backend stores one row per (applicant, active project) pair scoring at
+-- least MATCH_MATERIALIZE_MIN_SCORE and keeps it current as applicants and
+-- projects are written.
+
+-- New columns: recommendation text and the stamp of the recompute that wrote the row
+ALTER TABLE matches ADD COLUMN IF NOT EXISTS recommendation TEXT;
+ALTER TABLE matches ADD COLUMN IF NOT EXISTS computed_at TIMESTAMPTZ DEFAULT NOW();
+
+-- The updated_at of the applicant and project a pair was scored from. Reads
+-- compare them with the current records, so a write accepted by any worker
+-- stops stale pairs being served. Rows written before these columns existed
+-- never match: call POST /api/v1/admin/matches/rebuild after adding them.
+ALTER TABLE matches ADD COLUMN IF NOT EXISTS applicant_updated_at TIMESTAMPTZ;
+ALTER TABLE matches ADD COLUMN IF NOT EXISTS project_updated_at TIMESTAMPTZ;
+
+-- Keep only the newest row per pair before adding the unique constraint
+DELETE FROM matches a
+USING matches b
+WHERE a.applicant_id = b.applicant_id
+  AND a.project_id = b.project_id
+  AND (a.created_at, a.id) < (b.created_at, b.id);
+
+-- Upserts target (applicant_id, project_id)
+ALTER TABLE matches DROP CONSTRAINT IF EXISTS matches_applicant_project_key;
+ALTER TABLE matches ADD CONSTRAINT matches_applicant_project_key UNIQUE (applicant_id, project_id);
+
+-- Deleting an applicant or project removes its stored matches
+ALTER TABLE matches DROP CONSTRAINT IF EXISTS matches_applicant_id_fkey;
+ALTER TABLE matches ADD CONSTRAINT matches_applicant_id_fkey
+    FOREIGN KEY (applicant_id) REFERENCES applicants(id) ON DELETE CASCADE;
+ALTER TABLE matches DROP CONSTRAINT IF EXISTS matches_project_id_fkey;
+ALTER TABLE matches ADD CONSTRAINT matches_project_id_fkey
+    FOREIGN KEY (project_id) REFERENCES projects(id) ON DELETE CASCADE;
+
+-- Top-N reads: ORDER BY score DESC per applicant / per project
+CREATE INDEX IF NOT EXISTS idx_matches_applicant_score ON matches (applicant_id, score DESC, project_id);
+CREATE INDEX IF NOT EXISTS idx_matches_project_score ON matches (project_id, score DESC, applicant_id);
+
+-- Verify
+SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'matches';
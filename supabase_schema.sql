@@ -105,14 +105,21 @@ CREATE TABLE contact_submissions (
 CREATE TABLE matches (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     company_id UUID REFERENCES companies(id),
-    applicant_id UUID REFERENCES applicants(id),
-    project_id UUID REFERENCES projects(id),
+    applicant_id UUID REFERENCES applicants(id) ON DELETE CASCADE,
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
     score NUMERIC NOT NULL,
     factors JSONB DEFAULT '{}',
+    recommendation TEXT,
     status TEXT DEFAULT 'pending',
-    created_at TIMESTAMPTZ DEFAULT NOW()
+    computed_at TIMESTAMPTZ DEFAULT NOW(),
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    CONSTRAINT matches_applicant_project_key UNIQUE (applicant_id, project_id)
 );
 
+-- Top-N match reads per applicant / per project
+CREATE INDEX idx_matches_applicant_score ON matches (applicant_id, score DESC, project_id);
+CREATE INDEX idx_matches_project_score ON matches (project_id, score DESC, applicant_id);
+
 -- Enable RLS on matches
 ALTER TABLE matches ENABLE ROW LEVEL SECURITY;
 